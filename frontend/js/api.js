@@ -1,10 +1,108 @@
 // Конфигурация API
 const API_BASE_URL = 'http://localhost:8000';
+const WS_BASE_URL = API_BASE_URL.replace(/^http/, 'ws');
 
 class LearningCompanionAPI {
     constructor() {
         this.userId = this.getOrCreateUserId();
         this.sessionId = this.generateSessionId();
+
+        // WebSocket-канал диалога: запросы по request_id, который сервер возвращает
+        // во всех кадрах ответа
+        this.socket = null;
+        this.pending = new Map();
+        this.requestCounter = 0;
+        this.reconnectDelay = 1000;
+        this.onProblemReady = null;
+    }
+
+    nextRequestId() {
+        this.requestCounter += 1;
+        return `${this.sessionId}-${this.requestCounter}`;
+    }
+
+    // Подключение к /ws/chat; при обрыве - переподключение с нарастающей паузой
+    connectChat() {
+        const url = `${WS_BASE_URL}/ws/chat?user_id=${encodeURIComponent(this.userId)}&session_id=${encodeURIComponent(this.sessionId)}`;
+        const socket = new WebSocket(url);
+
+        socket.onopen = () => {
+            this.reconnectDelay = 1000;
+        };
+
+        socket.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            const current = data.request_id ? this.pending.get(data.request_id) : undefined;
+
+            switch (data.type) {
+                case 'accepted':
+                    // Сервер принял запрос в обработку - повторно его отправлять нельзя
+                    if (current) current.accepted = true;
+                    break;
+                case 'token':
+                    if (current && current.onToken) current.onToken(data.text);
+                    break;
+                case 'reset':
+                    // Попытка генерации оборвалась - показанный текст недействителен
+                    if (current && current.onReset) current.onReset();
+                    break;
+                case 'response':
+                    if (current) {
+                        this.pending.delete(data.request_id);
+                        current.resolve(data);
+                    }
+                    break;
+                case 'problem_ready':
+                    // Своя задача - запросившему, задачи из других вкладок - в onProblemReady
+                    if (current) {
+                        this.pending.delete(data.request_id);
+                        current.resolve(data);
+                    } else if (this.onProblemReady) {
+                        this.onProblemReady(data);
+                    }
+                    break;
+                case 'error':
+                    if (current) {
+                        this.pending.delete(data.request_id);
+                        current.reject(new Error(data.detail || 'Ошибка обработки запроса'));
+                    } else {
+                        console.error('WebSocket error:', data.detail);
+                    }
+                    break;
+            }
+        };
+
+        socket.onclose = () => {
+            this.socket = null;
+            // Непринятые сервером сообщения переотправляем через HTTP; принятые могли быть
+            // уже обработаны - повтор дал бы второй ответ, поэтому они завершаются ошибкой
+            const pending = Array.from(this.pending.values());
+            this.pending.clear();
+            pending.forEach((item) => {
+                if (!item.accepted && item.retry) {
+                    item.retry().then(item.resolve, item.reject);
+                } else {
+                    item.reject(new Error('Соединение с сервером прервано до получения ответа'));
+                }
+            });
+            setTimeout(() => this.connectChat(), this.reconnectDelay);
+            this.reconnectDelay = Math.min(this.reconnectDelay * 2, 30000);
+        };
+
+        this.socket = socket;
+    }
+
+    // Отправка запроса по WebSocket; ответ - по request_id
+    sendFrame(frame, item) {
+        const requestId = this.nextRequestId();
+        return new Promise((resolve, reject) => {
+            this.pending.set(requestId, { ...item, resolve, reject, accepted: false });
+            this.socket.send(JSON.stringify({ ...frame, request_id: requestId }));
+        });
+    }
+
+    isChatConnected() {
+        return this.socket !== null && this.socket.readyState === WebSocket.OPEN;
     }
 
     // Генерация ID пользователя и сессии
@@ -52,8 +150,19 @@ class LearningCompanionAPI {
         }
     }
 
-    // Отправка сообщения ассистенту
-    async sendMessage(message) {
+    // Отправка сообщения ассистенту (через WebSocket, если он подключен)
+    async sendMessage(message, handlers = {}) {
+        if (!this.isChatConnected()) {
+            return this.sendMessageHttp(message);
+        }
+
+        return this.sendFrame(
+            { type: 'message', message: message },
+            { ...handlers, retry: () => this.sendMessageHttp(message) }
+        );
+    }
+
+    async sendMessageHttp(message) {
         return this.makeRequest('/chat', {
             method: 'POST',
             body: JSON.stringify({
@@ -64,6 +173,17 @@ class LearningCompanionAPI {
         });
     }
 
+    // Открытие сессии: сервер заранее подгружает прогресс и память пользователя
+    async startSession() {
+        return this.makeRequest('/session/start', {
+            method: 'POST',
+            body: JSON.stringify({
+                user_id: this.userId,
+                session_id: this.sessionId
+            })
+        });
+    }
+
     // Получение аналитики обучения
     async getAnalytics() {
         return this.makeRequest(`/analytics/${this.userId}`);
@@ -76,11 +196,29 @@ class LearningCompanionAPI {
             body: JSON.stringify({
                 topic: topic,
                 problem_type: problemType,
-                difficulty: difficulty
+                difficulty: difficulty,
+                user_id: this.userId
             })
         });
     }
 
+    // Запрос задачи через WebSocket: промис с кадром problem_ready.
+    // Возвращает null, если канал не подключен
+    requestProblem(topic, problemType = 'theoretical', difficulty = 'easy') {
+        if (!this.isChatConnected()) {
+            return null;
+        }
+        return this.sendFrame(
+            {
+                type: 'generate_problem',
+                topic: topic,
+                problem_type: problemType,
+                difficulty: difficulty
+            },
+            { retry: () => this.generateProblem(topic, problemType, difficulty) }
+        );
+    }
+
     // Проверка здоровья сервиса
     async healthCheck() {
         return this.makeRequest('/health');
@@ -10,6 +10,14 @@ class LearningCompanionApp {
         try {
             // Проверяем доступность API
             await api.healthCheck();
+
+            // Прогрев сессии до первого сообщения - в фоне, интерфейс его не ждет;
+            // без него диалог тоже работает
+            api.startSession().catch((error) => console.warn('Session warm-up failed:', error));
+
+            // Открываем WebSocket-канал диалога (без него сообщения идут через POST /chat)
+            api.onProblemReady = (data) => this.uiManager.showProblem(data);
+            api.connectChat();
             
             // Обновляем UI с начальными данными
             this.updateInitialUI();
@@ -74,9 +74,31 @@ class UIManager {
         // Показываем индикатор загрузки
         this.showLoading();
 
+        // Ответ по WebSocket приходит фрагментами - показываем его по мере генерации
+        let streamingElement = null;
+        let streamedText = '';
+        const onToken = (text) => {
+            if (!streamingElement) {
+                this.hideLoading();
+                streamingElement = this.addMessage('', 'ai');
+            }
+            streamedText += text;
+            streamingElement.querySelector('.message-content').textContent = streamedText;
+            this.scrollToBottom();
+        };
+        const onReset = () => {
+            streamedText = '';
+            if (streamingElement) {
+                streamingElement.querySelector('.message-content').textContent = '';
+            }
+        };
+
         try {
             // Отправляем сообщение на сервер
-            const response = await api.sendMessage(message);
+            const response = await api.sendMessage(message, { onToken, onReset });
+            if (streamingElement) {
+                streamingElement.remove();
+            }
             
             // Добавляем ответ ассистента
             this.addMessage(response.response, 'ai', {
@@ -90,6 +112,9 @@ class UIManager {
             this.updateUI(response);
 
         } catch (error) {
+            if (streamingElement) {
+                streamingElement.remove();
+            }
             this.addMessage('Извините, произошла ошибка при обработке вашего сообщения. Пожалуйста, попробуйте еще раз.', 'ai');
             console.error('Error sending message:', error);
         } finally {
@@ -121,6 +146,8 @@ class UIManager {
         if (welcomeMessage) {
             welcomeMessage.remove();
         }
+
+        return messageElement;
     }
 
     // Форматирование содержимого сообщения
@@ -175,7 +202,9 @@ class UIManager {
         this.showLoading();
 
         try {
-            const response = await api.generateProblem(topic, 'practical', 'medium');
+            // По WebSocket, если канал подключен, иначе через POST /generate_problem
+            const request = api.requestProblem(topic, 'practical', 'medium');
+            const response = request ? await request : await api.generateProblem(topic, 'practical', 'medium');
             this.addMessage(response.problem.problem_statement, 'ai', {
                 learning_mode: 'problem_solving',
                 current_topic: topic
@@ -188,6 +217,14 @@ class UIManager {
         }
     }
 
+    // Задача, запрошенная в другой вкладке и присланная сервером по WebSocket
+    showProblem(data) {
+        this.addMessage(data.problem.problem_statement, 'ai', {
+            learning_mode: 'problem_solving',
+            current_topic: data.topic
+        });
+    }
+
     // Показать аналитику
     async showAnalytics() {
         try {
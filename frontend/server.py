@@ -1,11 +1,147 @@
 import http.server
-import socketserver
+import email.utils
+import threading
+import hashlib
+import gzip
+import mimetypes
+import time
+import urllib.parse
+import re
 import os
 
-class Handler(http.server.SimpleHTTPRequestHandler):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, directory=os.path.dirname(__file__), **kwargs)
-    
+try:
+    import brotli  # опционально: pip install brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PORT = int(os.getenv("FRONTEND_PORT", "3000"))
+
+# Сжимаем только текст и только если выигрыш заметен
+COMPRESSIBLE = {"text/html", "text/css", "application/javascript", "text/javascript",
+                "application/json", "image/svg+xml", "text/plain"}
+MIN_COMPRESS_SIZE = 512
+
+# Файлы с хэшем содержимого в имени (style.3f2a1b9c.css) не меняются - кэшируем навсегда
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+class Asset:
+    """Файл в памяти: исходные байты, заранее сжатые варианты и валидаторы кэша"""
+
+    def __init__(self, path, body, mtime):
+        self.path = path
+        self.body = body
+        self.mtime = mtime
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/") or self.content_type == "application/javascript":
+            self.content_type += "; charset=utf-8"
+        self.hash = hashlib.sha1(body).hexdigest()
+        self.etag = f'"{self.hash[:16]}"'
+        self.last_modified = email.utils.formatdate(mtime, usegmt=True)
+
+        self.encoded = {}
+        if self.content_type.split(";")[0] in COMPRESSIBLE and len(body) >= MIN_COMPRESS_SIZE:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.encoded["gzip"] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.encoded["br"] = compressed
+
+    def fingerprinted_path(self):
+        stem, ext = os.path.splitext(self.path)
+        return f"{stem}.{self.hash[:8]}{ext}"
+
+class StaticAssets:
+    """Снимок каталога фронтенда. Пересобирается, если файлы изменились на диске,
+    поэтому правки видны без перезапуска и в режиме разработки"""
+
+    def __init__(self, root, check_interval=1.0):
+        self.root = root
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._signature = None
+        self._checked_at = 0.0
+        self.assets = {}
+        self.fingerprinted = {}
+        self.refresh(force=True)
+
+    def _scan(self):
+        files = {}
+        for directory, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith((".", "__"))]
+            for filename in filenames:
+                if filename.startswith(".") or filename.endswith((".py", ".pyc")):
+                    continue
+                full_path = os.path.join(directory, filename)
+                relative = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                stat = os.stat(full_path)
+                files[relative] = (full_path, stat.st_mtime, stat.st_size)
+        return files
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            files = self._scan()
+            signature = sorted((path, mtime, size) for path, (_, mtime, size) in files.items())
+            if signature == self._signature:
+                return
+
+            assets = {}
+            for relative, (full_path, mtime, _) in files.items():
+                with open(full_path, "rb") as f:
+                    assets[relative] = Asset(relative, f.read(), mtime)
+
+            fingerprinted = {
+                asset.fingerprinted_path(): asset
+                for path, asset in assets.items() if not path.endswith(".html")
+            }
+            # HTML ссылается на версии с хэшем, поэтому сам HTML кэшируется с ревалидацией
+            for path, asset in list(assets.items()):
+                if path.endswith(".html"):
+                    assets[path] = self._rewrite_html(asset, assets)
+
+            self.assets, self.fingerprinted = assets, fingerprinted
+            self._signature = signature
+
+    @staticmethod
+    def _rewrite_html(asset, assets):
+        base = os.path.dirname(asset.path)
+        text = asset.body.decode("utf-8")
+
+        def replace(match):
+            attribute, url = match.group(1), match.group(2)
+            target = os.path.normpath(os.path.join(base, url)).replace(os.sep, "/")
+            if "://" in url or url.startswith("//") or target not in assets:
+                return match.group(0)
+            fingerprinted = os.path.relpath(assets[target].fingerprinted_path(), base or ".").replace(os.sep, "/")
+            return f'{attribute}="{fingerprinted}"'
+
+        text = re.sub(r'\b(src|href)="([^"?#]+)"', replace, text)
+        # Содержимое меняется вместе с подключаемыми файлами - и дата изменения тоже
+        return Asset(asset.path, text.encode("utf-8"), max(a.mtime for a in assets.values()))
+
+    def lookup(self, path):
+        """(файл, неизменяемый ли URL)"""
+        self.refresh()
+        path = path.lstrip("/") or "index.html"
+        if path.endswith("/"):
+            path += "index.html"
+        if path in self.fingerprinted:
+            return self.fingerprinted[path], True
+        return self.assets.get(path), False
+
+ASSETS = StaticAssets(ROOT)
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "LearningAssistantStatic/1.0"
+
     def end_headers(self):
         # Добавляем CORS headers
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -13,8 +149,142 @@ class Handler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', '*')
         super().end_headers()
 
-PORT = 3000
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def _serve(self, head):
+        path = urllib.parse.unquote(self.path.split("?", 1)[0].split("#", 1)[0])
+        asset, immutable = ASSETS.lookup(path)
+        if asset is None:
+            self._send_simple(404, b"Not Found")
+            return
+
+        cache_control = IMMUTABLE if immutable else REVALIDATE
+        if self._not_modified(asset):
+            self.send_response(304)
+            self._validators(asset, cache_control)
+            self.end_headers()
+            return
+
+        byte_range = self._requested_range(asset)
+        if byte_range == "invalid":
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(asset.body)}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if byte_range is not None:
+            # Диапазоны отдаем только от несжатого представления
+            start, end = byte_range
+            body = asset.body[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(asset.body)}")
+        else:
+            encoding = self._negotiate_encoding(asset)
+            body = asset.encoded[encoding] if encoding else asset.body
+            self.send_response(200)
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+
+        self.send_header("Content-Type", asset.content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Vary", "Accept-Encoding")
+        self._validators(asset, cache_control)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def _validators(self, asset, cache_control):
+        self.send_header("ETag", asset.etag)
+        self.send_header("Last-Modified", asset.last_modified)
+        self.send_header("Cache-Control", cache_control)
+
+    def _not_modified(self, asset):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or any(tag.replace("W/", "", 1) == asset.etag for tag in tags)
+
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(asset.mtime) <= since
+        return False
+
+    def _requested_range(self, asset):
+        """(start, end) включительно, None - весь файл, "invalid" - 416"""
+        header = self.headers.get("Range")
+        if not header or not header.startswith("bytes="):
+            return None
+        # If-Range: диапазон только для той же версии файла, иначе - весь файл
+        if_range = self.headers.get("If-Range")
+        if if_range and if_range != asset.etag and if_range != asset.last_modified:
+            return None
+
+        spec = header[len("bytes="):].strip()
+        if "," in spec:
+            # Несколько диапазонов (multipart/byteranges) не поддерживаем - отдаем целиком
+            return None
+        size = len(asset.body)
+        start, _, end = spec.partition("-")
+        try:
+            if start == "":
+                length = int(end)
+                if length <= 0:
+                    return "invalid"
+                return max(size - length, 0), size - 1
+            start = int(start)
+            end = int(end) if end else size - 1
+        except ValueError:
+            return None
+        if start >= size or start > end:
+            return "invalid"
+        return start, min(end, size - 1)
+
+    def _negotiate_encoding(self, asset):
+        accepted = {}
+        for part in self.headers.get("Accept-Encoding", "").split(","):
+            name, _, params = part.strip().partition(";")
+            quality = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    quality = 0.0
+            if name:
+                accepted[name.lower()] = quality
+        for encoding in ("br", "gzip"):
+            if encoding in asset.encoded and accepted.get(encoding, 0) > 0:
+                return encoding
+        return None
+
+    def _send_simple(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # Очередь соединений под всплески, когда класс открывает страницу одновременно
+    request_queue_size = 128
 
-with socketserver.TCPServer(("", PORT), Handler) as httpd:
-    print(f"Frontend server running at http://localhost:{PORT}")
-    httpd.serve_forever()
\ No newline at end of file
+if __name__ == "__main__":
+    with Server(("", PORT), Handler) as httpd:
+        print(f"Frontend server running at http://localhost:{PORT} "
+              f"(сжатие: gzip{', br' if brotli else ''})")
+        httpd.serve_forever()
@@ -0,0 +1,470 @@
+from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+import subprocess
+import threading
+import inspect
+import signal
+import tempfile
+import json
+import ast
+import os
+import sys
+import re
+import logging
+
+try:
+    import pwd
+except ImportError:  # Windows
+    pwd = None
+
+logger = logging.getLogger(__name__)
+
+# Длина текста ошибки и значения, попадающего в отчет (промпт LLM и ответ пользователю)
+MAX_ERROR_CHARS = 200
+MAX_VALUE_CHARS = 200
+# Модули, которые решение может импортировать: после фильтра seccomp файлы не открываются
+PRELOADED_MODULES = (
+    "math", "cmath", "random", "re", "string", "collections", "itertools", "functools",
+    "operator", "heapq", "bisect", "statistics", "fractions", "decimal", "datetime",
+    "typing", "dataclasses", "copy", "enum", "array", "textwrap"
+)
+
+class SandboxUnavailable(RuntimeError):
+    """Изоляция процесса решения недоступна - тесты не запускаются"""
+
+def _encode_value(value, depth=0):
+    """Значение встроенного типа -> данные JSON с тегом типа.
+
+    Типы проверяются точно (type(x) is int): подкласс со своим __eq__ или __repr__
+    не пройдет. Эта же функция кодирует ожидаемое значение в родительском процессе.
+    """
+    if depth > 20:
+        raise ValueError("слишком глубокая вложенность")
+    kind = type(value)
+    if value is None:
+        return ["none"]
+    if kind is bool:
+        return ["bool", value]
+    if kind is int or kind is float:
+        return ["num", value]
+    if kind is complex:
+        return ["complex", value.real, value.imag]
+    if kind is str:
+        return ["str", value]
+    if kind is bytes:
+        return ["bytes", value.hex()]
+    if kind in (list, tuple, set, frozenset, dict) and len(value) > 10000:
+        raise ValueError("слишком большая коллекция")
+    if kind is list or kind is tuple:
+        return [kind.__name__, [_encode_value(item, depth + 1) for item in value]]
+    if kind is set or kind is frozenset:
+        items = [_encode_value(item, depth + 1) for item in value]
+        return [kind.__name__, sorted(items, key=lambda item: json.dumps(item))]
+    if kind is dict:
+        items = [[_encode_value(k, depth + 1), _encode_value(v, depth + 1)] for k, v in value.items()]
+        return ["dict", sorted(items, key=lambda item: json.dumps(item[0]))]
+    raise TypeError(f"неподдерживаемый тип результата: {kind.__name__}")
+
+def _decode_value(encoded):
+    """Обратное преобразование для показа полученного значения в отчете"""
+    tag = encoded[0]
+    if tag == "none":
+        return None
+    if tag in ("bool", "num", "str"):
+        return encoded[1]
+    if tag == "complex":
+        return complex(encoded[1], encoded[2])
+    if tag == "bytes":
+        return bytes.fromhex(encoded[1])
+    if tag == "dict":
+        return {_freeze(_decode_value(k)): _decode_value(v) for k, v in encoded[1]}
+    items = [_decode_value(item) for item in encoded[1]]
+    if tag == "list":
+        return items
+    if tag == "tuple":
+        return tuple(items)
+    items = [_freeze(item) for item in items]
+    return set(items) if tag == "set" else frozenset(items)
+
+def _freeze(value):
+    # Ключи словаря и элементы множества из JSON - снова хэшируемые
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+def _sanitize(text: Any, limit: int = MAX_ERROR_CHARS) -> str:
+    """Текст из процесса решения: одна строка без управляющих символов, не длиннее limit"""
+    text = re.sub(r"[\x00-\x1f\x7f-\x9f\u2028\u2029]+", " ", str(text))
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
+def _error_text(error_type: Any, message: Any) -> str:
+    name = str(error_type)
+    if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]{0,59}", name):
+        name = "Exception"
+    message = _sanitize(message)
+    return f"{name}: {message}" if message else name
+
+# Скрипт-обвязка, исполняемый в отдельном процессе. До кода пользователя выставляются
+# лимиты ресурсов и фильтр seccomp: нет сети (в том числе через _socket), открытия файлов
+# (/proc, исходники сервиса), запуска программ, ptrace и новых процессов. Ожидаемые
+# значения в процесс не передаются - он возвращает только закодированные результаты
+# вызовов, а сравнивает их родитель. Отчет пишется в отдельный pipe (fd в argv).
+_HARNESS = inspect.getsource(_encode_value) + r'''
+import sys, os, json, io
+
+report_fd = int(sys.argv[1])
+payload = json.loads(sys.stdin.read())
+limits = payload["limits"]
+
+try:
+    import resource
+    resource.setrlimit(resource.RLIMIT_CPU, (limits["cpu_seconds"], limits["cpu_seconds"] + 1))
+    resource.setrlimit(resource.RLIMIT_AS, (limits["memory_bytes"], limits["memory_bytes"]))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+except Exception:
+    pass
+
+for name in payload["preload"]:
+    try:
+        __import__(name)
+    except ImportError:
+        pass
+
+# Запрещенные системные вызовы по архитектурам: (AUDIT_ARCH, номера)
+_DENIED = {
+    "x86_64": (0xC000003E, [
+        2, 85, 257, 437, 303, 304,              # open, creat, openat, openat2, *_by_handle_at
+        41, 53,                                 # socket, socketpair
+        59, 322, 56, 57, 58, 435,               # execve, execveat, clone, fork, vfork, clone3
+        101, 310, 311,                          # ptrace, process_vm_readv/writev
+        62, 200, 234, 129, 297,                 # kill, tkill, tgkill, rt_(tg)sigqueueinfo
+        434, 424, 438,                          # pidfd_open, pidfd_send_signal, pidfd_getfd
+        87, 263, 82, 264, 316, 83, 258, 84,     # unlink*, rename*, mkdir*, rmdir
+        90, 268, 92, 94, 260, 76, 86, 265, 88, 266, 133, 259,
+        425, 426, 427, 272, 308, 165, 248, 250, 298
+    ]),
+    "aarch64": (0xC00000B7, [
+        56, 437, 264, 265,                      # openat, openat2, *_by_handle_at
+        198, 199,                               # socket, socketpair
+        221, 281, 220, 435,                     # execve, execveat, clone, clone3
+        117, 270, 271,                          # ptrace, process_vm_readv/writev
+        129, 130, 131, 138, 240,                # kill, tkill, tgkill, rt_(tg)sigqueueinfo
+        434, 424, 438,                          # pidfd_open, pidfd_send_signal, pidfd_getfd
+        35, 38, 276, 34, 53, 54, 45, 37, 36, 33,
+        425, 426, 427, 97, 268, 40, 217, 219, 241
+    ])
+}
+
+def _install_seccomp():
+    import ctypes
+    arch = _DENIED.get(os.uname().machine)
+    if arch is None:
+        return False
+    audit_arch, denied = arch
+
+    class SockFilter(ctypes.Structure):
+        _fields_ = [("code", ctypes.c_ushort), ("jt", ctypes.c_ubyte), ("jf", ctypes.c_ubyte), ("k", ctypes.c_uint32)]
+
+    class SockFprog(ctypes.Structure):
+        _fields_ = [("len", ctypes.c_ushort), ("filter", ctypes.POINTER(SockFilter))]
+
+    load, jeq, jge, ret = 0x20, 0x15, 0x35, 0x06
+    kill, errno_eperm, allow = 0x80000000, 0x00050001, 0x7FFF0000
+    program = [
+        (load, 0, 0, 4), (jeq, 1, 0, audit_arch), (ret, 0, 0, kill),
+        (load, 0, 0, 0), (jge, 0, 1, 0x40000000), (ret, 0, 0, kill)
+    ]
+    for number in denied:
+        program += [(jeq, 0, 1, number), (ret, 0, 0, errno_eperm)]
+    program.append((ret, 0, 0, allow))
+
+    filters = (SockFilter * len(program))(*[SockFilter(*instruction) for instruction in program])
+    fprog = SockFprog(len(program), filters)
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.prctl(38, 1, 0, 0, 0) != 0:      # PR_SET_NO_NEW_PRIVS
+        return False
+    return libc.prctl(22, 2, ctypes.byref(fprog), 0, 0) == 0   # PR_SET_SECCOMP, FILTER
+
+def _report(report):
+    data = json.dumps(report, ensure_ascii=False).encode("utf-8")
+    while data:
+        data = data[os.write(report_fd, data):]
+
+try:
+    sandboxed = _install_seccomp()
+except Exception:
+    sandboxed = False
+if not sandboxed:
+    _report({"sandbox": False})
+    sys.exit(0)
+
+sys.stdout = io.StringIO()
+sys.stderr = io.StringIO()
+
+report = {"sandbox": True, "compiled": False, "error": None, "results": []}
+namespace = {"__name__": "__solution__"}
+try:
+    exec(compile(payload["code"], "<solution>", "exec"), namespace)
+    report["compiled"] = True
+except BaseException as e:
+    report["error"] = [type(e).__name__, str(e)[:200]]
+
+# Отчет меньше буфера pipe: родитель читает его после завершения процесса
+budget = 48000
+if report["compiled"]:
+    for call in payload["calls"]:
+        try:
+            value = _encode_value(eval(call, namespace))
+            size = len(json.dumps(value))
+            if size > budget:
+                raise ValueError("слишком большой результат")
+            budget -= size
+            report["results"].append({"value": value})
+        except BaseException as e:
+            report["results"].append({"error": [type(e).__name__, str(e)[:200]]})
+
+_report(report)
+'''
+
+class CodeRunResult:
+    """Результат прогона тестов решения"""
+
+    def __init__(self, compiled: bool, tests: List[Dict[str, Any]],
+                 error: Optional[str] = None, timed_out: bool = False):
+        self.compiled = compiled
+        self.tests = tests
+        self.error = error
+        self.timed_out = timed_out
+
+    @property
+    def valid_tests(self) -> List[Dict[str, Any]]:
+        return [t for t in self.tests if not t.get("invalid")]
+
+    @property
+    def passed(self) -> int:
+        return sum(1 for t in self.valid_tests if t.get("passed"))
+
+    @property
+    def graded(self) -> bool:
+        """Можно ли выставить оценку детерминированно"""
+        return not self.compiled or bool(self.valid_tests)
+
+    @property
+    def all_passed(self) -> bool:
+        return self.compiled and bool(self.valid_tests) and self.passed == len(self.valid_tests)
+
+    @property
+    def score(self) -> float:
+        """Оценка от 0 до 100 по доле пройденных тестов"""
+        if not self.compiled or not self.valid_tests:
+            return 0.0
+        return round(100.0 * self.passed / len(self.valid_tests), 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "compiled": self.compiled,
+            "error": self.error,
+            "timed_out": self.timed_out,
+            "passed": self.passed,
+            "total": len(self.valid_tests),
+            "score": self.score,
+            "tests": self.tests
+        }
+
+    def format_report(self) -> str:
+        """Краткий отчет о тестах для промпта"""
+        if not self.compiled:
+            return f"Код не выполнился: {self.error}"
+        lines = [f"Пройдено тестов: {self.passed} из {len(self.valid_tests)}"]
+        for test in self.valid_tests:
+            status = "OK" if test.get("passed") else "FAIL"
+            details = test.get("error") or f"получено {test.get('actual')}"
+            lines.append(f"- {status}: {test['call']} == {test['expected']} ({details})")
+        return "\n".join(lines)
+
+class CodeRunner:
+    """Локальный запуск тестов решений в изолированных процессах с ограничением ресурсов.
+
+    Процесс решения работает под фильтром seccomp (без сети, файлов и новых процессов),
+    с пустым окружением и, если сервис запущен от root, от непривилегированного
+    пользователя. Если фильтр установить нельзя (не Linux, старое ядро), тесты не
+    запускаются и решение оценивает LLM.
+    """
+
+    def __init__(self, workers: int = 4, timeout: float = 5.0,
+                 cpu_seconds: int = 2, memory_mb: int = 256, user: Optional[str] = "nobody"):
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self._user = self._resolve_user(user)
+        # Пул ограничивает число одновременно запущенных процессов-песочниц
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="code-runner")
+        # Проверка песочницы - при первом запуске
+        self._sandbox_lock = threading.Lock()
+        self._sandbox_ok: Optional[bool] = None
+
+    @staticmethod
+    def _resolve_user(user: Optional[str]):
+        """(uid, gid) пользователя для процесса решения; None - без смены пользователя"""
+        if not user or pwd is None or os.geteuid() != 0:
+            return None
+        try:
+            entry = pwd.getpwnam(user)
+        except KeyError:
+            logger.warning(f"Пользователь {user} для запуска решений не найден, процесс решения работает от root")
+            return None
+        return entry.pw_uid, entry.pw_gid
+
+    @staticmethod
+    def extract_code(user_solution: str) -> str:
+        """Выделение кода из текста решения ("Вот моё решение: def ...")"""
+        fenced = re.search(r"```(?:python|py)?\s*\n?(.*?)```", user_solution, re.DOTALL)
+        if fenced:
+            return fenced.group(1).strip()
+
+        start = re.search(r"(?m)(^|\s)(def|class|import|from)\s", user_solution)
+        if start:
+            return user_solution[start.start(2):].strip()
+        return user_solution.strip()
+
+    @staticmethod
+    def has_test_cases(problem: Dict[str, Any]) -> bool:
+        test_cases = problem.get("test_cases") or []
+        return any(isinstance(t, dict) and t.get("call") and "expected" in t for t in test_cases)
+
+    def run_tests(self, code: str, test_cases: List[Dict[str, Any]]) -> CodeRunResult:
+        """Прогон тестов (блокирует до завершения, не дольше таймаута).
+        SandboxUnavailable - изоляция недоступна, оценивать нужно без тестов"""
+        self._check_sandbox()
+        return self._executor.submit(self._run, code, test_cases).result()
+
+    def _check_sandbox(self):
+        with self._sandbox_lock:
+            if self._sandbox_ok is None:
+                try:
+                    report, completed = self._execute("", [])
+                    details = _sanitize(completed.stderr) if completed is not None else "нет отчета"
+                except OSError as e:
+                    # Например, интерпретатор недоступен пользователю процесса решения
+                    report, details = None, _sanitize(e)
+                self._sandbox_ok = bool(report and report.get("sandbox"))
+                if not self._sandbox_ok:
+                    logger.warning(f"Песочница для решений недоступна, автотесты отключены ({details})")
+        if not self._sandbox_ok:
+            raise SandboxUnavailable("Песочница для запуска решений недоступна")
+
+    def _execute(self, code: str, calls: List[str]):
+        """Запуск обвязки; (отчет или None, завершенный процесс или None при таймауте)"""
+        payload = json.dumps({
+            "code": code,
+            "calls": calls,
+            "preload": PRELOADED_MODULES,
+            "limits": {
+                "cpu_seconds": self.cpu_seconds,
+                "memory_bytes": self.memory_mb * 1024 * 1024
+            }
+        })
+        user_options = {}
+        if self._user is not None:
+            user_options = {"user": self._user[0], "group": self._user[1], "extra_groups": []}
+
+        read_fd, write_fd = os.pipe()
+        try:
+            with tempfile.TemporaryDirectory(prefix="code-runner-") as workdir:
+                os.chmod(workdir, 0o755)
+                try:
+                    completed = subprocess.run(
+                        [sys.executable, "-I", "-S", "-c", _HARNESS, str(write_fd)],
+                        input=payload,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.PIPE,
+                        text=True,
+                        timeout=self.timeout,
+                        cwd=workdir,
+                        # Окружение сервиса (ключи API) в процесс решения не передается
+                        env={"PYTHONHASHSEED": "0"},
+                        pass_fds=(write_fd,),
+                        start_new_session=True,
+                        **user_options
+                    )
+                except subprocess.TimeoutExpired:
+                    return None, None
+            os.close(write_fd)
+            write_fd = None
+            with os.fdopen(read_fd, "rb") as pipe:
+                read_fd = None
+                data = pipe.read()
+        finally:
+            for fd in (read_fd, write_fd):
+                if fd is not None:
+                    os.close(fd)
+
+        try:
+            report = json.loads(data.decode("utf-8"))
+        except ValueError:
+            report = None
+        return (report if isinstance(report, dict) else None), completed
+
+    def _run(self, code: str, test_cases: List[Dict[str, Any]]) -> CodeRunResult:
+        # Ожидаемые значения разбираются и хранятся здесь - процесс решения их не видит
+        tests, calls, expected_values = [], [], []
+        for case in test_cases:
+            if not (isinstance(case, dict) and case.get("call") and "expected" in case):
+                continue
+            test = {"call": str(case["call"]), "expected": str(case["expected"]), "passed": False}
+            try:
+                expected_values.append(_encode_value(ast.literal_eval(test["expected"])))
+                calls.append(test["call"])
+            except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+                test.update(error="invalid test case", invalid=True)
+            tests.append(test)
+
+        report, completed = self._execute(code, calls)
+        if completed is None:
+            logger.info("Решение превысило лимит времени")
+            return CodeRunResult(False, [], error="Превышен лимит времени выполнения", timed_out=True)
+
+        if report is None or not report.get("sandbox"):
+            # Процесс убит лимитом ресурсов или фильтром до записи отчета
+            if completed.returncode in (-signal.SIGXCPU, -signal.SIGKILL):
+                return CodeRunResult(False, [], error="Превышен лимит процессорного времени", timed_out=True)
+            if completed.returncode == -signal.SIGSYS:
+                return CodeRunResult(False, [], error="Процесс решения выполнил запрещенный системный вызов")
+            error = completed.stderr.strip().splitlines()[-1:] or [f"код завершения {completed.returncode}"]
+            return CodeRunResult(False, [], error=f"Процесс решения аварийно завершился: {_sanitize(error[0])}")
+
+        if not report.get("compiled"):
+            return CodeRunResult(False, [], error=_error_text(*self._error_pair(report.get("error"))))
+
+        results = report.get("results")
+        if not isinstance(results, list) or len(results) != len(calls):
+            return CodeRunResult(False, [], error="Процесс решения вернул некорректный отчет")
+
+        valid = iter(zip(results, expected_values))
+        for test in tests:
+            if test.get("invalid"):
+                continue
+            result, expected = next(valid)
+            if not isinstance(result, dict) or "value" not in result:
+                test["error"] = _error_text(*self._error_pair(result.get("error") if isinstance(result, dict) else None))
+                continue
+            try:
+                test["actual"] = _sanitize(repr(_decode_value(result["value"])), MAX_VALUE_CHARS)
+            except (ValueError, TypeError, IndexError, KeyError):
+                test["error"] = "Процесс решения вернул некорректный результат"
+                continue
+            test["passed"] = result["value"] == expected
+        return CodeRunResult(True, tests)
+
+    @staticmethod
+    def _error_pair(error) -> List[Any]:
+        if isinstance(error, list) and len(error) == 2:
+            return error
+        return ["Exception", ""]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
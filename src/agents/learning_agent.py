@@ -1,11 +1,22 @@
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 import logging
+import time
 from langchain_gigachat import GigaChat
 
-from src.agents.state import LearningState
+from src.agents.state import LearningState, ProblemType, ProblemDifficulty
+from src.agents.problem_pool import ProblemPool
+from src.agents.session_store import SessionStore
 from src.memory.vector_memory import VectorMemory
+from src.memory.insights import InsightsJob
 from src.graph.learning_graph import LearningGraph
+from src.llm.invoker import ChainInvoker
+from src.llm.scheduler import LLMScheduler, Priority, llm_call_context
+from src.llm.resilience import ResiliencePolicy
+from src.llm.single_flight import SingleFlight
+from src.llm.cassette import Cassette
+from src.llm.tiers import ModelTiers
+from src.config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -15,9 +26,45 @@ class LearningCompanionAgent:
     def __init__(self, credentials: Optional[str] = None):
         self.credentials = credentials or os.getenv("GIGACHAT_CREDENTIALS")
         self.llm = self._initialize_llm()
-        self.memory = VectorMemory()
-        self.graph = LearningGraph(self.memory, self.llm)
-        self.active_sessions: Dict[str, LearningState] = {}
+        # Запись/воспроизведение вызовов LLM и эмбеддингов (CASSETTE_MODE)
+        self.cassette = Cassette.from_settings(settings)
+        self.memory = VectorMemory(persist_directory=settings.CHROMA_PERSIST_DIR, cassette=self.cassette)
+        # Все вызовы LLM агента проходят через общий планировщик
+        self.scheduler = LLMScheduler.from_settings(settings)
+        self.invoker = ChainInvoker(
+            scheduler=self.scheduler,
+            resilience=ResiliencePolicy.from_settings("llm", settings, "LLM"),
+            single_flight=SingleFlight() if settings.SINGLE_FLIGHT_ENABLED else None,
+            cassette=self.cassette,
+            tiers=ModelTiers.from_settings(settings)
+        )
+        self.graph = LearningGraph(self.memory, self.llm, invoker=self.invoker,
+                                   problem_source=self._issue_problem)
+        # Сессии открытых WebSocket-соединений: ключ -> число соединений
+        self.pinned_sessions: Dict[str, int] = {}
+        # Простаивающие сессии (кроме закрепленных) хранятся в сжатом виде
+        self.active_sessions = SessionStore(
+            idle_seconds=settings.SESSION_IDLE_SECONDS,
+            is_pinned=lambda session_key: session_key in self.pinned_sessions
+        )
+        
+        # Один экземпляр ProblemSolver (с уже собранными цепочками) на все запросы
+        self.problem_solver = self.graph.problem_solver
+        self.problem_pool = ProblemPool(
+            self.problem_solver,
+            self.memory,
+            target_depth=settings.PROBLEM_POOL_TARGET_DEPTH,
+            refill_threshold=settings.PROBLEM_POOL_REFILL_THRESHOLD,
+            workers=settings.PROBLEM_POOL_WORKERS,
+            max_keys=settings.PROBLEM_POOL_MAX_KEYS
+        ) if settings.PROBLEM_POOL_ENABLED else None
+        
+        # Матрица навыков, пробелы и путь обучения считаются в фоне, ход их только читает
+        self.insights_job = InsightsJob(
+            self.memory, self.memory.insights, interval=settings.INSIGHTS_INTERVAL_SECONDS
+        ) if settings.INSIGHTS_ENABLED else None
+        if self.insights_job:
+            self.insights_job.start()
     
     def _initialize_llm(self) -> GigaChat:
         """Инициализация GigaChat модели"""
@@ -25,7 +72,7 @@ class LearningCompanionAgent:
             credentials=self.credentials,
             scope=os.getenv("GIGACHAT_SCOPE"),
             verify_ssl_certs=False,
-            temperature=0.7,
+            temperature=settings.LLM_MAIN_TEMPERATURE,
             model=os.getenv("GIGACHAT_MODEL")
         )
     
@@ -35,6 +82,12 @@ class LearningCompanionAgent:
         
         # Получение или создание состояния сессии
         state = self._get_or_create_state(user_id, session_id)
+        self._apply_insights(state)
+        if self.cassette:
+            self.cassette.record_turn(state.user_id, state.session_id, user_message)
+        
+        # Перегруженная очередь LLM - отказываем сразу (SchedulerOverloaded -> 429)
+        self.scheduler.check_admission(Priority.INTERACTIVE, state.user_id)
         
         # Добавление сообщения пользователя
         from langchain_core.messages import HumanMessage
@@ -42,7 +95,8 @@ class LearningCompanionAgent:
         
         try:
             # Обработка через граф
-            final_state = self.graph.process(state)
+            with llm_call_context(Priority.INTERACTIVE, state.user_id):
+                final_state = self.graph.process(state)
             
             # Сохранение обновленного состояния
             session_key = f"{final_state.user_id}_{final_state.session_id}"
@@ -58,9 +112,9 @@ class LearningCompanionAgent:
     def _get_or_create_state(self, user_id: str = None, session_id: str = None) -> LearningState:
         """Получение или создание состояния сессии"""
         if user_id and session_id:
-            session_key = f"{user_id}_{session_id}"
-            if session_key in self.active_sessions:
-                return self.active_sessions[session_key]
+            state = self.active_sessions.get(f"{user_id}_{session_id}")
+            if state is not None:
+                return state
         
         # Создание нового состояния
         return LearningState(
@@ -68,11 +122,168 @@ class LearningCompanionAgent:
             session_id=session_id or f"session_{len(self.active_sessions) + 1}"
         )
     
+    def _apply_insights(self, state: LearningState):
+        """Последняя рассчитанная в фоне аналитика пользователя - в состояние сессии"""
+        insights = self.memory.insights.get(state.user_id)
+        if insights:
+            state.skill_matrix = insights["skill_matrix"]
+            state.knowledge_gaps = insights["knowledge_gaps"]
+            state.learning_path = insights["learning_path"]
+    
+    def start_session(self, user_id: str = None, session_id: str = None) -> Dict[str, Any]:
+        """Подготовка сессии до первого сообщения: состояние, агрегаты прогресса,
+        векторы пользователя в hot_cache, воспоминания по последней теме и токены клиентов"""
+        warmup_ms: Dict[str, float] = {}
+        
+        def timed(step: str, fn):
+            started = time.perf_counter()
+            try:
+                return fn()
+            except Exception as e:
+                logger.warning(f"Прогрев сессии, шаг {step}: {e}")
+                return None
+            finally:
+                warmup_ms[step] = round((time.perf_counter() - started) * 1000, 1)
+        
+        state = self._get_or_create_state(user_id, session_id)
+        state = self.active_sessions.setdefault(f"{state.user_id}_{state.session_id}", state)
+        self._apply_insights(state)
+        
+        timed("clients", self._warm_clients)
+        progress = timed("progress", lambda: self.memory.get_cached_learning_progress(state.user_id)[0]) or {}
+        timed("vectors", lambda: self.memory.warm_user(state.user_id))
+        topics = timed("recent_topics", lambda: self.memory.recent_topics(state.user_id)) or []
+        
+        memories = []
+        if topics:
+            # Поиск по последней теме заодно прогревает клиент эмбеддингов
+            memories = timed("memories", lambda: self.memory.retrieve_relevant_memories(
+                state.user_id, topics[0], n_results=settings.MEMORY_RETRIEVAL_RESULTS
+            )) or []
+            if not state.current_topic:
+                state.current_topic = topics[0]
+        
+        # Контекст на случай, если первый ход не успеет искать сам (дедлайн хода)
+        state.memory_context = {
+            "relevant_memories": memories,
+            "learning_progress": progress,
+            "previous_topics": progress.get("topics_covered", [])
+        }
+        
+        return {
+            "user_id": state.user_id,
+            "session_id": state.session_id,
+            "current_topic": state.current_topic,
+            "recent_topics": topics,
+            "total_interactions": progress.get("total_interactions", 0),
+            "problems_solved": progress.get("problems_solved", 0),
+            "prefetched_memories": len(memories),
+            "warmup_ms": warmup_ms
+        }
+    
+    def _warm_clients(self):
+        """Токены GigaChat для LLM и эмбеддингов - заранее, а не в первом запросе"""
+        llm_client = getattr(self.llm, "_client", None)
+        if llm_client is not None:
+            llm_client.get_token()
+        warm_embeddings = getattr(self.memory.embeddings, "warm", None)
+        if warm_embeddings is not None:
+            warm_embeddings()
+    
     def get_learning_analytics(self, user_id: str) -> Dict[str, Any]:
         """Получение аналитики обучения"""
-        return self.memory.get_learning_progress(user_id)
+        analytics, _ = self.memory.get_cached_learning_progress(user_id)
+        return analytics
+    
+    def get_learning_analytics_with_etag(self, user_id: str) -> Tuple[Dict[str, Any], str]:
+        """Получение аналитики обучения вместе с ETag"""
+        return self.memory.get_cached_learning_progress(user_id)
+    
+    def get_learning_analytics_etag(self, user_id: str) -> str:
+        """ETag текущей аналитики (без пересчета)"""
+        return self.memory.get_learning_progress_etag(user_id)
+    
+    def pin_session(self, user_id: str, session_id: str) -> LearningState:
+        """Закрепление сессии за соединением: состояние создается сразу и держится,
+        пока соединение открыто"""
+        state = self._get_or_create_state(user_id, session_id)
+        session_key = f"{state.user_id}_{state.session_id}"
+        self.active_sessions.setdefault(session_key, state)
+        self.pinned_sessions[session_key] = self.pinned_sessions.get(session_key, 0) + 1
+        return self.active_sessions[session_key]
+    
+    def unpin_session(self, user_id: str, session_id: str):
+        """Открепление сессии при закрытии соединения"""
+        session_key = f"{user_id}_{session_id}"
+        remaining = self.pinned_sessions.get(session_key, 0) - 1
+        if remaining > 0:
+            self.pinned_sessions[session_key] = remaining
+        else:
+            self.pinned_sessions.pop(session_key, None)
     
     def get_session_state(self, user_id: str, session_id: str) -> Optional[LearningState]:
         """Получение состояния сессии"""
         session_key = f"{user_id}_{session_id}"
-        return self.active_sessions.get(session_key)
\ No newline at end of file
+        return self.active_sessions.get(session_key)
+    
+    def generate_problem(self, topic: str, problem_type: ProblemType,
+                         difficulty: ProblemDifficulty, knowledge_level: str = "intermediate",
+                         user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Выдача учебной задачи (из пула, если он включен)"""
+        self.scheduler.check_admission(Priority.INTERACTIVE, user_id)
+        
+        with llm_call_context(Priority.INTERACTIVE, user_id):
+            return self._issue_problem(topic, problem_type, difficulty, knowledge_level, user_id)
+    
+    def _issue_problem(self, topic: str, problem_type: ProblemType, difficulty: ProblemDifficulty,
+                       knowledge_level: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Задача из пула или от ProblemSolver; используется и веткой задач в графе"""
+        if self.problem_pool:
+            problem = self.problem_pool.get_problem(topic, problem_type, difficulty, knowledge_level)
+        else:
+            problem = self.problem_solver.generate_problem(
+                topic=topic,
+                knowledge_level=knowledge_level,
+                problem_type=problem_type,
+                difficulty=difficulty
+            )
+        
+        # Выданная задача попадает в problems_collection и больше не попадет в пул
+        if user_id and not problem.get("is_fallback"):
+            try:
+                self.memory.store_problem(user_id, {**problem, "topic": topic})
+            except Exception as e:
+                logger.error(f"Ошибка сохранения задачи: {e}")
+        
+        return problem
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Метрики компонентов агента"""
+        embedding_resilience = getattr(self.memory.embeddings, "resilience", None)
+        embedding_single_flight = getattr(self.memory.embeddings, "single_flight", None)
+        return {
+            "analytics_cache": self.memory.analytics_cache.stats(),
+            "hot_vector_cache": self.memory.hot_cache.stats() if self.memory.hot_cache else None,
+            "interaction_writes": self.memory.write_stats(),
+            "sessions": self.active_sessions.stats(),
+            "problem_pool": self.problem_pool.stats() if self.problem_pool else None,
+            "insights": self.insights_job.stats() if self.insights_job else None,
+            "graph": self.graph.stats(),
+            "structured_output": self.graph.structured_output.stats(),
+            "prompt_budget": self.graph.prompt_budget.stats(),
+            **self.invoker.stats(),
+            "embedding_resilience": embedding_resilience.stats() if embedding_resilience else None,
+            "embedding_single_flight": embedding_single_flight.stats() if embedding_single_flight else None
+        }
+    
+    def shutdown(self):
+        """Остановка фоновых задач агента"""
+        if self.problem_pool:
+            self.problem_pool.shutdown()
+        if self.insights_job:
+            self.insights_job.shutdown()
+        self.graph.shutdown()
+        if self.problem_solver.code_runner:
+            self.problem_solver.code_runner.shutdown()
+        if self.cassette:
+            self.cassette.close()
@@ -0,0 +1,186 @@
+from typing import Dict, Any, Tuple, Optional
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+
+from src.agents.problem_solver import ProblemSolver
+from src.agents.state import ProblemType, ProblemDifficulty
+from src.memory.vector_memory import VectorMemory
+from src.llm.scheduler import Priority, llm_call_context
+
+logger = logging.getLogger(__name__)
+
+# (тема, тип задачи, сложность, уровень знаний)
+PoolKey = Tuple[str, str, str, str]
+
+class ProblemPool:
+    """Пул заранее сгенерированных задач с фоновым пополнением"""
+
+    def __init__(self, problem_solver: ProblemSolver, memory: Optional[VectorMemory] = None,
+                 target_depth: int = 3, refill_threshold: int = 1,
+                 workers: int = 2, max_keys: int = 256):
+        self.problem_solver = problem_solver
+        self.memory = memory
+        self.target_depth = target_depth
+        self.refill_threshold = refill_threshold
+        self.max_keys = max_keys
+
+        self._lock = threading.Lock()
+        self._pools: "OrderedDict[PoolKey, deque]" = OrderedDict()
+        self._refilling: set = set()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="problem-pool")
+        self._closed = False
+
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "generated": 0,
+            "duplicates": 0,
+            "fallbacks": 0,
+            "errors": 0
+        }
+
+    @staticmethod
+    def make_key(topic: str, problem_type: ProblemType, difficulty: ProblemDifficulty,
+                 knowledge_level: str) -> PoolKey:
+        """Ключ пула (тема нормализуется, чтобы 'Python ' и 'python' попадали в один пул)"""
+        return (" ".join(topic.lower().split()), problem_type.value, difficulty.value, knowledge_level)
+
+    def get_problem(self, topic: str, problem_type: ProblemType,
+                    difficulty: ProblemDifficulty, knowledge_level: str) -> Dict[str, Any]:
+        """Выдача задачи из пула; при промахе - синхронная генерация"""
+        key = self.make_key(topic, problem_type, difficulty, knowledge_level)
+
+        problem = None
+        with self._lock:
+            pool = self._touch(key)
+            if pool:
+                problem = pool.popleft()
+                self._metrics["hits"] += 1
+            else:
+                self._metrics["misses"] += 1
+
+        if problem is None:
+            problem = self.problem_solver.generate_problem(
+                topic=topic,
+                knowledge_level=knowledge_level,
+                problem_type=problem_type,
+                difficulty=difficulty
+            )
+
+        self._schedule_refill(key, topic)
+        return problem
+
+    def warm(self, topic: str, problem_type: ProblemType,
+             difficulty: ProblemDifficulty, knowledge_level: str):
+        """Фоновое наполнение пула для ключа без выдачи задачи"""
+        key = self.make_key(topic, problem_type, difficulty, knowledge_level)
+        with self._lock:
+            self._touch(key)
+        self._schedule_refill(key, topic)
+
+    def _touch(self, key: PoolKey) -> deque:
+        """Получение очереди ключа с LRU-вытеснением (вызывать под блокировкой)"""
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = deque()
+            self._pools[key] = pool
+            while len(self._pools) > self.max_keys:
+                self._pools.popitem(last=False)
+        self._pools.move_to_end(key)
+        return pool
+
+    def _schedule_refill(self, key: PoolKey, topic: str):
+        """Постановка ключа на пополнение, если глубина опустилась до порога"""
+        with self._lock:
+            if self._closed or key in self._refilling:
+                return
+            pool = self._pools.get(key)
+            if pool is None or len(pool) > self.refill_threshold:
+                return
+            self._refilling.add(key)
+
+        self._executor.submit(self._refill, key, topic)
+
+    def _refill(self, key: PoolKey, topic: str):
+        """Пополнение пула до целевой глубины (выполняется в фоне)"""
+        _, problem_type, difficulty, knowledge_level = key
+
+        try:
+            with llm_call_context(Priority.BACKGROUND, user_id="problem_pool"):
+                self._fill(key, topic, problem_type, difficulty, knowledge_level)
+        except Exception as e:
+            logger.error(f"Ошибка пополнения пула задач {key}: {e}")
+            with self._lock:
+                self._metrics["errors"] += 1
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+
+    def _fill(self, key: PoolKey, topic: str, problem_type: str, difficulty: str, knowledge_level: str):
+        """Генерация задач для ключа с отсевом дубликатов"""
+        # Ограничиваем число попыток, чтобы дубликаты не зациклили генерацию
+        attempts = self.target_depth * 2
+        while attempts > 0 and not self._closed:
+            with self._lock:
+                pool = self._pools.get(key)
+                if pool is None or len(pool) >= self.target_depth:
+                    break
+                known = {p.get("problem_statement", "") for p in pool}
+            attempts -= 1
+
+            problem = self.problem_solver.generate_problem(
+                topic=topic,
+                knowledge_level=knowledge_level,
+                problem_type=ProblemType(problem_type),
+                difficulty=ProblemDifficulty(difficulty)
+            )
+
+            if problem.get("is_fallback"):
+                # Генерация не удалась - не заполняем пул заглушками
+                with self._lock:
+                    self._metrics["fallbacks"] += 1
+                break
+
+            if self._is_duplicate(problem, known):
+                with self._lock:
+                    self._metrics["duplicates"] += 1
+                continue
+
+            with self._lock:
+                self._metrics["generated"] += 1
+                pool = self._pools.get(key)
+                if pool is not None:
+                    pool.append(problem)
+
+    def _is_duplicate(self, problem: Dict[str, Any], known: set) -> bool:
+        """Дубликат задачи в пуле или среди уже выданных (problems_collection)"""
+        statement = problem.get("problem_statement", "")
+        if not statement or statement in known:
+            return True
+        if self.memory is None:
+            return False
+        try:
+            return self.memory.has_problem(statement)
+        except Exception as e:
+            logger.warning(f"Не удалось проверить дубликат задачи: {e}")
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики пула задач"""
+        with self._lock:
+            requests = self._metrics["hits"] + self._metrics["misses"]
+            return {
+                **self._metrics,
+                "hit_rate": self._metrics["hits"] / requests if requests else 0.0,
+                "keys": len(self._pools),
+                "pooled_problems": sum(len(pool) for pool in self._pools.values()),
+                "refilling": len(self._refilling)
+            }
+
+    def shutdown(self):
+        """Остановка фонового пополнения"""
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
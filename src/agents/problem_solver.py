@@ -1,8 +1,11 @@
 from typing import Dict, List, Any
-import json
-import re
 import logging
 from src.agents.state import ProblemType, ProblemDifficulty, ProblemSolution
+from src.agents.code_runner import CodeRunner
+from src.llm.schemas import GeneratedProblem, SolutionEvaluation
+from src.llm.structured_output import StructuredOutputParser
+from src.llm.invoker import ChainInvoker
+from src.config import settings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
@@ -11,8 +14,19 @@ logger = logging.getLogger(__name__)
 class ProblemSolver:
     """Система решения и оценки учебных задач с использованием LCEL"""
     
-    def __init__(self, llm):
+    def __init__(self, llm, code_runner: CodeRunner = None,
+                 structured_output: StructuredOutputParser = None,
+                 invoker: ChainInvoker = None):
         self.llm = llm
+        self.invoker = invoker or ChainInvoker()
+        self.structured_output = structured_output or StructuredOutputParser(llm, self.invoker)
+        self.code_runner = code_runner or (CodeRunner(
+            workers=settings.CODE_RUNNER_WORKERS,
+            timeout=settings.CODE_RUNNER_TIMEOUT,
+            cpu_seconds=settings.CODE_RUNNER_CPU_SECONDS,
+            memory_mb=settings.CODE_RUNNER_MEMORY_MB,
+            user=settings.CODE_RUNNER_USER
+        ) if settings.CODE_RUNNER_ENABLED else None)
         self._create_lcel_chains()
     
     def _create_lcel_chains(self):
@@ -31,6 +45,9 @@ class ProblemSolver:
             2. Должна проверять ключевые концепции темы
             3. Должна иметь четкое решение
             4. Должна развивать практические навыки
+            5. Для типа code: явно укажи имя и сигнатуру функции и добавь 3-5 тестов
+               в test_cases (вызов функции и ожидаемый результат как литерал Python).
+               Для остальных типов test_cases - пустой список.
             
             Формат ответа:
             {{
@@ -43,10 +60,13 @@ class ProblemSolver:
                 "evaluation_criteria": {{
                     "критерий 1": "описание",
                     "критерий 2": "описание"
-                }}
+                }},
+                "test_cases": [
+                    {{"call": "имя_функции(2, 3)", "expected": "6"}}
+                ]
             }}
             """)
-            | self.llm
+            | self.invoker.model("problem_generation", self.llm)
             | StrOutputParser()
         )
         
@@ -67,6 +87,9 @@ class ProblemSolver:
             РЕШЕНИЕ ПОЛЬЗОВАТЕЛЯ:
             {user_solution}
             
+            РЕЗУЛЬТАТЫ АВТОТЕСТОВ (если есть, оценка определяется ими):
+            {test_results}
+            
             Проведи оценку по следующим аспектам:
             1. Правильность решения
             2. Полнота ответа
@@ -91,7 +114,7 @@ class ProblemSolver:
                 "weaknesses": ["слабая сторона 1", "слабая сторона 2"]
             }}
             """)
-            | self.llm
+            | self.invoker.model("solution_evaluation", self.llm)
             | StrOutputParser()
         )
         
@@ -111,7 +134,7 @@ class ProblemSolver:
             
             Подсказка должна быть краткой и конкретной.
             """)
-            | self.llm
+            | self.invoker.model("hint", self.llm)
             | StrOutputParser()
         )
     
@@ -128,14 +151,13 @@ class ProblemSolver:
                 "difficulty": difficulty.value
             }
             
-            problem_result = self.problem_generation_chain.invoke(chain_input)
+            problem_result = self.invoker.invoke("problem_generation", self.problem_generation_chain, chain_input)
             
-            # Парсинг JSON ответа
-            json_match = re.search(r'\{.*\}', problem_result, re.DOTALL)
-            if json_match:
-                problem_data = json.loads(json_match.group())
+            # Разбор и валидация JSON ответа по схеме
+            problem = self.structured_output.parse("problem_generation", problem_result, GeneratedProblem)
+            if problem:
                 logger.info(f"Сгенерирована задача по теме: {topic}")
-                return problem_data
+                return problem.model_dump()
             else:
                 raise ValueError("Не удалось распарсить JSON ответ")
                 
@@ -147,6 +169,11 @@ class ProblemSolver:
                          topic: str, knowledge_level: str) -> ProblemSolution:
         """Оценка решения пользователя с использованием LCEL"""
         
+        # Задачи с кодом и тестами оцениваются детерминированно локальным прогоном
+        test_run = self._run_code_tests(problem, user_solution)
+        if test_run and test_run.all_passed:
+            return self._tests_passed_evaluation(problem, user_solution, test_run)
+        
         try:
             chain_input = {
                 "topic": topic,
@@ -154,21 +181,26 @@ class ProblemSolver:
                 "problem_statement": problem.get('problem_statement', ''),
                 "problem_type": problem.get('problem_type', ''),
                 "evaluation_criteria": problem.get('evaluation_criteria', {}),
-                "user_solution": user_solution
+                "user_solution": user_solution,
+                "test_results": test_run.format_report() if test_run else "нет"
             }
             
-            evaluation_result = self.solution_evaluation_chain.invoke(chain_input)
+            evaluation_result = self.invoker.invoke("solution_evaluation", self.solution_evaluation_chain, chain_input)
             
             print("Оценка решения ...")
             print(evaluation_result)
 
-            # Парсинг JSON ответа
-            json_match = re.search(r'\{.*\}', evaluation_result, re.DOTALL)
-            if json_match:
-                evaluation_data = json.loads(json_match.group())
+            # Разбор и валидация JSON ответа по схеме
+            evaluation = self.structured_output.parse("solution_evaluation", evaluation_result, SolutionEvaluation)
+            if evaluation:
+                evaluation_data = evaluation.model_dump()
             else:
                 evaluation_data = self._get_fallback_evaluation_data()
             
+            if test_run:
+                # LLM дает только качественный фидбэк, балл - по результатам тестов
+                evaluation_data = {**evaluation_data, "score": test_run.score, "tests": test_run.to_dict()}
+            
             solution = ProblemSolution(
                 problem_statement=problem['problem_statement'],
                 user_solution=user_solution,
@@ -184,8 +216,53 @@ class ProblemSolver:
             
         except Exception as e:
             logger.error(f"Ошибка оценки решения: {e}")
+            if test_run:
+                return self._tests_failed_evaluation(problem, user_solution, test_run)
             return self._get_fallback_evaluation(problem, user_solution)
     
+    def _run_code_tests(self, problem: Dict, user_solution: str):
+        """Локальный прогон тестов для задач с кодом; None, если оценить тестами нельзя"""
+        if not self.code_runner or problem.get('problem_type') != ProblemType.CODE.value:
+            return None
+        if not CodeRunner.has_test_cases(problem):
+            return None
+        
+        try:
+            test_run = self.code_runner.run_tests(
+                CodeRunner.extract_code(user_solution),
+                problem['test_cases']
+            )
+        except Exception as e:
+            logger.error(f"Ошибка запуска тестов решения: {e}")
+            return None
+        
+        logger.info(f"Автотесты решения: {test_run.passed}/{len(test_run.valid_tests)}")
+        return test_run if test_run.graded else None
+    
+    def _tests_passed_evaluation(self, problem: Dict, user_solution: str, test_run) -> ProblemSolution:
+        """Оценка решения, прошедшего все тесты, без обращения к LLM"""
+        return ProblemSolution(
+            problem_statement=problem['problem_statement'],
+            user_solution=user_solution,
+            correct_solution=CodeRunner.extract_code(user_solution),
+            evaluation={"score": test_run.score, "tests": test_run.to_dict(), "graded_by": "tests"},
+            score=test_run.score,
+            feedback=f"Отлично! Решение прошло все тесты ({test_run.passed} из {len(test_run.valid_tests)}).",
+            improvements=[]
+        )
+    
+    def _tests_failed_evaluation(self, problem: Dict, user_solution: str, test_run) -> ProblemSolution:
+        """Оценка по тестам, когда LLM-фидбэк недоступен"""
+        return ProblemSolution(
+            problem_statement=problem['problem_statement'],
+            user_solution=user_solution,
+            correct_solution="Не удалось сгенерировать правильное решение",
+            evaluation={"score": test_run.score, "tests": test_run.to_dict(), "graded_by": "tests"},
+            score=test_run.score,
+            feedback=test_run.format_report(),
+            improvements=["Проверьте решение на непрошедших тестах"]
+        )
+    
     def provide_hint(self, problem: Dict, user_stuck: bool = False) -> str:
         """Предоставление подсказки с использованием LCEL"""
         
@@ -196,14 +273,14 @@ class ProblemSolver:
                 "available_hints": problem.get('hints', [])
             }
             
-            hint = self.hint_generation_chain.invoke(chain_input)
+            hint = self.invoker.invoke("hint", self.hint_generation_chain, chain_input)
             return hint
             
         except Exception as e:
             logger.error(f"!!! Ошибка генерации подсказки: {e}")
             return "Попробуйте разбить задачу на более мелкие шаги и решать их последовательно."
     
-    def _get_fallback_problem(self, topic: str) -> Dict[str, Any]:
+    def _get_fallback_problem(self, topic: str, knowledge_level: str = "beginner") -> Dict[str, Any]:
         """Резервная задача при ошибке генерации"""
         return {
             "problem_statement": f"Объясните основные концепции темы '{topic}' своими словами",
@@ -216,7 +293,8 @@ class ProblemSolver:
                 "полнота": "раскрыты все основные аспекты",
                 "ясность": "объяснение понятно и логично",
                 "примеры": "приведены релевантные примеры"
-            }
+            },
+            "is_fallback": True
         }
     
     def _get_fallback_evaluation(self, problem: Dict, user_solution: str) -> ProblemSolution:
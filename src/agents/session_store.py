@@ -0,0 +1,138 @@
+from typing import Any, Callable, Dict, Iterator, Optional
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+import threading
+import json
+import time
+import zlib
+import sys
+import logging
+
+from src.agents.state import LearningState
+
+logger = logging.getLogger(__name__)
+
+# Поля, которые пересобираются на каждом ходе и не нужны простаивающей сессии
+TRANSIENT_FIELDS = {"memory_context", "relevant_memories", "current_response"}
+
+# Короткие повторяющиеся строки (идентификаторы, уровни, режимы) храним в одном экземпляре
+_INTERNED_FIELDS = ("user_id", "session_id", "current_topic", "knowledge_level", "learning_style",
+                    "subject_area", "learning_mode", "teaching_strategy")
+
+_MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+
+def compact_state(state: LearningState) -> bytes:
+    """Компактное представление сессии: без временных полей, сообщения - только тип
+    и текст, JSON без пробелов, сжатый zlib"""
+    data = state.model_dump(mode="json", exclude=TRANSIENT_FIELDS | {"messages"})
+    data["messages"] = [[message.type, message.content] for message in state.messages]
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+def restore_state(blob: bytes) -> LearningState:
+    data = json.loads(zlib.decompress(blob))
+    data["messages"] = [_MESSAGE_TYPES.get(kind, HumanMessage)(content=content)
+                        for kind, content in data["messages"]]
+    for field in _INTERNED_FIELDS:
+        if isinstance(data.get(field), str):
+            data[field] = sys.intern(data[field])
+    return LearningState(**data)
+
+class SessionStore:
+    """Сессии агента: активные - объектами LearningState, простаивающие дольше
+    idle_seconds - в компактном сжатом виде; при обращении сессия разворачивается обратно.
+
+    Закрепленные сессии (открытый WebSocket) не сжимаются. Интерфейс - как у dict,
+    которым раньше был active_sessions.
+    """
+
+    def __init__(self, idle_seconds: float = 300.0, is_pinned: Callable[[str], bool] = None):
+        self.idle_seconds = idle_seconds
+        self.is_pinned = is_pinned or (lambda key: False)
+        self._lock = threading.Lock()
+        self._active: Dict[str, LearningState] = {}
+        self._compact: Dict[str, bytes] = {}
+        self._last_access: Dict[str, float] = {}
+        self._last_sweep = time.monotonic()
+        self._stats = {"compactions": 0, "restores": 0}
+
+    def get(self, key: str, default: Any = None) -> Optional[LearningState]:
+        with self._lock:
+            state = self._get_locked(key)
+        self._maybe_sweep()
+        return default if state is None else state
+
+    def _get_locked(self, key: str) -> Optional[LearningState]:
+        state = self._active.get(key)
+        if state is None and key in self._compact:
+            state = restore_state(self._compact.pop(key))
+            self._active[key] = state
+            self._stats["restores"] += 1
+        if state is not None:
+            self._last_access[key] = time.monotonic()
+        return state
+
+    def __getitem__(self, key: str) -> LearningState:
+        state = self.get(key)
+        if state is None:
+            raise KeyError(key)
+        return state
+
+    def __setitem__(self, key: str, state: LearningState):
+        with self._lock:
+            self._compact.pop(key, None)
+            self._active[key] = state
+            self._last_access[key] = time.monotonic()
+        self._maybe_sweep()
+
+    def setdefault(self, key: str, state: LearningState) -> LearningState:
+        with self._lock:
+            existing = self._get_locked(key)
+            if existing is None:
+                self._active[key] = existing = state
+                self._last_access[key] = time.monotonic()
+        return existing
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._active or key in self._compact
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._active) + len(self._compact)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._active) + list(self._compact))
+
+    def _maybe_sweep(self):
+        if self.idle_seconds <= 0:
+            return
+        now = time.monotonic()
+        # Проверяем простой не чаще, чем раз в половину порога
+        if now - self._last_sweep < min(self.idle_seconds / 2, 60.0):
+            return
+        self._last_sweep = now
+        self.compact_idle()
+
+    def compact_idle(self) -> int:
+        """Сжатие сессий, к которым не обращались дольше idle_seconds; возвращает их число"""
+        deadline = time.monotonic() - self.idle_seconds
+        compacted = 0
+        with self._lock:
+            for key in [k for k, state in self._active.items() if self._last_access.get(k, 0) <= deadline]:
+                if self.is_pinned(key):
+                    continue
+                self._compact[key] = compact_state(self._active.pop(key))
+                compacted += 1
+            self._stats["compactions"] += compacted
+        if compacted:
+            logger.info(f"Сжато простаивающих сессий: {compacted}")
+        return compacted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "active": len(self._active),
+                "compact": len(self._compact),
+                "compact_bytes": sum(len(blob) for blob in self._compact.values())
+            }
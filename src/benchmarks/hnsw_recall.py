@@ -0,0 +1,103 @@
+"""Бенчмарк полноты поиска против задержки для параметров HNSW на синтетическом корпусе.
+
+Запуск: python -m src.benchmarks.hnsw_recall --size 10000 --m 8,16,32 --ef-search 10,50,100,200
+"""
+from typing import Dict, List
+import argparse
+import time
+
+import chromadb
+import numpy as np
+
+def make_corpus(size: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Нормированные векторы, сгруппированные вокруг центров - похоже на эмбеддинги диалогов по темам"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    labels = rng.integers(0, clusters, size=size)
+    vectors = centers[labels] + rng.normal(scale=0.6, size=(size, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def exact_neighbors(corpus: np.ndarray, queries: np.ndarray, k: int, space: str) -> List[set]:
+    """Точные k ближайших соседей полным перебором"""
+    if space == "l2":
+        distances = ((queries[:, None, :] - corpus[None, :, :]) ** 2).sum(axis=2)
+    else:
+        distances = -queries @ corpus.T
+    return [set(np.argsort(row)[:k].tolist()) for row in distances]
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+def run(size: int, dim: int, queries: int, k: int, space: str, m_values: List[int],
+        ef_search_values: List[int], ef_construction: int, seed: int) -> List[Dict]:
+    corpus = make_corpus(size, dim, clusters=max(size // 200, 4), seed=seed)
+    query_vectors = make_corpus(queries, dim, clusters=max(size // 200, 4), seed=seed)
+    truth = exact_neighbors(corpus, query_vectors, k, space)
+    ids = [str(i) for i in range(size)]
+
+    client = chromadb.EphemeralClient()
+    rows = []
+    for m in m_values:
+        for ef_search in ef_search_values:
+            # ef_search применяется при загрузке индекса, поэтому каждая пара - своя коллекция
+            name = f"bench_m{m}_ef{ef_search}"
+            collection = client.create_collection(
+                name=name,
+                configuration={"hnsw": {"space": space, "max_neighbors": m,
+                                        "ef_construction": ef_construction, "ef_search": ef_search}},
+                embedding_function=None
+            )
+
+            started = time.perf_counter()
+            for offset in range(0, size, 1000):
+                collection.add(ids=ids[offset:offset + 1000], embeddings=corpus[offset:offset + 1000])
+            build_seconds = time.perf_counter() - started
+
+            latencies, hits = [], 0
+            for query, expected in zip(query_vectors, truth):
+                started = time.perf_counter()
+                result = collection.query(query_embeddings=[query], n_results=k, include=[])
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += len(expected & {int(i) for i in result['ids'][0]})
+
+            rows.append({
+                "m": m,
+                "ef_search": ef_search,
+                "recall": hits / (k * len(truth)),
+                "p50_ms": percentile(latencies, 0.5),
+                "p95_ms": percentile(latencies, 0.95),
+                "build_seconds": build_seconds
+            })
+            client.delete_collection(name)
+
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Полнота и задержка поиска HNSW в Chroma")
+    parser.add_argument("--size", type=int, default=5000, help="Размер корпуса")
+    parser.add_argument("--dim", type=int, default=256, help="Размерность векторов")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10, help="Число результатов (как n_results в памяти)")
+    parser.add_argument("--space", default="cosine", choices=["cosine", "l2", "ip"])
+    parser.add_argument("--m", default="8,16,32", help="Значения M (max_neighbors) через запятую")
+    parser.add_argument("--ef-search", default="10,50,100,200", help="Значения ef_search через запятую")
+    parser.add_argument("--ef-construction", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rows = run(
+        size=args.size, dim=args.dim, queries=args.queries, k=args.k, space=args.space,
+        m_values=[int(v) for v in args.m.split(",")],
+        ef_search_values=[int(v) for v in args.ef_search.split(",")],
+        ef_construction=args.ef_construction, seed=args.seed
+    )
+
+    print(f"Корпус: {args.size} x {args.dim}, запросов: {args.queries}, k={args.k}, space={args.space}")
+    print(f"{'M':>4} {'ef_search':>10} {'recall@k':>9} {'p50, мс':>8} {'p95, мс':>8} {'построение, с':>14}")
+    for row in rows:
+        print(f"{row['m']:>4} {row['ef_search']:>10} {row['recall']:>9.3f} "
+              f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['build_seconds']:>14.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Нагрузочный тест API: сколько одновременных студентов выдерживает один экземпляр сервиса.
+
+Виртуальные пользователи проходят диалог демо-сценария (/chat), запрашивают задачи
+(/generate_problem) и аналитику (/analytics/{user_id}). Число пользователей растет
+ступенями; для каждой ступени - пропускная способность, p50/p95/p99 и доля ошибок.
+
+По умолчанию сервис поднимается в этом же процессе с заглушками LLM и эмбеддингов,
+у которых задержка задается параметрами, - измеряется собственная обвязка сервиса
+(планировщик, пулы потоков, Chroma). С --url нагрузка идет на уже запущенный сервис.
+
+Запуск: python -m src.benchmarks.load_test --concurrency 1,5,10,25 --duration 20 --llm-latency 0.8
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+
+import httpx
+
+from src.demo.demo_scenario import DEMO_DIALOG
+
+# Темы для /generate_problem: (тема, тип задачи, сложность)
+PROBLEM_REQUESTS = [
+    ("функции", "code", "easy"),
+    ("списки", "code", "medium"),
+    ("строки", "practical", "easy"),
+    ("классы и ООП", "theoretical", "medium")
+]
+
+def dialog_script(user_id: str, session_id: str, seed: int) -> List[Tuple[str, str, str, Optional[Dict]]]:
+    """Запросы одного прохода сценария: (метка, метод, путь, тело)"""
+    rng = random.Random(seed)
+    topic, problem_type, difficulty = rng.choice(PROBLEM_REQUESTS)
+    script = []
+    for message in DEMO_DIALOG:
+        script.append(("chat", "POST", "/chat",
+                       {"message": message, "user_id": user_id, "session_id": session_id}))
+        if "прогресс" in message:
+            script.append(("analytics", "GET", f"/analytics/{user_id}", None))
+        if "задач" in message and rng.random() < 0.5:
+            script.append(("generate_problem", "POST", "/generate_problem",
+                           {"topic": topic, "problem_type": problem_type,
+                            "difficulty": difficulty, "user_id": user_id}))
+    script.append(("analytics", "GET", f"/analytics/{user_id}", None))
+    return script
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+async def virtual_user(client: httpx.AsyncClient, index: int, step: int, deadline: float,
+                       think_time: float, samples: List[Tuple[str, float, int]]):
+    """Пользователь проходит сценарий по кругу, пока не кончится время ступени"""
+    iteration = 0
+    while time.monotonic() < deadline:
+        user_id = f"load_user_{step}_{index}"
+        session_id = f"load_session_{iteration}"
+        for label, method, path, body in dialog_script(user_id, session_id, seed=index * 1000 + iteration):
+            if time.monotonic() >= deadline:
+                return
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0  # таймаут или обрыв соединения
+            samples.append((label, time.perf_counter() - started, status))
+            if think_time:
+                await asyncio.sleep(random.uniform(0, 2 * think_time))
+        iteration += 1
+
+def summarize(concurrency: int, seconds: float, samples: List[Tuple[str, float, int]]) -> Dict[str, Any]:
+    latencies = [latency for _, latency, _ in samples]
+    errors = [status for _, _, status in samples if status == 0 or status >= 400]
+    by_status: Dict[str, int] = {}
+    for _, _, status in samples:
+        by_status[str(status)] = by_status.get(str(status), 0) + 1
+
+    endpoints = {}
+    for label in sorted({label for label, _, _ in samples}):
+        values = [latency for name, latency, _ in samples if name == label]
+        endpoints[label] = {"requests": len(values), "p50": round(percentile(values, 0.5), 3),
+                            "p95": round(percentile(values, 0.95), 3)}
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / seconds, 2) if seconds else 0.0,
+        "p50": round(percentile(latencies, 0.5), 3),
+        "p95": round(percentile(latencies, 0.95), 3),
+        "p99": round(percentile(latencies, 0.99), 3),
+        "error_rate": round(len(errors) / len(samples), 4) if samples else 0.0,
+        "statuses": by_status,
+        "endpoints": endpoints
+    }
+
+async def run_step(base_url: str, concurrency: int, step: int, duration: float,
+                   think_time: float, timeout: float) -> Dict[str, Any]:
+    samples: List[Tuple[str, float, int]] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(*(
+            virtual_user(client, index, step, deadline, think_time, samples)
+            for index in range(concurrency)
+        ))
+        # Запросы, начатые до дедлайна, дожидаются ответа - учитываем полное время
+        elapsed = time.monotonic() - started
+    return summarize(concurrency, elapsed, samples)
+
+def start_stub_server(llm_latency: float, embedding_latency: float) -> str:
+    """Сервис в фоновом потоке с заглушками LLM и эмбеддингов; возвращает базовый URL"""
+    os.environ["ANONYMIZED_TELEMETRY"] = "False"
+
+    import uvicorn
+    from src.config import settings
+    # Настройки уже прочитаны при импорте; без явного CHROMA_PERSIST_DIR - временная база
+    if "CHROMA_PERSIST_DIR" not in os.environ:
+        settings.CHROMA_PERSIST_DIR = tempfile.mkdtemp(prefix="load_test_chroma_")
+    import src.agents.learning_agent as learning_agent
+    import src.memory.vector_memory as vector_memory
+    from src.benchmarks.stubs import StubChatModel, DelayedEmbeddingFunction
+
+    learning_agent.LearningCompanionAgent._initialize_llm = lambda self: StubChatModel(latency=llm_latency)
+    vector_memory.create_embedding_function = lambda backend=None: DelayedEmbeddingFunction(embedding_latency)
+
+    from src.main import app
+    # Логи сервиса на каждый запрос заглушили бы отчет
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+def print_report(rows: List[Dict[str, Any]]):
+    print(f"{'users':>6} {'requests':>9} {'rps':>8} {'p50, с':>8} {'p95, с':>8} {'p99, с':>8} {'ошибки':>8}")
+    for row in rows:
+        print(f"{row['concurrency']:>6} {row['requests']:>9} {row['throughput_rps']:>8} {row['p50']:>8} "
+              f"{row['p95']:>8} {row['p99']:>8} {row['error_rate']:>8.2%}")
+        endpoints = ", ".join(f"{name} p95={data['p95']}с" for name, data in row["endpoints"].items())
+        statuses = ", ".join(f"{status}: {count}" for status, count in sorted(row["statuses"].items()))
+        print(f"{'':>6} {endpoints}; коды: {statuses}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API учебного ассистента")
+    parser.add_argument("--url", help="Адрес запущенного сервиса (по умолчанию - сервис в процессе с заглушками)")
+    parser.add_argument("--concurrency", default="1,5,10,25",
+                        help="Ступени числа одновременных пользователей через запятую")
+    parser.add_argument("--duration", type=float, default=20.0, help="Длительность ступени, секунд")
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="Средняя пауза пользователя между запросами, секунд")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Таймаут запроса, секунд")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="Задержка заглушки LLM на вызов, секунд")
+    parser.add_argument("--embedding-latency", type=float, default=0.05,
+                        help="Задержка заглушки эмбеддингов на вызов, секунд")
+    parser.add_argument("--json", help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    base_url = args.url or start_stub_server(args.llm_latency, args.embedding_latency)
+    rows = []
+    for step, concurrency in enumerate(int(value) for value in args.concurrency.split(",")):
+        row = asyncio.run(run_step(base_url, concurrency, step, args.duration, args.think_time, args.timeout))
+        rows.append(row)
+        print(f"ступень {concurrency}: {row['throughput_rps']} rps, p95 {row['p95']}с, ошибки {row['error_rate']:.2%}")
+
+    print()
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"base_url": base_url, "llm_latency": None if args.url else args.llm_latency,
+                       "steps": rows}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Воспроизведение записанной кассеты через агента: задержка и CPU на одном и том же трафике.
+
+Кассета записывается на реальных сессиях (CASSETTE_MODE=record, CASSETTE_PATH=...).
+Здесь сообщения из нее проходят через LearningCompanionAgent с чистой базой Chroma,
+а ответы LLM и эмбеддинги берутся из кассеты - разница между прогонами до и после
+изменения кода получается только от самого кода.
+
+Запуск: python -m src.benchmarks.replay --cassette cassettes/session.jsonl --simulate-latency
+"""
+from typing import Any, Dict, List
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+def replay(cassette_path: str, simulate_latency: bool, repeat: int) -> Dict[str, Any]:
+    os.environ["CASSETTE_MODE"] = "replay"
+    os.environ["CASSETTE_PATH"] = cassette_path
+    os.environ["CASSETTE_SIMULATE_LATENCY"] = str(simulate_latency).lower()
+    # Фоновые задачи расходуют записи кассеты в недетерминированном порядке
+    os.environ.setdefault("PROBLEM_POOL_ENABLED", "false")
+    os.environ.setdefault("INSIGHTS_ENABLED", "false")
+    os.environ["ANONYMIZED_TELEMETRY"] = "False"
+
+    from chromadb.api.client import SharedSystemClient
+    from src.agents.learning_agent import LearningCompanionAgent
+    from src.config import settings
+    # Относительный путь: база создается в рабочем каталоге прогона (см. ниже)
+    settings.CHROMA_PERSIST_DIR = "./chroma_db"
+
+    logging.getLogger().setLevel(logging.WARNING)
+    latencies: List[float] = []
+    cpu_seconds: List[float] = []
+    started_cpu = time.process_time()
+    started = time.perf_counter()
+    stats: Dict[str, Any] = {}
+    for _ in range(repeat):
+        workdir = tempfile.mkdtemp(prefix="replay_chroma_")
+        cwd = os.getcwd()
+        # База создается в ./chroma_db рабочего каталога - каждый прогон с чистой базой; Chroma
+        # кэширует клиента по строке пути, поэтому кэш сбрасывается
+        os.chdir(workdir)
+        SharedSystemClient.clear_system_cache()
+        try:
+            agent = LearningCompanionAgent()
+            for turn in agent.cassette.turns:
+                turn_started, turn_cpu = time.perf_counter(), time.process_time()
+                agent.process_message(turn["message"], turn["user_id"], turn["session_id"])
+                latencies.append(time.perf_counter() - turn_started)
+                cpu_seconds.append(time.process_time() - turn_cpu)
+            stats = agent.cassette.stats()
+            agent.shutdown()
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "cassette": cassette_path,
+        "simulate_latency": simulate_latency,
+        "turns": len(latencies),
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "cpu_seconds": round(time.process_time() - started_cpu, 3),
+        "p50": round(percentile(latencies, 0.5), 4),
+        "p95": round(percentile(latencies, 0.95), 4),
+        "cpu_per_turn_ms": round(sum(cpu_seconds) / len(cpu_seconds) * 1000, 2) if cpu_seconds else 0.0,
+        "cassette_stats": stats
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение кассеты вызовов LLM через агента")
+    parser.add_argument("--cassette", required=True, help="Файл кассеты (JSONL)")
+    parser.add_argument("--simulate-latency", action="store_true",
+                        help="Выдерживать записанную задержку каждого вызова")
+    parser.add_argument("--repeat", type=int, default=1, help="Число прогонов кассеты")
+    parser.add_argument("--json", help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    result = replay(os.path.abspath(args.cassette), args.simulate_latency, args.repeat)
+    cassette = result["cassette_stats"]
+    print(f"Сообщений: {result['turns']}, время: {result['wall_seconds']}с, CPU: {result['cpu_seconds']}с")
+    print(f"Задержка хода: p50 {result['p50']}с, p95 {result['p95']}с; CPU на ход: {result['cpu_per_turn_ms']} мс")
+    print(f"Кассета: точных совпадений {cassette.get('exact', 0)}, по порядку {cassette.get('sequential', 0)}, "
+          f"промахов {cassette.get('misses', 0)}, эмбеддингов посчитано заново {cassette.get('computed', 0)}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Бенчмарк памяти на сессию: сколько занимает LearningState активной сессии и сколько -
+компактное представление простаивающей (src.agents.session_store).
+
+Сессии синтетические, но по размеру как настоящие: реплики демо-сценария и ответы
+ассистента, контекст памяти с найденными воспоминаниями и прогрессом, история задач
+и решений. Память считается через tracemalloc - все, что выделено при создании сессий.
+
+Запуск: python -m src.benchmarks.session_memory --sessions 1000 --turns 12
+"""
+from typing import Any, Dict, List
+from datetime import datetime
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.agents.session_store import compact_state, restore_state
+from src.agents.state import LearningState
+from src.demo.demo_scenario import DEMO_DIALOG
+
+_TOPICS = ["функции", "списки", "строки", "словари", "циклы", "классы и ООП", "исключения", "рекурсия"]
+_ANSWER = ("{topic} - одна из базовых тем Python. Разберем на примере: определим функцию, "
+           "передадим ей аргументы и посмотрим, что она возвращает. Обратите внимание на "
+           "области видимости и на то, как изменяемые объекты передаются по ссылке. "
+           "Попробуйте сами: напишите функцию, которая принимает список и возвращает новый "
+           "список без повторов, сохранив порядок элементов. ")
+
+def _answer(rng: random.Random) -> str:
+    """Ответ ассистента; слова перемешаны, чтобы сжатие не выигрывало на одинаковых текстах"""
+    words = (_ANSWER.format(topic=rng.choice(_TOPICS)) * 2).split()
+    rng.shuffle(words)
+    return " ".join(words)
+
+def _memory(rng: random.Random, user_id: str, index: int) -> Dict[str, Any]:
+    topic = rng.choice(_TOPICS)
+    return {
+        "content": f"Пользователь: {rng.choice(DEMO_DIALOG)}\nАссистент: {_answer(rng)}",
+        "metadata": {
+            "user_id": user_id, "topic": topic, "learning_mode": "explanation",
+            "timestamp": datetime.now().isoformat(), "interaction_type": "learning_dialog",
+            "memory_type": "interaction", "occurrences": rng.randint(1, 3),
+            "last_seen": datetime.now().isoformat(), "message_length": 60 + index
+        },
+        "relevance_score": round(rng.random(), 4),
+        "memory_type": "interaction"
+    }
+
+def _problem(rng: random.Random, index: int) -> Dict[str, Any]:
+    topic = rng.choice(_TOPICS)
+    return {
+        "problem_statement": f"Напишите функцию по теме «{topic}»: задача {index} с примерами входа и выхода",
+        "problem_type": "code", "difficulty": rng.choice(["easy", "medium"]), "topic": topic,
+        "expected_skills": [topic, "функции"], "hints": ["Разбейте задачу на шаги", "Проверьте крайние случаи"],
+        "solution_steps": ["Разберите условие", "Напишите функцию", "Проверьте на примерах"],
+        "evaluation_criteria": {"корректность": "результат совпадает с ожидаемым"},
+        "test_cases": [{"call": "f([1, 2, 2])", "expected": "[1, 2]"}]
+    }
+
+def make_session(index: int, turns: int, memories: int) -> LearningState:
+    """Сессия после turns ходов, как ее держит агент между сообщениями"""
+    rng = random.Random(index)
+    user_id = f"user_{index}"
+    messages: List = []
+    for turn in range(turns):
+        messages.append(HumanMessage(content=DEMO_DIALOG[turn % len(DEMO_DIALOG)]))
+        messages.append(AIMessage(content=_answer(rng)))
+
+    relevant = [_memory(rng, user_id, i) for i in range(memories)]
+    problems = [_problem(rng, i) for i in range(max(1, turns // 4))]
+    solutions = [{"problem": problem, "user_solution": "def f(items):\n    return list(dict.fromkeys(items))",
+                  "evaluation": {"score": rng.randint(40, 100), "feedback": "Решение верное, но без проверки типов.",
+                                 "improvements": ["Добавьте docstring"]}} for problem in problems[:-1]]
+    progress = {
+        "topics_covered": _TOPICS[:rng.randint(2, len(_TOPICS))],
+        "total_interactions": turns * 3, "average_understanding": 3.2,
+        "problems_solved": len(solutions), "average_score": 72.5,
+        "knowledge_gaps": ["рекурсия"], "skill_progression": {"recent_scores": [60, 75, 80]}
+    }
+    return LearningState(
+        messages=messages,
+        current_response=messages[-1].content if messages else "",
+        user_id=user_id,
+        session_id=f"session_{index}",
+        current_topic=rng.choice(_TOPICS),
+        knowledge_level="beginner",
+        memory_context={"relevant_memories": relevant, "learning_progress": progress,
+                        "previous_topics": progress["topics_covered"]},
+        relevant_memories=relevant,
+        current_problem=problems[-1],
+        problem_history=problems,
+        problem_solutions=solutions,
+        skill_matrix={topic: round(rng.random(), 2) for topic in progress["topics_covered"]},
+        interaction_count=turns,
+        conversation_depth=turns,
+        problems_solved=len(solutions)
+    )
+
+def measure(sessions: int, turns: int, memories: int) -> Dict[str, Any]:
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    states = [make_session(index, turns, memories) for index in range(sessions)]
+    gc.collect()
+    live_bytes = tracemalloc.get_traced_memory()[0] - baseline
+
+    started = time.perf_counter()
+    blobs = [compact_state(state) for state in states]
+    compact_seconds = time.perf_counter() - started
+    del states
+    gc.collect()
+    compact_bytes = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for blob in blobs:
+        restore_state(blob)
+    restore_seconds = time.perf_counter() - started
+
+    live_per_session = live_bytes / sessions
+    compact_per_session = compact_bytes / sessions
+    return {
+        "sessions": sessions,
+        "turns": turns,
+        "memories": memories,
+        "live_bytes_per_session": round(live_per_session),
+        "compact_bytes_per_session": round(compact_per_session),
+        "blob_bytes_per_session": round(sum(len(blob) for blob in blobs) / sessions),
+        "reduction": round(live_per_session / compact_per_session, 1) if compact_per_session else None,
+        "live_sessions_per_gb": int(2 ** 30 / live_per_session),
+        "compact_sessions_per_gb": int(2 ** 30 / compact_per_session) if compact_per_session else None,
+        "compact_ms": round(compact_seconds / sessions * 1000, 3),
+        "restore_ms": round(restore_seconds / sessions * 1000, 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Память на сессию: LearningState против компактного вида")
+    parser.add_argument("--sessions", type=int, default=1000, help="Число синтетических сессий")
+    parser.add_argument("--turns", type=int, default=12, help="Ходов диалога в каждой сессии")
+    parser.add_argument("--memories", type=int, default=15, help="Воспоминаний в контексте памяти")
+    parser.add_argument("--json", help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    result = measure(args.sessions, args.turns, args.memories)
+    print(f"Сессий: {result['sessions']}, ходов: {result['turns']}, воспоминаний в контексте: {result['memories']}")
+    print(f"LearningState:      {result['live_bytes_per_session']:>9} байт/сессия, "
+          f"{result['live_sessions_per_gb']} сессий на ГБ")
+    print(f"Компактный вид:     {result['compact_bytes_per_session']:>9} байт/сессия, "
+          f"{result['compact_sessions_per_gb']} сессий на ГБ (сжатый JSON {result['blob_bytes_per_session']} байт)")
+    print(f"Выигрыш: x{result['reduction']}; сжатие {result['compact_ms']} мс, "
+          f"разворачивание {result['restore_ms']} мс на сессию")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
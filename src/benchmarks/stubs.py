@@ -0,0 +1,85 @@
+"""Заглушки LLM и эмбеддингов с настраиваемой задержкой для нагрузочных тестов"""
+from typing import Any, List, Optional
+import itertools
+import json
+import random
+import re
+import time
+
+from chromadb import Documents, Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.memory.embedding_function import HashingEmbeddingFunction
+
+_ANALYSIS = {
+    "topic": "python", "knowledge_level": "beginner", "learning_style": "balanced",
+    "learning_goal": "practice", "difficulty_level": 3, "emotional_tone": "curious",
+    "requires_clarification": False
+}
+_EVALUATION = {
+    "score": 75, "feedback": "Решение в целом верное.", "improvements": ["Добавьте обработку крайних случаев"],
+    "correct_solution": "def multiply(a, b):\n    return a * b", "strengths": [], "weaknesses": []
+}
+
+def _jittered(latency: float) -> float:
+    """Задержка с разбросом ±25%, как у реального API"""
+    return latency * random.uniform(0.75, 1.25)
+
+class StubChatModel(BaseChatModel):
+    """Модель, отвечающая заготовками по типу промпта после заданной задержки"""
+
+    latency: float = 0.8
+    _counter = itertools.count()
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt = messages[-1].content
+        time.sleep(_jittered(self.latency))
+        text = self._answer(prompt)
+        message = AIMessage(content=text, usage_metadata={
+            "input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4,
+            "total_tokens": (len(prompt) + len(text)) // 4
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _answer(self, prompt: str) -> str:
+        if "Проанализируй сообщение" in prompt:
+            return json.dumps(_ANALYSIS, ensure_ascii=False)
+        if "выбери оптимальный режим" in prompt:
+            return "Режим: practice\nСтудент хочет практиковаться."
+        if "Сгенерируй учебную задачу" in prompt:
+            topic = re.search(r'по теме "([^"]*)"', prompt)
+            problem_type = re.search(r"Тип задачи: (\w+)", prompt)
+            difficulty = re.search(r"Сложность: (\w+)", prompt)
+            # Уникальная формулировка: пул задач отбрасывает уже выданные
+            return json.dumps({
+                "problem_statement": f"Напишите функцию multiply(a, b) по теме "
+                                     f"«{topic.group(1) if topic else ''}» (вариант {next(self._counter)})",
+                "problem_type": problem_type.group(1) if problem_type else "code",
+                "difficulty": difficulty.group(1) if difficulty else "easy",
+                "expected_skills": ["функции"],
+                "hints": ["Используйте оператор *"],
+                "solution_steps": ["Объявите функцию", "Верните произведение"],
+                "evaluation_criteria": {"корректность": "результат совпадает с ожидаемым"},
+                "test_cases": [{"call": "multiply(2, 3)", "expected": "6"}]
+            }, ensure_ascii=False)
+        if "Оцени решение" in prompt:
+            return json.dumps(_EVALUATION, ensure_ascii=False)
+        return "Функция - именованный блок кода, который можно вызывать многократно. Попробуйте решить задачу."
+
+class DelayedEmbeddingFunction(HashingEmbeddingFunction):
+    """Локальные эмбеддинги с задержкой сетевого вызова"""
+
+    def __init__(self, latency: float = 0.05):
+        super().__init__()
+        self.latency = latency
+
+    def __call__(self, input: Documents) -> Embeddings:
+        time.sleep(_jittered(self.latency))
+        return super().__call__(input)
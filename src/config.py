@@ -8,5 +8,134 @@ class Settings:
         self.GIGACHAT_MODEL = os.getenv("GIGACHAT_MODEL", "")
         self.CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
         self.LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+        
+        # Кэш аналитики
+        self.ANALYTICS_CACHE_MAX_USERS = int(os.getenv("ANALYTICS_CACHE_MAX_USERS", "1024"))
+        
+        # Фоновый расчет матрицы навыков, пробелов и пути обучения
+        # (файл по умолчанию - insights.json в каталоге Chroma)
+        self.INSIGHTS_ENABLED = os.getenv("INSIGHTS_ENABLED", "true").lower() == "true"
+        self.INSIGHTS_INTERVAL_SECONDS = float(os.getenv("INSIGHTS_INTERVAL_SECONDS", "60"))
+        self.INSIGHTS_PATH = os.getenv("INSIGHTS_PATH", "")
+        
+        # Пул заранее сгенерированных задач
+        self.PROBLEM_POOL_ENABLED = os.getenv("PROBLEM_POOL_ENABLED", "true").lower() == "true"
+        self.PROBLEM_POOL_TARGET_DEPTH = int(os.getenv("PROBLEM_POOL_TARGET_DEPTH", "3"))
+        self.PROBLEM_POOL_REFILL_THRESHOLD = int(os.getenv("PROBLEM_POOL_REFILL_THRESHOLD", "1"))
+        self.PROBLEM_POOL_WORKERS = int(os.getenv("PROBLEM_POOL_WORKERS", "2"))
+        self.PROBLEM_POOL_MAX_KEYS = int(os.getenv("PROBLEM_POOL_MAX_KEYS", "256"))
+        
+        # Локальная проверка решений с кодом
+        self.CODE_RUNNER_ENABLED = os.getenv("CODE_RUNNER_ENABLED", "true").lower() == "true"
+        self.CODE_RUNNER_WORKERS = int(os.getenv("CODE_RUNNER_WORKERS", "4"))
+        self.CODE_RUNNER_TIMEOUT = float(os.getenv("CODE_RUNNER_TIMEOUT", "5"))
+        self.CODE_RUNNER_CPU_SECONDS = int(os.getenv("CODE_RUNNER_CPU_SECONDS", "2"))
+        self.CODE_RUNNER_MEMORY_MB = int(os.getenv("CODE_RUNNER_MEMORY_MB", "256"))
+        # Пользователь процесса решения, если сервис запущен от root (пусто - не менять)
+        self.CODE_RUNNER_USER = os.getenv("CODE_RUNNER_USER", "nobody")
+        
+        # Бюджет токенов промптов (оценка, без учета текста шаблона)
+        self.PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+        self.PROMPT_MESSAGE_MAX_TOKENS = int(os.getenv("PROMPT_MESSAGE_MAX_TOKENS", "600"))
+        self.PROMPT_MEMORIES_MAX_TOKENS = int(os.getenv("PROMPT_MEMORIES_MAX_TOKENS", "450"))
+        self.PROMPT_PROGRESS_MAX_TOKENS = int(os.getenv("PROMPT_PROGRESS_MAX_TOKENS", "150"))
+        self.PROMPT_SECTION_PRIORITY = os.getenv("PROMPT_SECTION_PRIORITY", "message,memories,progress")
+        self.MEMORY_RETRIEVAL_RESULTS = int(os.getenv("MEMORY_RETRIEVAL_RESULTS", "10"))
+        
+        # Сессии без обращений дольше порога хранятся в сжатом виде (0 - не сжимать)
+        self.SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "300"))
+        
+        # Бюджет времени на ответ (0 - без дедлайна) и запас, оставляемый под генерацию ответа
+        self.TURN_DEADLINE_SECONDS = float(os.getenv("TURN_DEADLINE_SECONDS", "20"))
+        self.TURN_RESPONSE_RESERVE_SECONDS = float(os.getenv("TURN_RESPONSE_RESERVE_SECONDS", "5"))
+        
+        # Уровни моделей: служебные цепочки (LLM_LIGHT_CHAINS; repair - починка JSON любой
+        # цепочки) идут в легкую модель с низкой температурой, остальные - в GIGACHAT_MODEL.
+        # Пустая LLM_LIGHT_MODEL - та же модель, меняется только температура
+        self.LLM_MAIN_TEMPERATURE = float(os.getenv("LLM_MAIN_TEMPERATURE", "0.7"))
+        self.LLM_LIGHT_MODEL = os.getenv("LLM_LIGHT_MODEL", "GigaChat")
+        self.LLM_LIGHT_TEMPERATURE = float(os.getenv("LLM_LIGHT_TEMPERATURE", "0.1"))
+        self.LLM_LIGHT_CHAINS = os.getenv("LLM_LIGHT_CHAINS", "analysis,mode_selection,hint,repair")
+        
+        # Планировщик вызовов GigaChat (квота провайдера и очереди)
+        self.LLM_RATE_LIMIT_RPS = float(os.getenv("LLM_RATE_LIMIT_RPS", "5"))
+        self.LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "10"))
+        self.LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+        self.LLM_MAX_QUEUE_INTERACTIVE = int(os.getenv("LLM_MAX_QUEUE_INTERACTIVE", "100"))
+        self.LLM_MAX_QUEUE_BACKGROUND = int(os.getenv("LLM_MAX_QUEUE_BACKGROUND", "50"))
+        self.LLM_MAX_QUEUE_PER_USER = int(os.getenv("LLM_MAX_QUEUE_PER_USER", "10"))
+        self.LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+        
+        # Устойчивость вызовов LLM и эмбеддингов: таймаут попытки, общий дедлайн,
+        # повторы, предохранитель, хеджирование (0 - выкл., auto - по p95 задержки) и число
+        # потоков попыток (брошенные по таймауту занимают поток, пока не завершатся)
+        self.LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "30"))
+        self.LLM_CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "60"))
+        self.LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+        self.LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+        self.LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+        self.LLM_HEDGE_DELAY = os.getenv("LLM_HEDGE_DELAY", "0")
+        self.LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "64"))
+        self.EMBEDDING_CALL_TIMEOUT = float(os.getenv("EMBEDDING_CALL_TIMEOUT", "10"))
+        self.EMBEDDING_CALL_DEADLINE = float(os.getenv("EMBEDDING_CALL_DEADLINE", "20"))
+        self.EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "2"))
+        self.EMBEDDING_BREAKER_FAILURES = int(os.getenv("EMBEDDING_BREAKER_FAILURES", "5"))
+        self.EMBEDDING_BREAKER_RESET = float(os.getenv("EMBEDDING_BREAKER_RESET", "30"))
+        self.EMBEDDING_HEDGE_DELAY = os.getenv("EMBEDDING_HEDGE_DELAY", "0")
+        self.EMBEDDING_MAX_ATTEMPTS = int(os.getenv("EMBEDDING_MAX_ATTEMPTS", "32"))
+        self.RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "0.5"))
+        self.RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "4"))
+        
+        # Кассеты вызовов LLM и эмбеддингов: record - запись в файл, replay - воспроизведение
+        # без обращения к провайдеру (с записанной задержкой, если CASSETTE_SIMULATE_LATENCY)
+        self.CASSETTE_MODE = os.getenv("CASSETTE_MODE", "")
+        self.CASSETTE_PATH = os.getenv("CASSETTE_PATH", "./cassettes/session.jsonl")
+        self.CASSETTE_SIMULATE_LATENCY = os.getenv("CASSETTE_SIMULATE_LATENCY", "false").lower() == "true"
+        
+        # Объединение одинаковых одновременных запросов к LLM и эмбеддингам
+        self.SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+        
+        # Индексы HNSW коллекций Chroma: метрика, M, ef при построении и поиске.
+        # Значения для отдельной коллекции задаются как INTERACTION_MEMORY_HNSW_EF_SEARCH и т.п.
+        self.HNSW_SPACE = os.getenv("HNSW_SPACE", "cosine")
+        self.HNSW_M = int(os.getenv("HNSW_M", "16"))
+        self.HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "100"))
+        self.HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+        
+        # Бэкенд эмбеддингов: gigachat или hashing (локально на CPU, без сети)
+        self.EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gigachat")
+        self.HASHING_EMBEDDING_DIM = int(os.getenv("HASHING_EMBEDDING_DIM", "1024"))
+        self.HASHING_EMBEDDING_NGRAM = int(os.getenv("HASHING_EMBEDDING_NGRAM", "3"))
+        
+        # Кэш векторов активных пользователей в памяти (float32 или float16)
+        self.HOT_CACHE_ENABLED = os.getenv("HOT_CACHE_ENABLED", "true").lower() == "true"
+        self.HOT_CACHE_MAX_MB = int(os.getenv("HOT_CACHE_MAX_MB", "64"))
+        self.HOT_CACHE_DTYPE = os.getenv("HOT_CACHE_DTYPE", "float32")
+        self.HOT_CACHE_MAX_USER_VECTORS = int(os.getenv("HOT_CACHE_MAX_USER_VECTORS", "20000"))
+        
+        # Дедупликация взаимодействий при записи: точные повторы - по хэшу текста,
+        # почти повторы - по близости эмбеддингов (порог релевантности 0..1)
+        self.INTERACTION_DEDUPE_ENABLED = os.getenv("INTERACTION_DEDUPE_ENABLED", "true").lower() == "true"
+        self.INTERACTION_NEAR_DUPLICATE_SCORE = float(os.getenv("INTERACTION_NEAR_DUPLICATE_SCORE", "0.97"))
+        # Сообщения короче порогов ("ок", "спасибо") в память не попадают
+        self.INTERACTION_MIN_CHARS = int(os.getenv("INTERACTION_MIN_CHARS", "8"))
+        self.INTERACTION_MIN_WORDS = int(os.getenv("INTERACTION_MIN_WORDS", "2"))
+        
+        # Админские эндпоинты (/admin/...) и профилирование запросов; пустой токен - выключено
+        self.ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+        self.PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+        # Доля запросов, профилируемых без флага (0 - только по запросу админа)
+        self.PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.PROFILER_MAX_PROFILES = int(os.getenv("PROFILER_MAX_PROFILES", "20"))
+    
+    def hnsw_config(self, collection_name: str) -> dict:
+        """Параметры HNSW для коллекции с учетом переопределений по её имени"""
+        prefix = collection_name.upper()
+        return {
+            "space": os.getenv(f"{prefix}_HNSW_SPACE", self.HNSW_SPACE),
+            "max_neighbors": int(os.getenv(f"{prefix}_HNSW_M", self.HNSW_M)),
+            "ef_construction": int(os.getenv(f"{prefix}_HNSW_EF_CONSTRUCTION", self.HNSW_EF_CONSTRUCTION)),
+            "ef_search": int(os.getenv(f"{prefix}_HNSW_EF_SEARCH", self.HNSW_EF_SEARCH))
+        }
 
 settings = Settings()
\ No newline at end of file
@@ -6,6 +6,20 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Диалог демо-сценария (используется и нагрузочным тестом)
+DEMO_DIALOG = [
+    "Привет! Я хочу изучить Python и попрактиковаться в решении задач",
+    "Объясни, что такое функции в Python",
+    "Дай мне задачу на создание функции",
+    "Вот моё решение: def multiply(a, b): return a * b",
+    "Сгенерируй задачу посложнее на работу со списками",
+    "Покажи похожие задачи, которые я уже решал",
+    "Хочу задачу на обработку строк",
+    "Моё решение: def count_vowels(text): return sum(1 for char in text if char in 'aeiou')",
+    "Какой у меня прогресс в изучении Python?",
+    "Давай углубимся в тему классов и ООП"
+]
+
 def run_enhanced_learning_demo():
     """Демонстрационный сценарий обучения Python с решением задач"""
     
@@ -17,18 +31,7 @@ def run_enhanced_learning_demo():
     agent = LearningCompanionAgent()
     
     # Демонстрационный диалог с акцентом на решение задач
-    demo_dialog = [
-        "Привет! Я хочу изучить Python и попрактиковаться в решении задач",
-        "Объясни, что такое функции в Python",
-        "Дай мне задачу на создание функции",
-        "Вот моё решение: def multiply(a, b): return a * b",
-        "Сгенерируй задачу посложнее на работу со списками",
-        "Покажи похожие задачи, которые я уже решал",
-        "Хочу задачу на обработку строк",
-        "Моё решение: def count_vowels(text): return sum(1 for char in text if char in 'aeiou')",
-        "Какой у меня прогресс в изучении Python?",
-        "Давай углубимся в тему классов и ООП"
-    ]
+    demo_dialog = DEMO_DIALOG
     
     user_id = "demo_user_enhanced"
     session_id = "python_course_with_problems"
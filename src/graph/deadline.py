@@ -0,0 +1,51 @@
+from typing import List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+
+class TurnDeadline:
+    """Бюджет времени на обработку одного сообщения.
+
+    Узлы графа сверяются с остатком бюджета и при нехватке времени упрощают работу
+    (пропускают поиск в памяти, берут анализ прошлого хода, откладывают запись),
+    чтобы ответ пришел вовремя, пусть и с меньшим контекстом.
+    """
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.degradations: List[str] = []
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        return self.budget - self.elapsed()
+
+    def allows(self, seconds: float) -> bool:
+        return self.remaining() >= seconds
+
+    def degrade(self, what: str):
+        self.degradations.append(what)
+
+    def reserve(self, seconds: float) -> "TurnDeadline":
+        """Дедлайн для необязательной работы: тот же ход, но seconds в конце остаются
+        за ответом. Деградации записываются в общий список хода"""
+        view = TurnDeadline(self.budget - seconds)
+        view.started = self.started
+        view.degradations = self.degradations
+        return view
+
+_turn_deadline: ContextVar[Optional[TurnDeadline]] = ContextVar("turn_deadline", default=None)
+
+@contextmanager
+def turn_deadline(deadline: TurnDeadline):
+    """Дедлайн для всех узлов графа внутри блока"""
+    token = _turn_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _turn_deadline.reset(token)
+
+def current_turn_deadline() -> Optional[TurnDeadline]:
+    return _turn_deadline.get()
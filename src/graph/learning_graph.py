@@ -1,21 +1,58 @@
-from langgraph.graph import StateGraph, END
-from typing import Dict, Any, List
+from langgraph.graph import StateGraph, START, END
+from typing import Dict, Any, List, Callable, Optional
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import copy_context
+import threading
 import logging
-from src.agents.state import LearningState
+import time
+from src.agents.state import LearningState, ProblemType, ProblemDifficulty
+from src.graph import router
+from src.graph.deadline import TurnDeadline, turn_deadline, current_turn_deadline
 from src.memory.vector_memory import VectorMemory
+from src.memory.embedding_context import EmbeddingContext, embedding_context
 from src.agents.problem_solver import ProblemSolver
-import json
-import re
+from src.llm.schemas import ContextAnalysis
+from src.llm.structured_output import StructuredOutputParser
+from src.llm.invoker import ChainInvoker
+from src.llm.resilience import CallTimeoutError
+from src.llm.token_budget import PromptBudget, PromptSection
+from src.config import settings
 
 logger = logging.getLogger(__name__)
 
 class LearningGraph:
     """Граф обработки диалога обучения"""
     
-    def __init__(self, memory: VectorMemory, llm):
+    # Балл, начиная с которого задача считается решенной и снимается с пользователя
+    SOLVED_SCORE = 60
+    # Ответ, если генерация не уложилась в дедлайн хода
+    DEADLINE_RESPONSE = ("Не успеваю подготовить полный ответ - сервис сейчас перегружен. "
+                         "Повторите вопрос чуть позже или сформулируйте его короче.")
+    
+    def __init__(self, memory: VectorMemory, llm, invoker: ChainInvoker = None,
+                 problem_source: Optional[Callable[..., Dict[str, Any]]] = None):
         self.memory = memory
         self.llm = llm
-        self.problem_solver = ProblemSolver(llm)
+        self.invoker = invoker or ChainInvoker()
+        self.prompt_budget = PromptBudget.from_settings(settings)
+        self.structured_output = StructuredOutputParser(llm, self.invoker)
+        self.problem_solver = ProblemSolver(llm, structured_output=self.structured_output,
+                                            invoker=self.invoker)
+        # Источник задач для ветки generate_problem (агент подставляет пул задач)
+        self.problem_source = problem_source or self._solver_problem
+        self._stats_lock = threading.Lock()
+        self._routes = Counter()
+        self._degradations = Counter()
+        self._turns = 0
+        self._degraded_turns = 0
+        # Эмбеддинги, посчитанные и взятые повторно внутри хода
+        self._embeddings = Counter()
+        # Сглаженная длительность узлов - по ней решаем, успеет ли узел до дедлайна
+        self._node_seconds: Dict[str, float] = {}
+        # Отложенная запись в память для ходов, не укладывающихся в дедлайн
+        self._deferred_writes = ThreadPoolExecutor(max_workers=1, thread_name_prefix="deferred-memory")
         self.graph = self._build_graph()
         
         # Создаем LCEL цепочки
@@ -56,7 +93,7 @@ class LearningGraph:
                 "requires_clarification": true/false
             }}
             """)
-            | self.llm
+            | self.invoker.model("analysis", self.llm)
             | StrOutputParser()
         )
         
@@ -82,7 +119,7 @@ class LearningGraph:
             Выбери один режим и кратко обоснуй выбор.
             Формат: Режим: [режим]
             """)
-            | self.llm
+            | self.invoker.model("mode_selection", self.llm)
             | StrOutputParser()
         )
         
@@ -117,7 +154,7 @@ class LearningGraph:
             Будь точным, поддерживающим и педагогически эффективным.
             Ответ должен быть на русском языке.
             """)
-            | self.llm
+            | self.invoker.model("response_generation", self.llm)
             | StrOutputParser()
         )
     
@@ -126,14 +163,29 @@ class LearningGraph:
         workflow = StateGraph(LearningState)
         
         # Добавление узлов
-        workflow.add_node("analyze_context", self.analyze_context)
-        workflow.add_node("retrieve_memory", self.retrieve_memory)
-        workflow.add_node("select_mode", self.select_mode)
-        workflow.add_node("generate_response", self.generate_response)
-        workflow.add_node("update_memory", self.update_memory)
-        
-        # Определение потока выполнения
-        workflow.set_entry_point("analyze_context")
+        for name, node in [
+            ("analyze_context", self.analyze_context),
+            ("retrieve_memory", self.retrieve_memory),
+            ("select_mode", self.select_mode),
+            ("generate_response", self.generate_response),
+            ("update_memory", self.update_memory),
+            ("greet", self.greet),
+            ("generate_problem", self.generate_problem),
+            ("evaluate_solution", self.evaluate_solution)
+        ]:
+            workflow.add_node(name, self._timed(name, node))
+        
+        # Определение потока выполнения: специализированные запросы обходят
+        # анализ, выбор режима и генерацию ответа (один вызов LLM вместо трех)
+        workflow.add_conditional_edges(START, self.route_message, {
+            router.GREETING: "greet",
+            router.PROBLEM_REQUEST: "generate_problem",
+            router.SOLUTION_SUBMISSION: "evaluate_solution",
+            router.GENERAL: "analyze_context"
+        })
+        workflow.add_edge("greet", END)
+        workflow.add_edge("generate_problem", "update_memory")
+        workflow.add_edge("evaluate_solution", "update_memory")
         workflow.add_edge("analyze_context", "retrieve_memory")
         workflow.add_edge("retrieve_memory", "select_mode")
         workflow.add_edge("select_mode", "generate_response")
@@ -149,6 +201,203 @@ class LearningGraph:
 
         return app
     
+    def _timed(self, name: str, node: Callable[[LearningState], Dict[str, Any]]):
+        """Замер длительности узла; пропущенные из-за дедлайна запуски оценку не занижают"""
+        def run(state: LearningState) -> Dict[str, Any]:
+            deadline = current_turn_deadline()
+            degradations = len(deadline.degradations) if deadline else 0
+            started = time.monotonic()
+            result = node(state)
+            if deadline is None or len(deadline.degradations) == degradations:
+                seconds = time.monotonic() - started
+                with self._stats_lock:
+                    previous = self._node_seconds.get(name)
+                    self._node_seconds[name] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+            return result
+        return run
+    
+    def _can_afford(self, node: str) -> bool:
+        """Успеет ли необязательный узел, оставив время на генерацию ответа"""
+        deadline = current_turn_deadline()
+        if deadline is None:
+            return True
+        with self._stats_lock:
+            estimate = self._node_seconds.get(node, 0.0)
+        return deadline.allows(estimate + self._response_reserve())
+    
+    def _response_reserve(self) -> float:
+        with self._stats_lock:
+            return max(self._node_seconds.get("generate_response", 0.0), settings.TURN_RESPONSE_RESERVE_SECONDS)
+    
+    @contextmanager
+    def _optional_work(self):
+        """Вызовы необязательного узла не заходят в резерв времени на ответ"""
+        deadline = current_turn_deadline()
+        if deadline is None:
+            yield
+            return
+        with turn_deadline(deadline.reserve(self._response_reserve())):
+            yield
+    
+    def _degrade(self, what: str):
+        deadline = current_turn_deadline()
+        deadline.degrade(what)
+        logger.warning(f"Дедлайн хода: {what} (осталось {deadline.remaining():.1f}с)")
+    
+    def route_message(self, state: LearningState) -> str:
+        """Выбор ветки графа по последнему сообщению"""
+        route = router.classify_message(state.messages[-1].content, state) if state.messages else router.GENERAL
+        with self._stats_lock:
+            self._routes[route] += 1
+        logger.info(f"Маршрут сообщения: {route}")
+        return route
+    
+    def greet(self, state: LearningState) -> Dict[str, Any]:
+        """Ответ на приветствие без вызова LLM"""
+        if state.current_problem:
+            response = ("Привет! У вас есть нерешенная задача:\n\n"
+                        f"{state.current_problem.get('problem_statement', '')}\n\n"
+                        "Пришлите решение сообщением «Моё решение: ...» или попросите новую задачу.")
+        elif state.current_topic:
+            response = (f"Привет! В прошлый раз мы разбирали тему «{state.current_topic}». "
+                        "Продолжим или возьмем задачу для практики?")
+        else:
+            response = ("Привет! Я ваш персональный учебный ассистент. "
+                        "Расскажите, что хотите изучить, или попросите задачу для практики.")
+        return {**state.model_dump(), "current_response": response, "needs_memory_update": False}
+    
+    def _solver_problem(self, topic: str, problem_type: ProblemType, difficulty: ProblemDifficulty,
+                        knowledge_level: str, user_id: str = None) -> Dict[str, Any]:
+        return self.problem_solver.generate_problem(
+            topic=topic,
+            knowledge_level=knowledge_level,
+            problem_type=problem_type,
+            difficulty=difficulty
+        )
+    
+    def generate_problem(self, state: LearningState) -> Dict[str, Any]:
+        """Выдача задачи по просьбе из диалога"""
+        logger.info("Генерирую задачу...")
+        message = state.messages[-1].content
+        topic = router.extract_problem_topic(message, state)
+        problem_type = router.choose_problem_type(message, topic, state)
+        difficulty = router.choose_difficulty(message, state)
+        
+        try:
+            problem = self.problem_source(topic, problem_type, difficulty, state.knowledge_level, state.user_id)
+        except Exception as e:
+            logger.error(f"Ошибка генерации задачи: {e}")
+            return {
+                **state.model_dump(),
+                "current_response": "Не получилось подобрать задачу. Попробуйте еще раз чуть позже.",
+                "needs_memory_update": False
+            }
+        
+        problem = {**problem, "topic": topic}
+        return {
+            **state.model_dump(),
+            "current_topic": topic,
+            "current_problem": problem,
+            "is_solving_problem": True,
+            "problem_history": state.problem_history + [problem],
+            "learning_mode": "practice",
+            "current_response": self._format_problem(problem),
+            "needs_memory_update": True,
+            "interaction_count": state.interaction_count + 1
+        }
+    
+    def _format_problem(self, problem: Dict[str, Any]) -> str:
+        lines = [
+            f"Задача по теме «{problem.get('topic', '')}» (сложность: {problem.get('difficulty', '')}):",
+            "",
+            problem.get("problem_statement", "")
+        ]
+        test_cases = problem.get("test_cases") or []
+        if test_cases:
+            example = test_cases[0]
+            lines += ["", f"Пример: {example.get('call', '')} -> {example.get('expected', '')}"]
+        lines += ["", "Когда будете готовы, пришлите решение сообщением «Моё решение: ...»."]
+        return "\n".join(lines)
+    
+    def evaluate_solution(self, state: LearningState) -> Dict[str, Any]:
+        """Проверка присланного решения текущей задачи"""
+        logger.info("Проверяю решение...")
+        problem = state.current_problem
+        user_solution = state.messages[-1].content
+        topic = problem.get("topic") or state.current_topic
+        
+        try:
+            solution = self.problem_solver.evaluate_solution(
+                problem=problem,
+                user_solution=user_solution,
+                topic=topic,
+                knowledge_level=state.knowledge_level
+            )
+        except Exception as e:
+            logger.error(f"Ошибка проверки решения: {e}")
+            return {
+                **state.model_dump(),
+                "current_response": "Не получилось проверить решение. Попробуйте отправить его еще раз.",
+                "needs_memory_update": False
+            }
+        
+        solved = solution.score >= self.SOLVED_SCORE
+        problems_solved = state.problems_solved + 1
+        average_score = (state.average_score * state.problems_solved + solution.score) / problems_solved
+        
+        try:
+            self.memory.store_solution(state.user_id, {
+                "problem_statement": solution.problem_statement,
+                "user_solution": user_solution,
+                "score": solution.score,
+                "topic": topic,
+                "problem_type": problem.get("problem_type", ""),
+                "difficulty": problem.get("difficulty", "easy")
+            })
+            # Уровень понимания темы по шкале 1-5 из балла за решение
+            self.memory.update_knowledge_states(state.user_id, [
+                (topic, max(1, min(5, round(solution.score / 20))), 1 if solved else 0)
+            ])
+        except Exception as e:
+            logger.error(f"Ошибка сохранения решения: {e}")
+        
+        return {
+            **state.model_dump(),
+            "current_topic": topic,
+            "current_problem": None if solved else problem,
+            "is_solving_problem": not solved,
+            "problem_solutions": state.problem_solutions + [solution.model_dump()],
+            "problems_solved": problems_solved,
+            "average_score": round(average_score, 2),
+            "learning_mode": "assessment",
+            "current_response": self._format_evaluation(solution, solved),
+            "needs_memory_update": True,
+            "interaction_count": state.interaction_count + 1
+        }
+    
+    def _format_evaluation(self, solution, solved: bool) -> str:
+        lines = [f"Оценка: {solution.score:.0f}/100", "", solution.feedback]
+        if solution.improvements:
+            lines += ["", "Что можно улучшить:"] + [f"- {item}" for item in solution.improvements]
+        if solved:
+            lines += ["", "Задача решена! Попросите следующую, когда будете готовы."]
+        else:
+            lines += ["", "Попробуйте исправить решение и отправить его снова."]
+        return "\n".join(lines)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Ветки графа, упрощения по дедлайну и сглаженная длительность узлов"""
+        with self._stats_lock:
+            return {
+                "routes": dict(self._routes),
+                "turns": self._turns,
+                "degraded_turns": self._degraded_turns,
+                "degraded_rate": self._degraded_turns / self._turns if self._turns else 0.0,
+                "degradations": dict(self._degradations),
+                "embeddings": dict(self._embeddings),
+                "node_seconds": {name: round(seconds, 3) for name, seconds in self._node_seconds.items()}
+            }
+    
     def analyze_context(self, state: LearningState) -> Dict[str, Any]:
         """Анализ контекста диалога"""
         logger.info("Анализирую контекст обучения...")
@@ -156,22 +405,31 @@ class LearningGraph:
         if not state.messages:
             return state.model_dump()
         
+        if not self._can_afford("analyze_context"):
+            # Не успеваем - остаемся с анализом прошлого хода (или значениями по умолчанию)
+            self._degrade("analysis_reused" if state.current_topic else "analysis_skipped")
+            return state.model_dump()
+        
         last_message = state.messages[-1]
         
         try:
             # Используем LCEL цепочку для анализа
-            analysis_result = self.analysis_chain.invoke({
-                "message": last_message.content
-            })
+            sections = self.prompt_budget.allocate("analysis", [
+                PromptSection("message", text=last_message.content)
+            ])
+            with self._optional_work():
+                analysis_result = self.invoker.invoke("analysis", self.analysis_chain, {
+                    "message": sections["message"]
+                })
 
-            print("-----analysis_result-------")
-            print(analysis_result)
-            
-            # Парсинг JSON ответа
-            json_match = re.search(r'\{.*\}', analysis_result, re.DOTALL)
+                print("-----analysis_result-------")
+                print(analysis_result)
+                
+                # Разбор и валидация JSON ответа по схеме
+                analysis = self.structured_output.parse("analysis", analysis_result, ContextAnalysis)
 
-            if json_match:
-                analysis_data = json.loads(json_match.group())
+            if analysis:
+                analysis_data = analysis.model_dump()
             else:
                 analysis_data = self._parse_analysis_fallback(analysis_result)
             
@@ -224,6 +482,10 @@ class LearningGraph:
         if not state.messages:
             return state.model_dump()
         
+        if not self._can_afford("retrieve_memory"):
+            self._degrade("memory_skipped")
+            return state.model_dump()
+        
         last_message = state.messages[-1].content
         user_id = state.user_id
         
@@ -232,14 +494,15 @@ class LearningGraph:
 
         try:
             # Поиск в долгосрочной памяти
-            relevant_memories = self.memory.retrieve_relevant_memories(
-                user_id=user_id,
-                query=last_message,
-                n_results=15
-            )
+            with self._optional_work():
+                relevant_memories = self.memory.retrieve_relevant_memories(
+                    user_id=user_id,
+                    query=last_message,
+                    n_results=settings.MEMORY_RETRIEVAL_RESULTS
+                )
 
-            # Получение прогресса обучения
-            learning_progress = self.memory.get_learning_progress(user_id)
+            # Получение прогресса обучения (из кэша аналитики)
+            learning_progress, _ = self.memory.get_cached_learning_progress(user_id)
             
             memory_context = {
                 "relevant_memories": relevant_memories,
@@ -261,20 +524,26 @@ class LearningGraph:
         """Выбор режима обучения на основе контекста с использованием LCEL"""
         logger.info("Выбираю режим обучения...")
         
+        if not self._can_afford("select_mode"):
+            self._degrade("mode_reused")
+            return state.model_dump()
+        
         try:
-            # Подготавливаем данные для цепочки
+            # Подготавливаем данные для цепочки в пределах бюджета токенов
+            sections = self.prompt_budget.allocate("mode_selection", [
+                self._memories_section(state.memory_context.get("relevant_memories", []))
+            ])
             chain_input = {
                 "topic": state.current_topic,
                 "knowledge_level": state.knowledge_level,
                 "learning_style": state.learning_style,
                 "conversation_depth": state.conversation_depth,
-                "relevant_memories": self._format_memories_for_prompt(
-                    state.memory_context.get("relevant_memories", [])
-                )
+                "relevant_memories": sections["memories"]
             }
             
             # Используем LCEL цепочку для выбора режима
-            mode_result = self.mode_selection_chain.invoke(chain_input)
+            with self._optional_work():
+                mode_result = self.invoker.invoke("mode_selection", self.mode_selection_chain, chain_input)
             
             # Определение режима обучения
             learning_mode = "explanation"  # режим по умолчанию
@@ -301,24 +570,28 @@ class LearningGraph:
         last_message = state.messages[-1]
         
         try:
-            # Подготавливаем данные для цепочки генерации ответа
+            # Подготавливаем данные для цепочки генерации ответа в пределах бюджета токенов
+            sections = self.prompt_budget.allocate("response_generation", [
+                PromptSection("message", text=last_message.content),
+                self._memories_section(state.memory_context.get("relevant_memories", [])),
+                PromptSection(
+                    "progress",
+                    text=self._format_progress_for_prompt(state.memory_context.get("learning_progress", {}))
+                )
+            ])
             chain_input = {
-                "message": last_message.content,
+                "message": sections["message"],
                 "topic": state.current_topic,
                 "knowledge_level": state.knowledge_level,
                 "learning_style": state.learning_style,
                 "learning_mode": getattr(state, 'learning_mode', 'explanation'),
                 "difficulty_level": getattr(state, 'difficulty_level', 3),
-                "relevant_memories": self._format_memories_for_prompt(
-                    state.memory_context.get("relevant_memories", [])
-                ),
-                "learning_progress": self._format_progress_for_prompt(
-                    state.memory_context.get("learning_progress", {})
-                )
+                "relevant_memories": sections["memories"],
+                "learning_progress": sections["progress"]
             }
             
             # Используем LCEL цепочку для генерации ответа
-            response = self.response_generation_chain.invoke(chain_input)
+            response = self.invoker.invoke("response_generation", self.response_generation_chain, chain_input)
             
             logger.info("Ответ сгенерирован успешно")
             return {
@@ -329,6 +602,15 @@ class LearningGraph:
             }
             
         except Exception as e:
+            deadline = current_turn_deadline()
+            if isinstance(e, CallTimeoutError) and deadline is not None and deadline.remaining() <= 0:
+                # Дедлайн хода исчерпан - повторов не будет, отвечаем сразу
+                self._degrade("response_fallback")
+                return {
+                    **state.model_dump(),
+                    "current_response": self.DEADLINE_RESPONSE,
+                    "needs_memory_update": False
+                }
             logger.error(f"Ошибка генерации ответа: {e}")
             return {
                 **state.model_dump(),
@@ -341,47 +623,53 @@ class LearningGraph:
         logger.info("Обновляю память...")
         
         if state.needs_memory_update and state.messages:
-            try:
-                last_message = state.messages[-1]
-                
-                # Сохранение взаимодействия
-                self.memory.store_interaction(
-                    user_id=state.user_id,
-                    session_id=state.session_id,
-                    message=last_message,
-                    topic=state.current_topic,
-                    knowledge_level=state.knowledge_level,
-                    learning_style=state.learning_style,
-                    metadata={
-                        "learning_mode": state.learning_mode,
-                        "difficulty_level": state.difficulty_level,
-                        "interaction_count": state.interaction_count,
-                        "teaching_strategy": getattr(state, 'teaching_strategy', '')
-                    }
-                )
-                
-                logger.info("Память успешно обновлена")
-                
-            except Exception as e:
-                logger.error(f"Ошибка обновления памяти: {e}")
+            deadline = current_turn_deadline()
+            with self._stats_lock:
+                estimate = self._node_seconds.get("update_memory", 0.0)
+            if deadline is not None and not deadline.allows(estimate):
+                # Ответ важнее: запись уходит в фоновый поток после возврата ответа
+                self._degrade("memory_deferred")
+                # copy_context - чтобы отложенная запись взяла эмбеддинг, посчитанный при поиске
+                self._deferred_writes.submit(copy_context().run, self._store_interaction, state.model_copy())
+            else:
+                self._store_interaction(state)
         
         return {**state.model_dump(), "needs_memory_update": False}
     
-    def _format_memories_for_prompt(self, memories: List[Dict]) -> str:
-        """Форматирование воспоминаний для промпта"""
-        if not memories:
-            return "Нет релевантных воспоминаний"
-        
-        print("Воспоминания ...")
-        print(memories)
-
-        formatted = []
-        for i, memory in enumerate(memories[:5], 1):  # Берем только 5 самых релевантных
-            content = memory.get('content', '')[:300]  # Обрезаем длинный текст
+    def _store_interaction(self, state: LearningState):
+        try:
+            last_message = state.messages[-1]
+            
+            # Сохранение взаимодействия
+            self.memory.store_interaction(
+                user_id=state.user_id,
+                session_id=state.session_id,
+                message=last_message,
+                topic=state.current_topic,
+                knowledge_level=state.knowledge_level,
+                learning_style=state.learning_style,
+                metadata={
+                    "learning_mode": state.learning_mode,
+                    "difficulty_level": state.difficulty_level,
+                    "interaction_count": state.interaction_count,
+                    "teaching_strategy": getattr(state, 'teaching_strategy', '')
+                }
+            )
+            
+            logger.info("Память успешно обновлена")
+            
+        except Exception as e:
+            logger.error(f"Ошибка обновления памяти: {e}")
+    
+    def _memories_section(self, memories: List[Dict]) -> PromptSection:
+        """Секция воспоминаний: элементы по убыванию релевантности, сколько влезет в бюджет"""
+        items = []
+        for i, memory in enumerate(memories, 1):
+            content = memory.get('content', '')[:300]  # Один элемент не должен занять весь бюджет
             score = memory.get('relevance_score', 0)
-            formatted.append(f"{i}. {content} (релевантность: {score:.2f})")
+            items.append(f"{i}. {content} (релевантность: {score:.2f})")
         
-        return "\n".join(formatted)
+        return PromptSection("memories", items=items, empty_text="Нет релевантных воспоминаний")
     
     def _format_progress_for_prompt(self, progress: Dict) -> str:
         """Форматирование прогресса для промпта"""
@@ -404,6 +692,39 @@ class LearningGraph:
         """
     
     def process(self, state: LearningState) -> LearningState:
-        """Обработка состояния через граф"""
-        result = self.graph.invoke(state)
-        return LearningState(**result)
\ No newline at end of file
+        """Обработка состояния через граф в пределах дедлайна хода.
+        
+        Эмбеддинги внутри хода общие: сообщение, по которому искали воспоминания,
+        при записи в память повторно не эмбеддится.
+        """
+        embeddings = EmbeddingContext()
+        deadline = current_turn_deadline()
+        if deadline is None and settings.TURN_DEADLINE_SECONDS > 0:
+            deadline = TurnDeadline(settings.TURN_DEADLINE_SECONDS)
+        if deadline is None:
+            with embedding_context(embeddings):
+                result = self.graph.invoke(state)
+            self._count_embeddings(embeddings)
+            return LearningState(**result)
+        
+        with turn_deadline(deadline), embedding_context(embeddings):
+            result = self.graph.invoke(state)
+        
+        self._count_embeddings(embeddings)
+        with self._stats_lock:
+            self._turns += 1
+            if deadline.degradations:
+                self._degraded_turns += 1
+                self._degradations.update(deadline.degradations)
+        if deadline.degradations:
+            logger.warning(f"Ход упрощен ради дедлайна ({deadline.elapsed():.1f}с): {', '.join(deadline.degradations)}")
+        return LearningState(**result)
+    
+    def _count_embeddings(self, embeddings: EmbeddingContext):
+        with self._stats_lock:
+            self._embeddings["computed"] += embeddings.computed
+            self._embeddings["reused"] += embeddings.reused
+    
+    def shutdown(self):
+        """Дожидаемся отложенных записей в память"""
+        self._deferred_writes.shutdown(wait=True)
\ No newline at end of file
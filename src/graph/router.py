@@ -0,0 +1,111 @@
+from typing import Optional
+import re
+
+from src.agents.state import LearningState, ProblemType, ProblemDifficulty
+
+# Намерения сообщения, по которым граф выбирает ветку
+GREETING = "greeting"
+PROBLEM_REQUEST = "problem_request"
+SOLUTION_SUBMISSION = "solution_submission"
+GENERAL = "general"
+
+# Приветствие - только из этих слов (или "добрый день" и т.п.); общие слова вроде
+# "еще раз" или "снова" сами по себе приветствием не считаются
+_GREETING_WORDS = {
+    "привет", "приветик", "здравствуй", "здравствуйте", "хай", "hi", "hello", "hey", "салют", "ку"
+}
+_TIME_GREETING_RE = re.compile(r"^добр(ый|ое|ого)\s+(день|дня|вечер|вечера|утро|утра)$")
+
+# Просьба о задаче: глагол просьбы, между ним и "задач..." - только уточнения вроде
+# "мне еще одну"; "давай разберем задачу" или "дай подсказку к задаче" сюда не попадают
+_PROBLEM_REQUEST_RE = re.compile(
+    r"\b(дай|дайте|сгенерируй|сгенерируйте|придумай|придумайте|предложи|предложите|подкинь|подкиньте)"
+    r"(\s+(мне|нам|еще|ещё|одну|новую|другую|следующую|какую-нибудь|простую|сложную|"
+    r"посложнее|попроще|полегче|интересную)){0,3}\s+задач",
+    re.IGNORECASE
+)
+_PROBLEM_TOPIC_RE = re.compile(
+    r"задач\w*(?:\s+(?:посложнее|попроще|полегче|сложнее|проще))?\s+(?:на|по)\s+(?:тем[еуы]\s+)?(.+)$",
+    re.IGNORECASE
+)
+_HARDER_RE = re.compile(r"посложнее|сложнее|труднее|сложн", re.IGNORECASE)
+_EASIER_RE = re.compile(r"попроще|полегче|проще|легче|легк", re.IGNORECASE)
+_CODE_RE = re.compile(
+    r"код|функци|программ|списк|строк|словар|алгоритм|класс|цикл|python|питон",
+    re.IGNORECASE
+)
+
+# Решение при активной задаче: явная пометка или код. Код внутри вопроса
+# ("почему def f(x) не работает?") - это вопрос, а не решение на оценку
+_SOLUTION_MARK_RE = re.compile(
+    r"(мо[её]|вот|держи)\s+решени|^\s*решение\s*:|^\s*ответ\s*:",
+    re.IGNORECASE
+)
+_CODE_BLOCK_RE = re.compile(r"```|\bdef\s+\w+\s*\(")
+_QUESTION_RE = re.compile(r"\?|\b(почему|зачем|объясни)", re.IGNORECASE)
+
+_DIFFICULTY_ORDER = [ProblemDifficulty.EASY, ProblemDifficulty.MEDIUM,
+                     ProblemDifficulty.HARD, ProblemDifficulty.EXPERT]
+_LEVEL_DIFFICULTY = {
+    "beginner": ProblemDifficulty.EASY,
+    "intermediate": ProblemDifficulty.MEDIUM,
+    "advanced": ProblemDifficulty.HARD
+}
+
+def classify_message(message: str, state: LearningState) -> str:
+    """Определение намерения по правилам, без вызова LLM"""
+    text = message.strip()
+
+    if state.current_problem and (
+        _SOLUTION_MARK_RE.search(text) or (_CODE_BLOCK_RE.search(text) and not _QUESTION_RE.search(text))
+    ):
+        return SOLUTION_SUBMISSION
+
+    if _PROBLEM_REQUEST_RE.search(text):
+        return PROBLEM_REQUEST
+
+    if _is_greeting(text):
+        return GREETING
+
+    return GENERAL
+
+def _is_greeting(text: str) -> bool:
+    """Короткое сообщение из слов приветствия и/или "добрый день" ("Привет", "Добрый вечер!")"""
+    words = re.findall(r"\w+", text.lower())
+    if not words or len(words) > 4:
+        return False
+    rest = " ".join(word for word in words if word not in _GREETING_WORDS)
+    return not rest or bool(_TIME_GREETING_RE.match(rest))
+
+def extract_problem_topic(message: str, state: LearningState) -> str:
+    """Тема задачи из сообщения ("задачу на работу со списками"), иначе - текущая тема"""
+    match = _PROBLEM_TOPIC_RE.search(message.strip())
+    if match:
+        topic = match.group(1).strip(" .,!?")
+        if topic:
+            return topic
+    return state.current_topic or "программирование"
+
+def choose_problem_type(message: str, topic: str, state: LearningState) -> ProblemType:
+    """Задачи по программированию - с кодом (их можно проверить автотестами)"""
+    if _CODE_RE.search(message) or _CODE_RE.search(topic) or _CODE_RE.search(state.current_topic):
+        return ProblemType.CODE
+    return ProblemType.PRACTICAL
+
+def choose_difficulty(message: str, state: LearningState) -> ProblemDifficulty:
+    """Сложность по уровню знаний со сдвигом "посложнее"/"попроще" от прошлой задачи"""
+    base: Optional[ProblemDifficulty] = None
+    if state.problem_history:
+        try:
+            base = ProblemDifficulty(state.problem_history[-1].get("difficulty", ""))
+        except ValueError:
+            base = None
+    if base is None:
+        base = _LEVEL_DIFFICULTY.get(state.knowledge_level, ProblemDifficulty.EASY)
+
+    index = _DIFFICULTY_ORDER.index(base)
+    if _HARDER_RE.search(message):
+        index = min(index + 1, len(_DIFFICULTY_ORDER) - 1)
+    elif _EASIER_RE.search(message):
+        index = max(index - 1, 0)
+    return _DIFFICULTY_ORDER[index]
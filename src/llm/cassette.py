@@ -0,0 +1,199 @@
+"""Запись и воспроизведение вызовов LLM и эмбеддингов (кассеты).
+
+В режиме record каждый вызов цепочки и эмбеддингов (вход, результат, время) и каждое
+сообщение пользователя дописываются в JSONL-файл. В режиме replay вызовы к провайдеру
+не уходят: результат берется из кассеты, при желании с записанной задержкой. Так
+изменения промптов и графа сравниваются по CPU и задержке на одном и том же трафике
+(см. src/benchmarks/replay.py).
+
+Запись ищется по точному входу; если вход изменился (например, поменялся промпт),
+берется следующая по порядку неиспользованная запись той же цепочки. Эмбеддинги
+отдаются только по точному входу: чужой вектор испортил бы поиск и дедупликацию, поэтому
+при промахе они считаются локально бэкендом записи (если он работает без сети).
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import defaultdict, deque
+from datetime import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+
+from chromadb import Documents, EmbeddingFunction, Embeddings
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RECORD = "record"
+REPLAY = "replay"
+
+class CassetteMiss(LookupError):
+    """В кассете нет записи для вызова"""
+
+def _key(kind: str, name: str, payload: Any) -> str:
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(f"{kind}:{name}:{data}".encode("utf-8")).hexdigest()
+
+class Cassette:
+    """Файл кассеты в режиме записи или воспроизведения"""
+
+    def __init__(self, path: str, mode: str, simulate_latency: bool = False):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Неизвестный режим кассеты: {mode}")
+        self.path = path
+        self.mode = mode
+        self.simulate_latency = simulate_latency
+        self.embedding_backend: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stats = {"recorded": 0, "exact": 0, "sequential": 0, "misses": 0, "computed": 0}
+        # Воспроизведение: записи по ключу и по порядку внутри цепочки
+        self._by_key: Dict[str, deque] = defaultdict(deque)
+        self._by_name: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+        self._cursors: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._used: set = set()
+        self.turns: List[Dict[str, Any]] = []
+        if mode == REPLAY:
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["Cassette"]:
+        if not settings.CASSETTE_MODE:
+            return None
+        return cls(settings.CASSETTE_PATH, settings.CASSETTE_MODE.lower(),
+                   simulate_latency=settings.CASSETTE_SIMULATE_LATENCY)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for index, line in enumerate(f):
+                entry = json.loads(line)
+                entry["index"] = index
+                if entry["kind"] == "turn":
+                    self.turns.append(entry)
+                elif entry["kind"] == "header":
+                    self.embedding_backend = entry.get("embedding_backend") or self.embedding_backend
+                else:
+                    self._by_key[entry["key"]].append(entry)
+                    self._by_name[(entry["kind"], entry["name"])].append(entry)
+        logger.info(f"Кассета {self.path}: {sum(len(v) for v in self._by_name.values())} вызовов, "
+                    f"{len(self.turns)} сообщений")
+
+    def _write(self, entry: Dict[str, Any]):
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def header(self, embedding_backend: str):
+        """Бэкенд эмбеддингов записи: при воспроизведении размерность векторов должна совпасть"""
+        if self.mode == RECORD:
+            self._write({"kind": "header", "embedding_backend": embedding_backend,
+                         "created_at": datetime.now().isoformat()})
+
+    def record_turn(self, user_id: str, session_id: str, message: str):
+        if self.mode == RECORD:
+            self._write({"kind": "turn", "user_id": user_id, "session_id": session_id, "message": message})
+
+    def call(self, kind: str, name: str, payload: Any, fn: Callable[[], Any],
+             sequential: bool = True) -> Any:
+        """Вызов fn с записью результата или результат из кассеты.
+        sequential=False - при воспроизведении только точное совпадение входа"""
+        if self.mode == REPLAY:
+            entry = self._lookup(kind, name, payload, sequential)
+            if self.simulate_latency:
+                time.sleep(entry["seconds"])
+            return entry["output"]
+
+        started = time.perf_counter()
+        output = fn()
+        self._write({"kind": kind, "name": name, "key": _key(kind, name, payload), "input": payload,
+                     "output": output, "seconds": round(time.perf_counter() - started, 4)})
+        with self._lock:
+            self._stats["recorded"] += 1
+        return output
+
+    def _lookup(self, kind: str, name: str, payload: Any, sequential: bool = True) -> Dict[str, Any]:
+        with self._lock:
+            candidates = self._by_key.get(_key(kind, name, payload))
+            if candidates:
+                # Повторы одного входа отдаются по очереди, последний - сколько угодно раз
+                entry = candidates.popleft() if len(candidates) > 1 else candidates[0]
+                self._used.add(entry["index"])
+                self._stats["exact"] += 1
+                return entry
+
+            entries = self._by_name.get((kind, name), []) if sequential else []
+            cursor = self._cursors[(kind, name)]
+            while cursor < len(entries) and entries[cursor]["index"] in self._used:
+                cursor += 1
+            if cursor < len(entries):
+                entry = entries[cursor]
+                self._cursors[(kind, name)] = cursor + 1
+                self._used.add(entry["index"])
+                self._stats["sequential"] += 1
+                return entry
+            self._stats["misses"] += 1
+        raise CassetteMiss(f"{kind} {name}: нет записи в кассете {self.path}")
+
+    def count(self, outcome: str):
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"mode": self.mode, "path": self.path, **self._stats}
+
+    def close(self):
+        if self.mode == RECORD:
+            with self._lock:
+                self._file.close()
+
+def _local_embedding_function(backend_name: str) -> Optional[EmbeddingFunction]:
+    """Бэкенд эмбеддингов по имени из кассеты, если он считается без сети"""
+    from src.memory.embedding_function import HashingEmbeddingFunction
+
+    parts = backend_name.split(":")
+    if parts[0] == "hashing" and len(parts) == 3:
+        return HashingEmbeddingFunction(dimension=int(parts[1]), ngram=int(parts[2]))
+    return None
+
+class CassetteEmbeddingFunction(EmbeddingFunction):
+    """Эмбеддинги через кассету; атрибуты бэкенда - как у исходной функции (или записи)"""
+
+    def __init__(self, inner: EmbeddingFunction, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+        self.backend_name = getattr(inner, "backend_name", type(inner).__name__)
+        # Промах при воспроизведении: локальный бэкенд записи или исходная функция, если бэкенд тот же
+        self.fallback: Optional[EmbeddingFunction] = None
+        if cassette.replaying and cassette.embedding_backend:
+            self.backend_name = cassette.embedding_backend
+            self.fallback = _local_embedding_function(self.backend_name)
+            if self.fallback is None and getattr(inner, "backend_name", None) == self.backend_name:
+                self.fallback = inner
+        else:
+            cassette.header(self.backend_name)
+
+    def __getattr__(self, name: str):
+        # resilience, single_flight, warm, dimension - от исходной функции
+        return getattr(self.inner, name)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        compute = lambda: [np.asarray(vector, dtype=np.float32).tolist() for vector in self.inner(texts)]
+        try:
+            vectors = self.cassette.call("embeddings", self.backend_name, texts, compute, sequential=False)
+        except CassetteMiss:
+            if self.fallback is None:
+                raise
+            vectors = self.fallback(texts)
+            self.cassette.count("computed")
+        return [np.asarray(vector, dtype=np.float32) for vector in vectors]
@@ -0,0 +1,121 @@
+from typing import Any, Dict
+import logging
+import time
+
+from src.llm.token_budget import TokenUsageTracker
+from src.llm.scheduler import LLMScheduler
+from src.llm.resilience import ResiliencePolicy, CallTimeoutError
+from src.llm.single_flight import SingleFlight
+from src.llm.streaming import current_token_stream
+from src.llm.cassette import Cassette
+from src.llm.tiers import ModelTiers
+
+logger = logging.getLogger(__name__)
+
+class ChainInvoker:
+    """Единая точка вызова LCEL цепочек: объединение одинаковых запросов, учет фактических
+    токенов, политика устойчивости, планировщик вызовов и запись/воспроизведение кассет"""
+
+    def __init__(self, usage_tracker: TokenUsageTracker = None, scheduler: LLMScheduler = None,
+                 resilience: ResiliencePolicy = None, single_flight: SingleFlight = None,
+                 cassette: Cassette = None, tiers: ModelTiers = None):
+        self.usage = usage_tracker or TokenUsageTracker()
+        self.scheduler = scheduler
+        self.resilience = resilience
+        self.single_flight = single_flight
+        self.cassette = cassette
+        self.tiers = tiers
+
+    def model(self, chain_name: str, llm):
+        """Модель для цепочки с учетом уровня (легкая модель для служебных цепочек)"""
+        if self.tiers is None:
+            return llm
+        return self.tiers.model(chain_name, llm)
+
+    def invoke(self, chain_name: str, chain, chain_input: Dict[str, Any]) -> Any:
+        """Вызов цепочки с учетом токенов по её имени.
+        
+        Каждая попытка (включая повторы и хедж) проходит через планировщик; попытка,
+        брошенная по таймауту, пока ждала очереди, к провайдеру уже не уходит.
+        """
+        stream = current_token_stream()
+        if stream is not None and not stream.streams(chain_name):
+            stream = None
+        
+        def attempt(cancelled):
+            def call():
+                if cancelled.is_set():
+                    raise CallTimeoutError(f"{chain_name}: попытка отменена до отправки")
+                config = {"callbacks": [self.usage.callback(chain_name)], "run_name": chain_name}
+                
+                def provider_call():
+                    if stream is None:
+                        return chain.invoke(chain_input, config=config)
+                    return self._stream(chain, chain_input, config, stream, cancelled)
+                
+                started = time.perf_counter()
+                try:
+                    if self.cassette is None:
+                        return provider_call()
+                    # Кассета подменяет только обращение к провайдеру: очередь и повторы остаются
+                    result = self.cassette.call("chain", chain_name, chain_input, provider_call)
+                    if stream is not None and self.cassette.replaying:
+                        stream.chunk(object(), result)
+                    return result
+                finally:
+                    if self.tiers is not None:
+                        self.tiers.record(chain_name, time.perf_counter() - started)
+            
+            if self.scheduler is None:
+                return call()
+            return self.scheduler.run(call)
+        
+        def run():
+            if self.resilience is None:
+                return attempt(_NEVER_CANCELLED)
+            return self.resilience.call(attempt)
+        
+        # Одинаковые одновременные входы одной цепочки разделяют один вызов
+        # (потоковый вызов не объединяем - фрагменты нужны именно этому клиенту)
+        if self.single_flight is None or stream is not None:
+            return run()
+        return self.single_flight.do(chain_name, chain_input, run)
+
+    @staticmethod
+    def _stream(chain, chain_input: Dict[str, Any], config: Dict[str, Any], stream, cancelled) -> str:
+        """Потоковый вызов: фрагменты уходят клиенту, результат - склеенный текст"""
+        attempt = object()
+        parts = []
+        try:
+            for chunk in chain.stream(chain_input, config=config):
+                if cancelled.is_set():
+                    # Попытка брошена (таймаут или проиграла хеджу) - дальше не читаем
+                    raise CallTimeoutError("потоковая попытка отменена")
+                text = chunk if isinstance(chunk, str) else getattr(chunk, "content", str(chunk))
+                parts.append(text)
+                stream.chunk(attempt, text)
+        except BaseException:
+            stream.release(attempt)
+            raise
+        return "".join(parts)
+    
+    def stats(self) -> Dict[str, Any]:
+        stats = {"token_usage": self.usage.stats()}
+        if self.tiers is not None:
+            stats["llm_tiers"] = self.tiers.stats(stats["token_usage"])
+        if self.scheduler is not None:
+            stats["llm_scheduler"] = self.scheduler.stats()
+        if self.resilience is not None:
+            stats["llm_resilience"] = self.resilience.stats()
+        if self.single_flight is not None:
+            stats["llm_single_flight"] = self.single_flight.stats()
+        if self.cassette is not None:
+            stats["cassette"] = self.cassette.stats()
+        return stats
+
+class _NeverCancelled:
+    @staticmethod
+    def is_set() -> bool:
+        return False
+
+_NEVER_CANCELLED = _NeverCancelled()
@@ -0,0 +1,305 @@
+from typing import Any, Callable, Dict, Optional, TypeVar
+from concurrent.futures import Future, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from collections import deque
+import contextvars
+import threading
+import random
+import time
+import logging
+
+from src.llm.scheduler import Priority, SchedulerOverloaded, current_call_context
+from src.graph.deadline import current_turn_deadline
+from src.utils.profiler import profiled_call
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class CircuitOpenError(Exception):
+    """Предохранитель разомкнут - вызов сразу уходит в fallback"""
+
+class CallTimeoutError(TimeoutError):
+    """Вызов не уложился в отведенное время"""
+
+# Ошибки, которые не лечатся повтором и не говорят о сбое провайдера
+_NOT_RETRYABLE = (CircuitOpenError, SchedulerOverloaded)
+
+class CircuitBreaker:
+    """Предохранитель: после серии ошибок подряд размыкается на reset_timeout секунд,
+    затем пропускает один пробный вызов"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = "half_open"
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    self.trips += 1
+                    logger.warning(f"Предохранитель разомкнут после {self._failures} ошибок")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+class ResiliencePolicy:
+    """Дедлайн на попытку и на вызов целиком, ограниченные повторы с джиттером,
+    предохранитель и опциональный хеджированный дубль запроса.
+
+    Попытки выполняются в пуле из max_attempts потоков. Брошенная по таймауту попытка
+    занимает поток (и слот планировщика LLM, через который она идет) до фактического
+    завершения: при заполненном пуле новый вызов получает отказ SchedulerOverloaded,
+    а не порождает еще один поток.
+    """
+
+    def __init__(self, name: str, timeout: float = 30.0, deadline: float = 60.0,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 4.0,
+                 hedge_delay: Optional[float] = None, breaker: Optional[CircuitBreaker] = None,
+                 max_attempts: int = 32):
+        self.name = name
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # None/0 - без хеджирования, "auto" - по p95 наблюдаемой задержки
+        self.hedge_delay = hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max_attempts
+        self._executor = ThreadPoolExecutor(max_workers=max_attempts, thread_name_prefix=f"{name}-call")
+
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=200)
+        # Флаги отмены попыток в работе, включая брошенные, но еще не завершившиеся
+        self._in_flight: set = set()
+        self._abandoned = 0
+        self._stats = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0,
+            "timeouts": 0, "short_circuited": 0, "hedges": 0, "hedge_wins": 0, "rejected": 0,
+            "turn_deadline_exceeded": 0
+        }
+
+    @classmethod
+    def from_settings(cls, name: str, settings, prefix: str) -> "ResiliencePolicy":
+        """Политика из настроек вида {prefix}_CALL_TIMEOUT, {prefix}_MAX_RETRIES, ..."""
+        hedge = getattr(settings, f"{prefix}_HEDGE_DELAY")
+        return cls(
+            name=name,
+            timeout=getattr(settings, f"{prefix}_CALL_TIMEOUT"),
+            deadline=getattr(settings, f"{prefix}_CALL_DEADLINE"),
+            max_retries=getattr(settings, f"{prefix}_MAX_RETRIES"),
+            backoff_base=settings.RETRY_BACKOFF_BASE,
+            backoff_max=settings.RETRY_BACKOFF_MAX,
+            hedge_delay=hedge if hedge == "auto" else float(hedge or 0) or None,
+            breaker=CircuitBreaker(
+                failure_threshold=getattr(settings, f"{prefix}_BREAKER_FAILURES"),
+                reset_timeout=getattr(settings, f"{prefix}_BREAKER_RESET")
+            ),
+            max_attempts=getattr(settings, f"{prefix}_MAX_ATTEMPTS")
+        )
+
+    def call(self, fn: Callable[[threading.Event], T]) -> T:
+        """Вызов fn(cancelled) с политикой устойчивости.
+
+        cancelled выставляется, когда попытка брошена по таймауту или проиграла хеджу:
+        fn может проверить его перед дорогой операцией (например, после ожидания в очереди).
+        Внутри хода графа дедлайн вызова не превышает остатка дедлайна хода: по его
+        исчерпании новая попытка не начинается, а вызывающий уходит в свой fallback.
+        """
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError(f"{self.name}: провайдер недоступен, предохранитель разомкнут")
+
+        started = time.monotonic()
+        deadline = self.deadline
+        turn = current_turn_deadline()
+        if turn is not None:
+            deadline = min(deadline, turn.remaining())
+        attempt = 0
+        while True:
+            remaining = deadline - (time.monotonic() - started)
+            if turn is not None and remaining <= 0:
+                self._count("turn_deadline_exceeded")
+                raise CallTimeoutError(f"{self.name}: дедлайн хода исчерпан")
+            try:
+                result = self._attempt(fn, min(self.timeout, remaining))
+            except _NOT_RETRYABLE:
+                raise
+            except Exception as e:
+                cut_by_turn = (isinstance(e, CallTimeoutError) and turn is not None
+                               and remaining < self.timeout and turn.remaining() <= 0)
+                if cut_by_turn:
+                    # Попытку оборвал дедлайн хода, а не провайдер - предохранитель не трогаем
+                    self._count("turn_deadline_exceeded")
+                    raise
+                self.breaker.record_failure()
+                if isinstance(e, CallTimeoutError):
+                    self._count("timeouts")
+
+                # Full jitter: равномерно от 0 до экспоненциальной границы
+                backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                remaining = deadline - (time.monotonic() - started)
+                if attempt >= self.max_retries or remaining <= backoff or not self.breaker.allow():
+                    self._count("failures")
+                    raise
+
+                attempt += 1
+                self._count("retries")
+                logger.warning(f"{self.name}: попытка {attempt} не удалась ({e}), повтор через {backoff:.2f}с")
+                time.sleep(backoff)
+                continue
+
+            self.breaker.record_success()
+            self._count("successes")
+            with self._lock:
+                self._latencies.append(time.monotonic() - started)
+            return result
+
+    def _current_hedge_delay(self) -> Optional[float]:
+        if not self.hedge_delay:
+            return None
+        # Дубль запроса удваивает нагрузку - только для интерактивных вызовов
+        if current_call_context().priority != Priority.INTERACTIVE:
+            return None
+        if self.hedge_delay != "auto":
+            return self.hedge_delay
+        with self._lock:
+            if len(self._latencies) < 20:
+                return None
+            ordered = sorted(self._latencies)
+            return ordered[int(len(ordered) * 0.95) - 1]
+
+    def _spawn(self, fn: Callable[[threading.Event], T], cancelled: threading.Event) -> Optional[Future]:
+        """Запуск попытки в пуле с контекстом вызывающего; None - пул занят"""
+        with self._lock:
+            if len(self._in_flight) >= self.max_attempts:
+                self._stats["rejected"] += 1
+                return None
+            self._in_flight.add(cancelled)
+        context = contextvars.copy_context()
+
+        def run():
+            try:
+                # Поток попытки попадает в профиль запроса, если тот профилируется
+                return context.run(profiled_call, fn, cancelled)
+            finally:
+                with self._lock:
+                    self._in_flight.discard(cancelled)
+                    if cancelled.is_set():
+                        self._abandoned -= 1
+
+        try:
+            return self._executor.submit(run)
+        except RuntimeError:
+            # Пул остановлен при завершении процесса - повторять бесполезно
+            with self._lock:
+                self._in_flight.discard(cancelled)
+            raise SchedulerOverloaded(self.timeout, f"{self.name}: пул попыток остановлен")
+
+    def _abandon(self, attempts: Dict[Future, threading.Event], winner: Optional[Future] = None):
+        """Отмена попыток, кроме winner; незавершенные считаются брошенными до конца работы"""
+        for future, cancelled in attempts.items():
+            if future is winner or cancelled.is_set():
+                continue
+            with self._lock:
+                # Флаг ставится под блокировкой - run() не разминется со счетчиком
+                cancelled.set()
+                if cancelled in self._in_flight:
+                    self._abandoned += 1
+
+    def _attempt(self, fn: Callable[[threading.Event], T], timeout: float) -> T:
+        if timeout <= 0:
+            raise CallTimeoutError(f"{self.name}: дедлайн исчерпан")
+
+        started = time.monotonic()
+        primary_cancelled = threading.Event()
+        primary = self._spawn(fn, primary_cancelled)
+        if primary is None:
+            raise SchedulerOverloaded(
+                self.timeout,
+                f"{self.name}: все {self.max_attempts} потоков попыток заняты"
+            )
+        attempts = {primary: primary_cancelled}
+
+        hedge_delay = self._current_hedge_delay()
+        if hedge_delay and hedge_delay < timeout:
+            done, _ = wait(attempts, timeout=hedge_delay)
+            if not done:
+                hedge_cancelled = threading.Event()
+                # Пул занят - обходимся без дубля
+                hedge = self._spawn(fn, hedge_cancelled)
+                if hedge is not None:
+                    self._count("hedges")
+                    attempts[hedge] = hedge_cancelled
+
+        pending = set(attempts)
+        error: Optional[BaseException] = None
+        while pending:
+            remaining = timeout - (time.monotonic() - started)
+            done, pending = wait(pending, timeout=max(remaining, 0), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    self._abandon(attempts, winner=future)
+                    if attempts[future] is not primary_cancelled:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+
+        self._abandon(attempts)
+        if pending or error is None:
+            raise CallTimeoutError(f"{self.name}: нет ответа за {timeout:.1f}с")
+        raise error
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = dict(self._stats)
+            stats["running_attempts"] = len(self._in_flight)
+            stats["abandoned_attempts"] = self._abandoned
+        stats["breaker_state"] = self.breaker.state
+        stats["breaker_trips"] = self.breaker.trips
+        if latencies:
+            stats["p50_seconds"] = latencies[len(latencies) // 2]
+            stats["p99_seconds"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        return stats
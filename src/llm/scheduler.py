@@ -0,0 +1,231 @@
+from typing import Any, Callable, Dict, Optional, TypeVar
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class Priority(IntEnum):
+    """Классы приоритета вызовов LLM (меньше - важнее)"""
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+class SchedulerOverloaded(Exception):
+    """Очередь вызовов LLM переполнена - клиенту нужно повторить позже"""
+
+    def __init__(self, retry_after: float, message: str = "LLM очередь переполнена"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CallContext:
+    """Кто и с каким приоритетом вызывает LLM в текущем потоке выполнения"""
+
+    def __init__(self, priority: Priority = Priority.INTERACTIVE, user_id: Optional[str] = None):
+        self.priority = priority
+        self.user_id = user_id or "anonymous"
+
+_call_context: ContextVar[CallContext] = ContextVar("llm_call_context", default=CallContext())
+
+@contextmanager
+def llm_call_context(priority: Priority, user_id: Optional[str] = None):
+    """Задание приоритета и пользователя для всех вызовов LLM внутри блока"""
+    token = _call_context.set(CallContext(priority, user_id))
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+def current_call_context() -> CallContext:
+    return _call_context.get()
+
+class TokenBucket:
+    """Ограничитель частоты запросов (не потокобезопасен, используется под блокировкой)"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Сколько ждать до появления токена"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate > 0:
+            self._refill()
+            self.tokens -= 1
+
+class _Ticket:
+    __slots__ = ("priority", "user_id", "event", "state", "enqueued_at")
+
+    def __init__(self, priority: Priority, user_id: str):
+        self.priority = priority
+        self.user_id = user_id
+        self.event = threading.Event()
+        self.state = "queued"
+        self.enqueued_at = time.monotonic()
+
+class LLMScheduler:
+    """Планировщик исходящих вызовов LLM: приоритеты, token bucket под квоту,
+    справедливая очередь по пользователям и отказ при переполнении"""
+
+    def __init__(self, rate_per_second: float = 5.0, burst: int = 10, max_concurrency: int = 8,
+                 max_queue: Optional[Dict[Priority, int]] = None, max_queue_per_user: int = 10,
+                 queue_timeout: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue or {Priority.INTERACTIVE: 100, Priority.BACKGROUND: 50}
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+
+        self._cond = threading.Condition()
+        self._bucket = TokenBucket(rate_per_second, burst)
+        # priority -> user_id -> очередь билетов; порядок пользователей задает round-robin
+        self._queues: Dict[Priority, "OrderedDict[str, deque]"] = {p: OrderedDict() for p in Priority}
+        self._queued = {p: 0 for p in Priority}
+        self._inflight = 0
+        self._dispatcher: Optional[threading.Thread] = None
+
+        self._stats = {p: {"granted": 0, "rejected": 0, "timeouts": 0, "wait_seconds": 0.0} for p in Priority}
+
+    @classmethod
+    def from_settings(cls, settings) -> "LLMScheduler":
+        return cls(
+            rate_per_second=settings.LLM_RATE_LIMIT_RPS,
+            burst=settings.LLM_RATE_LIMIT_BURST,
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            max_queue={
+                Priority.INTERACTIVE: settings.LLM_MAX_QUEUE_INTERACTIVE,
+                Priority.BACKGROUND: settings.LLM_MAX_QUEUE_BACKGROUND
+            },
+            max_queue_per_user=settings.LLM_MAX_QUEUE_PER_USER,
+            queue_timeout=settings.LLM_QUEUE_TIMEOUT
+        )
+
+    def check_admission(self, priority: Priority = Priority.INTERACTIVE, user_id: Optional[str] = None):
+        """Ранний отказ до начала обработки запроса, если очередь уже переполнена"""
+        with self._cond:
+            self._check_capacity(priority, user_id or "anonymous")
+
+    def run(self, fn: Callable[[], T], priority: Optional[Priority] = None,
+            user_id: Optional[str] = None) -> T:
+        """Выполнение вызова после разрешения планировщика"""
+        context = current_call_context()
+        priority = context.priority if priority is None else priority
+        user_id = user_id or context.user_id
+
+        ticket = self._enqueue(priority, user_id)
+        if not ticket.event.wait(self.queue_timeout):
+            with self._cond:
+                if ticket.state == "queued":
+                    self._remove(ticket)
+                    self._stats[priority]["timeouts"] += 1
+                    raise SchedulerOverloaded(self._retry_after(), "Истекло ожидание в очереди LLM")
+
+        try:
+            return fn()
+        finally:
+            with self._cond:
+                self._inflight -= 1
+                self._cond.notify_all()
+
+    def _check_capacity(self, priority: Priority, user_id: str):
+        """Проверка лимитов очереди (вызывать под блокировкой)"""
+        user_queue = self._queues[priority].get(user_id)
+        if self._queued[priority] >= self.max_queue[priority] or \
+                (user_queue is not None and len(user_queue) >= self.max_queue_per_user):
+            self._stats[priority]["rejected"] += 1
+            raise SchedulerOverloaded(self._retry_after())
+
+    def _enqueue(self, priority: Priority, user_id: str) -> _Ticket:
+        with self._cond:
+            self._check_capacity(priority, user_id)
+            ticket = _Ticket(priority, user_id)
+            self._queues[priority].setdefault(user_id, deque()).append(ticket)
+            self._queued[priority] += 1
+            self._ensure_dispatcher()
+            self._cond.notify_all()
+            return ticket
+
+    def _remove(self, ticket: _Ticket):
+        """Удаление билета из очереди (вызывать под блокировкой)"""
+        user_queue = self._queues[ticket.priority].get(ticket.user_id)
+        if user_queue and ticket in user_queue:
+            user_queue.remove(ticket)
+            self._queued[ticket.priority] -= 1
+            if not user_queue:
+                del self._queues[ticket.priority][ticket.user_id]
+        ticket.state = "cancelled"
+
+    def _pop_next(self) -> Optional[_Ticket]:
+        """Следующий билет: высший приоритет, внутри - по кругу между пользователями"""
+        for priority in Priority:
+            users = self._queues[priority]
+            if not users:
+                continue
+            user_id, user_queue = next(iter(users.items()))
+            ticket = user_queue.popleft()
+            self._queued[priority] -= 1
+            if user_queue:
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+            return ticket
+        return None
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="llm-scheduler", daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while not (any(self._queued.values()) and self._inflight < self.max_concurrency):
+                    self._cond.wait()
+                delay = self._bucket.delay()
+                if delay <= 0:
+                    ticket = self._pop_next()
+                    self._bucket.take()
+                    self._inflight += 1
+                    ticket.state = "granted"
+                    self._stats[ticket.priority]["granted"] += 1
+                    self._stats[ticket.priority]["wait_seconds"] += time.monotonic() - ticket.enqueued_at
+                    ticket.event.set()
+                    continue
+            # Ждем токен вне блокировки; за это время может прийти более приоритетный вызов
+            time.sleep(delay)
+
+    def _retry_after(self) -> float:
+        """Оценка времени, через которое очередь разгрузится (вызывать под блокировкой)"""
+        backlog = sum(self._queued.values()) + self._inflight
+        rate = self._bucket.rate if self._bucket.rate > 0 else float(self.max_concurrency)
+        return max(1.0, backlog / rate)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "inflight": self._inflight,
+                "queued": {p.name.lower(): self._queued[p] for p in Priority},
+                **{
+                    p.name.lower(): {
+                        **s,
+                        "avg_wait_seconds": s["wait_seconds"] / s["granted"] if s["granted"] else 0.0
+                    }
+                    for p, s in self._stats.items()
+                }
+            }
@@ -0,0 +1,135 @@
+from typing import Any, Dict, List
+import re
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+def _as_str_list(value: Any) -> List[str]:
+    """Приведение ответа модели к списку строк ("a" -> ["a"], None -> [])"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value if item is not None]
+    return [str(value)]
+
+class ContextAnalysis(BaseModel):
+    """Ответ цепочки анализа контекста"""
+    model_config = ConfigDict(extra="ignore")
+
+    topic: str = ""
+    knowledge_level: str = "beginner"
+    learning_style: str = "balanced"
+    learning_goal: str = "explanation"
+    difficulty_level: int = 3
+    emotional_tone: str = "curious"
+    requires_clarification: bool = False
+
+    @field_validator("knowledge_level", mode="before")
+    @classmethod
+    def _knowledge_level(cls, value: Any) -> str:
+        value = str(value or "").strip().lower()
+        return value if value in ("beginner", "intermediate", "advanced") else "beginner"
+
+    @field_validator("learning_style", mode="before")
+    @classmethod
+    def _learning_style(cls, value: Any) -> str:
+        value = str(value or "").strip().lower()
+        allowed = ("visual", "auditory", "reading_writing", "kinesthetic", "balanced")
+        return value if value in allowed else "balanced"
+
+    @field_validator("difficulty_level", mode="before")
+    @classmethod
+    def _difficulty_level(cls, value: Any) -> int:
+        match = re.search(r"\d+", str(value))
+        # LearningState допускает только 1..10
+        return min(max(int(match.group()), 1), 10) if match else 3
+
+    @field_validator("requires_clarification", mode="before")
+    @classmethod
+    def _requires_clarification(cls, value: Any) -> bool:
+        if isinstance(value, bool):
+            return value
+        return str(value).strip().lower() in ("true", "yes", "да", "1")
+
+    @field_validator("topic", "learning_goal", "emotional_tone", mode="before")
+    @classmethod
+    def _text(cls, value: Any) -> str:
+        return "" if value is None else str(value).strip()
+
+class TestCase(BaseModel):
+    """Тест задачи с кодом: вызов и ожидаемое значение (литерал Python)"""
+    model_config = ConfigDict(extra="ignore")
+
+    call: str
+    expected: str
+
+    @field_validator("expected", mode="before")
+    @classmethod
+    def _expected(cls, value: Any) -> str:
+        # Модель может вернуть JSON-значение вместо строки-литерала: 6 -> "6", true -> "True"
+        return value if isinstance(value, str) else repr(value)
+
+class GeneratedProblem(BaseModel):
+    """Ответ цепочки генерации задачи"""
+    model_config = ConfigDict(extra="ignore")
+
+    problem_statement: str = Field(min_length=1)
+    problem_type: str = "theoretical"
+    difficulty: str = "easy"
+    expected_skills: List[str] = Field(default_factory=list)
+    hints: List[str] = Field(default_factory=list)
+    solution_steps: List[str] = Field(default_factory=list)
+    evaluation_criteria: Dict[str, Any] = Field(default_factory=dict)
+    test_cases: List[TestCase] = Field(default_factory=list)
+
+    @field_validator("expected_skills", "hints", "solution_steps", mode="before")
+    @classmethod
+    def _lists(cls, value: Any) -> List[str]:
+        return _as_str_list(value)
+
+    @field_validator("evaluation_criteria", mode="before")
+    @classmethod
+    def _criteria(cls, value: Any) -> Dict[str, Any]:
+        if isinstance(value, dict):
+            return value
+        return {f"критерий {i}": item for i, item in enumerate(_as_str_list(value), 1)}
+
+    @field_validator("test_cases", mode="before")
+    @classmethod
+    def _test_cases(cls, value: Any) -> List[Any]:
+        # Некорректные тесты отбрасываем, а не проваливаем всю задачу
+        if not isinstance(value, list):
+            return []
+        return [t for t in value if isinstance(t, dict) and t.get("call") and "expected" in t]
+
+class SolutionEvaluation(BaseModel):
+    """Ответ цепочки оценки решения"""
+    model_config = ConfigDict(extra="ignore")
+
+    score: float
+    feedback: str = ""
+    improvements: List[str] = Field(default_factory=list)
+    correct_solution: str = ""
+    strengths: List[str] = Field(default_factory=list)
+    weaknesses: List[str] = Field(default_factory=list)
+
+    @field_validator("score", mode="before")
+    @classmethod
+    def _score(cls, value: Any) -> float:
+        # "85/100", "85 баллов" -> 85
+        match = re.search(r"-?\d+(?:[.,]\d+)?", str(value))
+        if not match:
+            raise ValueError(f"score is not a number: {value!r}")
+        return min(max(float(match.group().replace(",", ".")), 0.0), 100.0)
+
+    @field_validator("improvements", "strengths", "weaknesses", mode="before")
+    @classmethod
+    def _lists(cls, value: Any) -> List[str]:
+        return _as_str_list(value)
+
+    @field_validator("feedback", "correct_solution", mode="before")
+    @classmethod
+    def _text(cls, value: Any) -> str:
+        if isinstance(value, (list, dict)):
+            return "\n".join(_as_str_list(value)) if isinstance(value, list) else str(value)
+        return "" if value is None else str(value)
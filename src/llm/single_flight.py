@@ -0,0 +1,89 @@
+from typing import Any, Callable, Dict, TypeVar
+from collections import defaultdict
+import threading
+import hashlib
+import json
+import logging
+
+from src.graph.deadline import current_turn_deadline
+from src.llm.resilience import CallTimeoutError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+def make_key(namespace: str, payload: Any) -> str:
+    """Ключ (пространство имен, хэш полного входа).
+
+    Вход не нормализуется: в коде решения пробелы и отступы значимы, а объединять
+    можно только вызовы, которые гарантированно дадут один и тот же ответ.
+    """
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{namespace}:{hashlib.sha1(encoded.encode('utf-8')).hexdigest()}"
+
+class _Call:
+    __slots__ = ("event", "result", "error", "followers")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запросов: первый выполняет вызов,
+    остальные ждут и получают его результат (или его ошибку)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "coalesced": 0})
+
+    def do(self, namespace: str, payload: Any, fn: Callable[[], T]) -> T:
+        """Выполнение fn один раз на все одновременные вызовы с тем же ключом.
+        Результат общий для всех ожидающих - его нельзя изменять"""
+        key = make_key(namespace, payload)
+
+        with self._lock:
+            self._stats[namespace]["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self._stats[namespace]["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            # Ведущий вызов ограничен своим ходом - ждем его не дольше дедлайна своего хода
+            turn = current_turn_deadline()
+            if not call.event.wait(None if turn is None else max(turn.remaining(), 0)):
+                raise CallTimeoutError(f"{namespace}: дедлайн хода исчерпан в ожидании общего вызова")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+            if call.followers:
+                logger.info(f"{namespace}: {call.followers} одинаковых запросов объединено в один")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                namespace: {
+                    **s,
+                    "coalesced_rate": s["coalesced"] / s["calls"] if s["calls"] else 0.0
+                }
+                for namespace, s in self._stats.items()
+            }
@@ -0,0 +1,57 @@
+from typing import Any, Callable, Dict, Iterable, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+
+# Цепочки, чей вывод виден пользователю и имеет смысл передавать по мере генерации
+DEFAULT_STREAMED_CHAINS = ("response_generation",)
+
+class TokenStream:
+    """Приемник фрагментов ответа для текущего запроса.
+
+    При повторах и хеджировании фрагменты могут идти от нескольких попыток: поток
+    закрепляется за первой попыткой, приславшей фрагмент. Если она падает, клиенту
+    уходит reset, и поток достается следующей попытке.
+    """
+
+    def __init__(self, emit: Callable[[Dict[str, Any]], None],
+                 chains: Iterable[str] = DEFAULT_STREAMED_CHAINS):
+        self.emit = emit
+        self.chains = set(chains)
+        self._lock = threading.Lock()
+        self._owner: Optional[object] = None
+
+    def streams(self, chain_name: str) -> bool:
+        return chain_name in self.chains
+
+    def chunk(self, attempt: object, text: str):
+        if not text:
+            return
+        with self._lock:
+            if self._owner is None:
+                self._owner = attempt
+            elif self._owner is not attempt:
+                return
+        self.emit({"type": "token", "text": text})
+
+    def release(self, attempt: object):
+        """Попытка-владелец не завершилась - уже отправленный текст недействителен"""
+        with self._lock:
+            if self._owner is not attempt:
+                return
+            self._owner = None
+        self.emit({"type": "reset"})
+
+_token_stream: ContextVar[Optional[TokenStream]] = ContextVar("token_stream", default=None)
+
+@contextmanager
+def token_stream(stream: TokenStream):
+    """Передача фрагментов ответов LLM внутри блока в stream"""
+    token = _token_stream.set(stream)
+    try:
+        yield stream
+    finally:
+        _token_stream.reset(token)
+
+def current_token_stream() -> Optional[TokenStream]:
+    return _token_stream.get()
@@ -0,0 +1,173 @@
+from typing import Any, Dict, Optional, Type, TypeVar
+from collections import defaultdict
+import threading
+import json
+import ast
+import re
+import logging
+
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+def _close_truncated(fragment: str) -> str:
+    """Достраивание обрезанного JSON: закрывает строку и незакрытые скобки"""
+    stack = []
+    in_string = False
+    escape = False
+    for char in fragment:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+
+    if in_string:
+        fragment += '"'
+
+    # Обрыв после запятой или после ключа без значения
+    fragment = fragment.rstrip()
+    if fragment.endswith(":"):
+        fragment = re.sub(r',?\s*"[^"]*"\s*:$', "", fragment)
+    fragment = fragment.rstrip().rstrip(",")
+
+    return fragment + "".join(reversed(stack))
+
+def extract_json_object(text: str) -> Dict[str, Any]:
+    """Толерантное извлечение первого JSON-объекта из ответа модели.
+
+    Порядок попыток: строгий разбор с каждой '{' (нежадно, текст вокруг игнорируется),
+    литерал Python (True/None, одинарные кавычки), затем починка висячих запятых
+    и обрезанного конца ответа.
+    """
+    candidates = [block for block in _FENCE_RE.findall(text)] + [text]
+    decoder = json.JSONDecoder()
+
+    for candidate in candidates:
+        for match in re.finditer(r"\{", candidate):
+            try:
+                value, _ = decoder.raw_decode(candidate, match.start())
+            except json.JSONDecodeError:
+                continue
+            if isinstance(value, dict):
+                return value
+
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("JSON-объект не найден в ответе")
+    fragment = text[start:text.rfind("}") + 1] if "}" in text[start:] else text[start:]
+
+    try:
+        value = ast.literal_eval(fragment)
+        if isinstance(value, dict):
+            return value
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        pass
+
+    for repaired in (_TRAILING_COMMA_RE.sub(r"\1", fragment),
+                     _TRAILING_COMMA_RE.sub(r"\1", _close_truncated(text[start:]))):
+        try:
+            value = json.loads(repaired)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value
+
+    raise ValueError("Не удалось разобрать JSON в ответе")
+
+class StructuredOutputParser:
+    """Разбор JSON-ответов LLM по Pydantic-схемам с одной попыткой починки и счетчиками по цепочкам"""
+
+    def __init__(self, llm=None, invoker=None):
+        self.llm = llm
+        self.invoker = invoker
+        self._repair_chain = self._create_repair_chain() if llm is not None else None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "parsed": 0, "repaired": 0, "fallbacks": 0}
+        )
+
+    def _create_repair_chain(self):
+        """Цепочка точечной починки ответа под схему"""
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+
+        return (
+            ChatPromptTemplate.from_template("""
+            Предыдущий ответ не удалось разобрать как JSON по схеме.
+            Ошибка: {error}
+
+            JSON-схема:
+            {schema}
+
+            Исходный ответ:
+            {raw}
+
+            Верни только исправленный JSON-объект по схеме, без пояснений и markdown.
+            Сохрани смысл исходного ответа.
+            """)
+            | (self.invoker.model("repair", self.llm) if self.invoker is not None else self.llm)
+            | StrOutputParser()
+        )
+
+    def parse(self, chain_name: str, text: str, schema: Type[T]) -> Optional[T]:
+        """Разбор ответа цепочки; None означает, что вызывающему нужен fallback"""
+        self._count(chain_name, "calls")
+
+        try:
+            result = schema.model_validate(extract_json_object(text))
+            self._count(chain_name, "parsed")
+            return result
+        except (ValueError, ValidationError) as e:
+            error = e
+
+        logger.warning(f"Ответ цепочки {chain_name} не прошел схему: {error}")
+
+        if self._repair_chain is not None:
+            try:
+                repair_input = {
+                    "error": str(error)[:500],
+                    "schema": json.dumps(schema.model_json_schema(), ensure_ascii=False),
+                    "raw": text[:4000]
+                }
+                if self.invoker is not None:
+                    repaired_text = self.invoker.invoke(f"{chain_name}_repair", self._repair_chain, repair_input)
+                else:
+                    repaired_text = self._repair_chain.invoke(repair_input)
+                result = schema.model_validate(extract_json_object(repaired_text))
+                self._count(chain_name, "repaired")
+                logger.info(f"Ответ цепочки {chain_name} исправлен повторным запросом")
+                return result
+            except Exception as e:
+                logger.warning(f"Починка ответа цепочки {chain_name} не удалась: {e}")
+
+        self._count(chain_name, "fallbacks")
+        return None
+
+    def _count(self, chain_name: str, counter: str):
+        with self._lock:
+            self._stats[chain_name][counter] += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Счетчики разбора по цепочкам"""
+        with self._lock:
+            return {
+                chain_name: {
+                    **counters,
+                    "fallback_rate": counters["fallbacks"] / counters["calls"] if counters["calls"] else 0.0
+                }
+                for chain_name, counters in self._stats.items()
+            }
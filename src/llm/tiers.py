@@ -0,0 +1,75 @@
+from typing import Any, Dict, Iterable, Optional
+from collections import defaultdict
+import threading
+
+MAIN = "main"
+LIGHT = "light"
+
+class ModelTiers:
+    """Выбор модели и параметров генерации по имени цепочки.
+
+    Короткие служебные цепочки (анализ сообщения, выбор режима, подсказки, починка JSON)
+    идут в легкий уровень - более быструю модель с низкой температурой; генерация ответа,
+    задач и оценка решений - в основной. Легкий уровень - та же модель LangChain
+    с переопределенными параметрами запроса (bind), отдельный клиент не нужен.
+    """
+
+    def __init__(self, light_params: Dict[str, Any] = None, light_chains: Iterable[str] = (),
+                 main_params: Dict[str, Any] = None):
+        self.light_params = {k: v for k, v in (light_params or {}).items() if v not in (None, "")}
+        self.main_params = {k: v for k, v in (main_params or {}).items() if v not in (None, "")}
+        self.light_chains = set(light_chains)
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"calls": 0, "seconds": 0.0, "max_seconds": 0.0}
+        )
+
+    @classmethod
+    def from_settings(cls, settings) -> "ModelTiers":
+        return cls(
+            light_params={"model": settings.LLM_LIGHT_MODEL, "temperature": settings.LLM_LIGHT_TEMPERATURE},
+            light_chains=[name.strip() for name in settings.LLM_LIGHT_CHAINS.split(",") if name.strip()],
+            main_params={"model": settings.GIGACHAT_MODEL, "temperature": settings.LLM_MAIN_TEMPERATURE}
+        )
+
+    def tier(self, chain_name: str) -> str:
+        # Починка ответа любой цепочки (<цепочка>_repair) настраивается одним именем "repair"
+        if chain_name in self.light_chains or (chain_name.endswith("_repair") and "repair" in self.light_chains):
+            return LIGHT
+        return MAIN
+
+    def model(self, chain_name: str, llm):
+        """Модель для цепочки: основная как есть или с параметрами легкого уровня"""
+        if self.tier(chain_name) == LIGHT and self.light_params:
+            return llm.bind(**self.light_params)
+        return llm
+
+    def record(self, chain_name: str, seconds: float):
+        with self._lock:
+            stats = self._calls[self.tier(chain_name)]
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def stats(self, token_usage: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Вызовы, задержка и токены по уровням (токены - из учета по цепочкам)"""
+        tokens: Dict[str, Dict[str, int]] = defaultdict(lambda: {"prompt_tokens": 0, "completion_tokens": 0})
+        for chain_name, usage in (token_usage or {}).items():
+            tier_tokens = tokens[self.tier(chain_name)]
+            tier_tokens["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            tier_tokens["completion_tokens"] += usage.get("completion_tokens", 0)
+
+        with self._lock:
+            result = {}
+            for tier, params in ((MAIN, self.main_params), (LIGHT, {**self.main_params, **self.light_params})):
+                if tier == LIGHT:
+                    params = {**params, "chains": sorted(self.light_chains)}
+                calls = self._calls.get(tier, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+                result[tier] = {
+                    **params,
+                    "calls": calls["calls"],
+                    "avg_seconds": round(calls["seconds"] / calls["calls"], 3) if calls["calls"] else 0.0,
+                    "max_seconds": round(calls["max_seconds"], 3),
+                    **tokens[tier]
+                }
+            return result
@@ -0,0 +1,200 @@
+from typing import Any, Dict, List, Optional
+from collections import defaultdict
+import threading
+import re
+import logging
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+# Средняя длина словарного токена в символах (кириллица и латиница)
+_CHARS_PER_TOKEN = 4
+# Меньше этого остатка нет смысла добавлять обрезанный элемент списка
+_MIN_ITEM_TOKENS = 16
+
+def _piece_tokens(piece: str) -> int:
+    if len(piece) == 1 or not piece[0].isalnum():
+        return 1
+    return (len(piece) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+def estimate_tokens(text: str) -> int:
+    """Быстрая оценка числа токенов без обращения к токенизатору модели"""
+    if not text:
+        return 0
+    return sum(_piece_tokens(piece) for piece in _TOKEN_RE.findall(text))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Обрезка текста до заданного числа токенов (по той же оценке)"""
+    if max_tokens <= 0:
+        return ""
+    used = 0
+    for match in _TOKEN_RE.finditer(text):
+        used += _piece_tokens(match.group())
+        if used > max_tokens:
+            return text[:match.start()].rstrip() + "…"
+    return text
+
+class PromptSection:
+    """Секция промпта: сплошной текст или список элементов в порядке важности"""
+
+    def __init__(self, name: str, text: str = "", items: Optional[List[str]] = None,
+                 priority: int = 0, empty_text: str = ""):
+        self.name = name
+        self.text = text
+        self.items = items
+        self.priority = priority
+        self.empty_text = empty_text
+
+    @property
+    def full_text(self) -> str:
+        return "\n".join(self.items) if self.items is not None else self.text
+
+    def render(self, max_tokens: int) -> str:
+        """Текст секции в пределах выделенного бюджета"""
+        if self.items is None:
+            return truncate_to_tokens(self.text, max_tokens) or self.empty_text
+
+        rendered = []
+        remaining = max_tokens
+        for item in self.items:
+            cost = estimate_tokens(item) + 1
+            if cost <= remaining:
+                rendered.append(item)
+                remaining -= cost
+                continue
+            if remaining >= _MIN_ITEM_TOKENS:
+                rendered.append(truncate_to_tokens(item, remaining - 1))
+            break
+        return "\n".join(rendered) or self.empty_text
+
+class PromptBudget:
+    """Распределение бюджета токенов между секциями промпта по приоритету"""
+
+    def __init__(self, total_tokens: int, section_limits: Optional[Dict[str, int]] = None,
+                 priorities: Optional[List[str]] = None):
+        self.total_tokens = total_tokens
+        self.section_limits = section_limits or {}
+        self.priorities = priorities or []
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = defaultdict(
+            lambda: {"prompts": 0, "budgeted_tokens": 0, "requested_tokens": 0, "truncated": defaultdict(int)}
+        )
+
+    @classmethod
+    def from_settings(cls, settings) -> "PromptBudget":
+        return cls(
+            total_tokens=settings.PROMPT_TOKEN_BUDGET,
+            section_limits={
+                "message": settings.PROMPT_MESSAGE_MAX_TOKENS,
+                "memories": settings.PROMPT_MEMORIES_MAX_TOKENS,
+                "progress": settings.PROMPT_PROGRESS_MAX_TOKENS
+            },
+            priorities=[name.strip() for name in settings.PROMPT_SECTION_PRIORITY.split(",") if name.strip()]
+        )
+
+    def _priority(self, section: PromptSection) -> int:
+        if section.name in self.priorities:
+            return self.priorities.index(section.name)
+        return len(self.priorities) + section.priority
+
+    def allocate(self, chain_name: str, sections: List[PromptSection]) -> Dict[str, str]:
+        """Тексты секций, уложенные в бюджет: сначала в пределах лимитов секций по приоритету,
+        затем остаток бюджета отдается недополучившим секциям в том же порядке"""
+        ordered = sorted(sections, key=self._priority)
+        needs = {s.name: estimate_tokens(s.full_text) for s in ordered}
+        allocation = {}
+
+        remaining = self.total_tokens
+        for section in ordered:
+            limit = self.section_limits.get(section.name, remaining)
+            allocation[section.name] = min(needs[section.name], limit, remaining)
+            remaining -= allocation[section.name]
+
+        for section in ordered:
+            if remaining <= 0:
+                break
+            extra = min(needs[section.name] - allocation[section.name], remaining)
+            allocation[section.name] += extra
+            remaining -= extra
+
+        rendered = {s.name: s.render(allocation[s.name]) for s in ordered}
+
+        with self._lock:
+            stats = self._stats[chain_name]
+            stats["prompts"] += 1
+            stats["budgeted_tokens"] += sum(allocation.values())
+            stats["requested_tokens"] += sum(needs.values())
+            for section in ordered:
+                if allocation[section.name] < needs[section.name]:
+                    stats["truncated"][section.name] += 1
+
+        return rendered
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                chain_name: {
+                    "prompts": s["prompts"],
+                    "avg_budgeted_tokens": s["budgeted_tokens"] / s["prompts"] if s["prompts"] else 0.0,
+                    "avg_requested_tokens": s["requested_tokens"] / s["prompts"] if s["prompts"] else 0.0,
+                    "truncated": dict(s["truncated"])
+                }
+                for chain_name, s in self._stats.items()
+            }
+
+class _UsageCallback(BaseCallbackHandler):
+    """Снимает фактическое потребление токенов с ответа модели"""
+
+    def __init__(self, tracker: "TokenUsageTracker", chain_name: str):
+        self.tracker = tracker
+        self.chain_name = chain_name
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        prompt_tokens = completion_tokens = None
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt_tokens = usage.get("input_tokens")
+                    completion_tokens = usage.get("output_tokens")
+        if prompt_tokens is None:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = token_usage.get("prompt_tokens")
+            completion_tokens = token_usage.get("completion_tokens")
+        self.tracker.record(self.chain_name, prompt_tokens, completion_tokens)
+
+class TokenUsageTracker:
+    """Фактическое число токенов промпта и ответа по цепочкам"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "reported": 0, "prompt_tokens": 0, "completion_tokens": 0, "max_prompt_tokens": 0}
+        )
+
+    def callback(self, chain_name: str) -> BaseCallbackHandler:
+        return _UsageCallback(self, chain_name)
+
+    def record(self, chain_name: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+        with self._lock:
+            stats = self._stats[chain_name]
+            stats["calls"] += 1
+            if prompt_tokens is None:
+                return
+            stats["reported"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens or 0
+            stats["max_prompt_tokens"] = max(stats["max_prompt_tokens"], prompt_tokens)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                chain_name: {
+                    **s,
+                    "avg_prompt_tokens": s["prompt_tokens"] / s["reported"] if s["reported"] else 0.0,
+                    "avg_completion_tokens": s["completion_tokens"] / s["reported"] if s["reported"] else 0.0
+                }
+                for chain_name, s in self._stats.items()
+            }
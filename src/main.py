@@ -1,12 +1,24 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List
 import uvicorn
+import asyncio
 import logging
+import json
+import math
+import hmac
 
 from src.agents.learning_agent import LearningCompanionAgent
 from src.utils.visualizer import GraphVisualizer
+from src.llm.scheduler import SchedulerOverloaded
+from src.llm.streaming import TokenStream, token_stream
+from src.utils.connections import ConnectionManager
+from src.utils import profiler
+from src.utils.instance_lock import acquire_instance_lock, release_instance_lock
+from src.config import settings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,8 +38,20 @@ app.add_middleware(
     allow_headers=["*"],  # Разрешаем все заголовки
 )
 
+def _is_admin(token: Optional[str]) -> bool:
+    return bool(settings.ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, settings.ADMIN_TOKEN)
+
+# Профилирование отдельных запросов по флагу админа или случайной выборке
+request_profiler = profiler.RequestProfiler.from_settings(settings)
+app.add_middleware(profiler.ProfilingMiddleware, profiler=request_profiler, is_admin=_is_admin)
+
 # Глобальный инстанс агента
 agent = None
+# Блокировка каталога данных: сервис работает в одном процессе (см. src/utils/instance_lock.py)
+instance_lock = None
+
+# WebSocket-соединения для потоковых ответов и push-сообщений
+connections = ConnectionManager()
 
 class ChatRequest(BaseModel):
     message: str
@@ -50,16 +74,25 @@ class AnalyticsResponse(BaseModel):
     problems_solved: int
     average_score: float
     knowledge_gaps: List[str]
+    learning_path: List[str] = []
+
+class SessionStartRequest(BaseModel):
+    user_id: Optional[str] = None
+    session_id: Optional[str] = None
 
 class ProblemRequest(BaseModel):
     topic: str
     problem_type: str = "theoretical"
     difficulty: str = "easy"
+    knowledge_level: str = "intermediate"
+    user_id: Optional[str] = None
 
 @app.on_event("startup") # DEPRECATED, надо исправить
 async def startup_event():
     """Инициализация агента при запуске"""
-    global agent
+    global agent, instance_lock
+    # Второй воркер не стартует: сессии, кэши и ETag аналитики - в памяти процесса
+    instance_lock = acquire_instance_lock(settings.CHROMA_PERSIST_DIR)
     try:
         agent = LearningCompanionAgent()
         logger.info("Agent инициализирован")
@@ -67,13 +100,20 @@ async def startup_event():
         # Создание визуализации графа при запуске
         from src.graph.learning_graph import LearningGraph
         from src.memory.vector_memory import VectorMemory
-        memory = VectorMemory()
+        memory = VectorMemory(persist_directory=settings.CHROMA_PERSIST_DIR)
         graph = LearningGraph(memory, agent.llm)
         GraphVisualizer.visualize_learning_graph(graph.graph)
         
     except Exception as e:
         logger.error(f"Ошибка инициализации: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Остановка фоновых задач агента"""
+    if agent:
+        agent.shutdown()
+    release_instance_lock(instance_lock)
+
 @app.get("/")
 async def root():
     """Корневой эндпоинт"""
@@ -90,6 +130,15 @@ async def root():
         ]
     }
 
+def _overloaded(error: SchedulerOverloaded) -> HTTPException:
+    """429 с Retry-After при переполнении очереди вызовов LLM"""
+    logger.warning(f"Отказ по перегрузке: {error}")
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(math.ceil(error.retry_after))}
+    )
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     """Эндпоинт для диалога с ассистентом"""
@@ -97,7 +146,9 @@ async def chat_endpoint(request: ChatRequest):
         if not agent:
             raise HTTPException(status_code=500, detail="Agent not initialized")
         
-        response = agent.process_message(
+        # Обработка блокирующая (LLM, Chroma) - выполняем в пуле потоков, не занимая event loop
+        response = await run_in_threadpool(
+            profiler.bind(agent.process_message),
             user_message=request.message,
             user_id=request.user_id,
             session_id=request.session_id
@@ -121,18 +172,206 @@ async def chat_endpoint(request: ChatRequest):
             knowledge_level=getattr(state, 'knowledge_level', 'unknown') if state else 'unknown',
         )
         
+    except SchedulerOverloaded as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/session/start")
+async def start_session(request: SessionStartRequest):
+    """Открытие сессии при загрузке фронтенда: прогрев прогресса, памяти и клиентов
+    до первого сообщения"""
+    try:
+        if not agent:
+            raise HTTPException(status_code=500, detail="Agent not initialized")
+        
+        return await run_in_threadpool(
+            profiler.bind(agent.start_session),
+            user_id=request.user_id,
+            session_id=request.session_id
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error starting session: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _session_fields(state) -> dict:
+    """Поля состояния сессии, которые клиент показывает рядом с ответом"""
+    return {
+        "learning_mode": getattr(state, 'learning_mode', 'unknown') if state else 'unknown',
+        "current_topic": getattr(state, 'current_topic', 'unknown') if state else 'unknown',
+        "problems_solved": getattr(state, 'problems_solved', 0) if state else 0,
+        "average_score": getattr(state, 'average_score', 0.0) if state else 0.0
+    }
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket, user_id: Optional[str] = None,
+                         session_id: Optional[str] = None):
+    """Диалог через WebSocket: сессия закреплена за соединением, ответ приходит
+    фрагментами (token/reset), затем целиком (response); сервер может сам прислать
+    сообщение (problem_ready).
+
+    Клиент -> сервер: {"type": "message", "message": ...},
+    {"type": "generate_problem", "topic": ..., ...}, {"type": "ping"}.
+    request_id клиента возвращается во всех кадрах по этому запросу (accepted, token,
+    reset, response, problem_ready, error); accepted - сообщение принято в обработку,
+    и повторно отправлять его нельзя.
+    """
+    await websocket.accept()
+    if not agent:
+        await websocket.send_json({"type": "error", "status": 500, "detail": "Agent not initialized"})
+        await websocket.close(code=1011)
+        return
+    
+    state = agent.pin_session(user_id, session_id)
+    user_id, session_id = state.user_id, state.session_id
+    outbox = connections.connect(user_id)
+    chat_queue: asyncio.Queue = asyncio.Queue()
+    background = set()
+    
+    async def sender():
+        while True:
+            await websocket.send_json(await outbox.get())
+    
+    async def chat_worker():
+        # Сообщения одной сессии обрабатываются по очереди
+        while True:
+            message, request_id = await chat_queue.get()
+            await _ws_chat(user_id, session_id, message, request_id, outbox)
+    
+    tasks = [asyncio.create_task(sender()), asyncio.create_task(chat_worker())]
+    connections.put(outbox, {"type": "session", "user_id": user_id, "session_id": session_id})
+    
+    try:
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                connections.put(outbox, {"type": "error", "status": 400, "detail": "Ожидается JSON"})
+                continue
+            
+            kind = data.get("type") if isinstance(data, dict) else None
+            request_id = data.get("request_id") if isinstance(data, dict) else None
+            if kind == "message" and data.get("message"):
+                chat_queue.put_nowait((data["message"], request_id))
+                connections.put(outbox, _ws_frame(request_id, {"type": "accepted"}))
+            elif kind == "generate_problem":
+                task = asyncio.create_task(_ws_generate_problem(user_id, data, request_id, outbox))
+                background.add(task)
+                task.add_done_callback(background.discard)
+                connections.put(outbox, _ws_frame(request_id, {"type": "accepted"}))
+            elif kind == "ping":
+                connections.put(outbox, {"type": "pong"})
+            else:
+                connections.put(outbox, _ws_frame(request_id, {
+                    "type": "error", "status": 400, "detail": f"Неизвестный тип сообщения: {kind}"
+                }))
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket закрыт: {user_id}/{session_id}")
+    finally:
+        for task in tasks + list(background):
+            task.cancel()
+        connections.disconnect(user_id, outbox)
+        agent.unpin_session(user_id, session_id)
+
+def _ws_frame(request_id: Optional[str], frame: dict) -> dict:
+    """Кадр ответа с request_id запроса клиента, если он его прислал"""
+    return frame if request_id is None else {**frame, "request_id": request_id}
+
+async def _ws_chat(user_id: str, session_id: str, message: str, request_id: Optional[str],
+                   outbox: asyncio.Queue):
+    """Обработка сообщения с передачей фрагментов ответа в соединение"""
+    stream = TokenStream(lambda event: connections.put_threadsafe(outbox, _ws_frame(request_id, event)))
+    
+    def process():
+        with token_stream(stream):
+            return agent.process_message(user_message=message, user_id=user_id, session_id=session_id)
+    
+    try:
+        response = await run_in_threadpool(process)
+    except SchedulerOverloaded as e:
+        connections.put(outbox, _ws_frame(request_id, {"type": "error", "status": 429, "detail": str(e),
+                                                       "retry_after": math.ceil(e.retry_after)}))
+        return
+    except Exception as e:
+        logger.error(f"Error in chat websocket: {e}")
+        connections.put(outbox, _ws_frame(request_id, {"type": "error", "status": 500, "detail": str(e)}))
+        return
+    
+    state = agent.get_session_state(user_id, session_id)
+    connections.put(outbox, _ws_frame(request_id, {
+        "type": "response",
+        "response": response,
+        "user_id": user_id,
+        "session_id": session_id,
+        **_session_fields(state)
+    }))
+
+async def _ws_generate_problem(user_id: str, data: dict, request_id: Optional[str], outbox: asyncio.Queue):
+    """Генерация задачи в фоне; готовая задача приходит всем соединениям пользователя,
+    ошибка - только запросившему"""
+    from src.agents.state import ProblemType, ProblemDifficulty
+    
+    try:
+        request = ProblemRequest(**{**data, "user_id": user_id})
+        problem_type, difficulty = ProblemType(request.problem_type), ProblemDifficulty(request.difficulty)
+    except ValueError as e:
+        connections.put(outbox, _ws_frame(request_id, {"type": "error", "status": 400, "detail": str(e)}))
+        return
+    
+    try:
+        problem = await run_in_threadpool(
+            agent.generate_problem,
+            topic=request.topic,
+            problem_type=problem_type,
+            difficulty=difficulty,
+            knowledge_level=request.knowledge_level,
+            user_id=user_id
+        )
+    except SchedulerOverloaded as e:
+        connections.put(outbox, _ws_frame(request_id, {"type": "error", "status": 429, "detail": str(e),
+                                                       "retry_after": math.ceil(e.retry_after)}))
+        return
+    except Exception as e:
+        logger.error(f"Error generating problem over websocket: {e}")
+        connections.put(outbox, _ws_frame(request_id, {"type": "error", "status": 500, "detail": str(e)}))
+        return
+    
+    connections.send(user_id, _ws_frame(request_id, {
+        "type": "problem_ready",
+        "problem": problem,
+        "topic": request.topic,
+        "problem_type": request.problem_type,
+        "difficulty": request.difficulty
+    }))
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка заголовка If-None-Match (слабое сравнение)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in candidates:
+        return True
+    return etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in candidates]
+
 @app.get("/analytics/{user_id}")
-async def get_analytics(user_id: str):
+async def get_analytics(user_id: str, request: Request, response: Response):
     """Получение аналитики обучения пользователя"""
     try:
         if not agent:
             raise HTTPException(status_code=500, detail="Agent not initialized")
         
-        analytics = agent.get_learning_analytics(user_id)
+        # Дешевая проверка актуальности: аналитика не менялась - отдаем 304 без пересчета
+        etag = agent.get_learning_analytics_etag(user_id)
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+        
+        analytics, etag = await run_in_threadpool(profiler.bind(agent.get_learning_analytics_with_etag), user_id)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
         
         return AnalyticsResponse(
             progress=analytics,
@@ -140,7 +379,8 @@ async def get_analytics(user_id: str):
             total_interactions=analytics.get("total_interactions", 0),
             problems_solved=analytics.get("problems_solved", 0),
             average_score=analytics.get("average_score", 0.0),
-            knowledge_gaps=analytics.get("knowledge_gaps", [])
+            knowledge_gaps=analytics.get("knowledge_gaps", []),
+            learning_path=analytics.get("learning_path", [])
         )
         
     except Exception as e:
@@ -154,16 +394,15 @@ async def generate_problem(request: ProblemRequest):
         if not agent:
             raise HTTPException(status_code=500, detail="Agent not initialized")
         
-        from src.agents.problem_solver import ProblemSolver
         from src.agents.state import ProblemType, ProblemDifficulty
         
-        problem_solver = ProblemSolver(agent.llm)
-        
-        problem = problem_solver.generate_problem(
+        problem = await run_in_threadpool(
+            profiler.bind(agent.generate_problem),
             topic=request.topic,
-            knowledge_level="intermediate",  # Можно адаптировать
             problem_type=ProblemType(request.problem_type),
-            difficulty=ProblemDifficulty(request.difficulty)
+            difficulty=ProblemDifficulty(request.difficulty),
+            knowledge_level=request.knowledge_level,
+            user_id=request.user_id
         )
         
         return {
@@ -173,10 +412,50 @@ async def generate_problem(request: ProblemRequest):
             "difficulty": request.difficulty
         }
         
+    except SchedulerOverloaded as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"Error generating problem: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def metrics():
+    """Метрики кэшей и фоновых компонентов"""
+    if not agent:
+        raise HTTPException(status_code=500, detail="Agent not initialized")
+    return {**agent.get_metrics(), "websocket": connections.stats()}
+
+def _require_admin(token: Optional[str]):
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not _is_admin(token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.get("/admin/profiles")
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """Последние профили запросов (новые первыми)"""
+    _require_admin(x_admin_token)
+    return {"profiles": request_profiler.list()}
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "speedscope", kind: str = "cpu",
+                      x_admin_token: Optional[str] = Header(None)):
+    """Профиль запроса: speedscope (JSON, открыть на speedscope.app) или collapsed
+    (свернутые стеки для flamegraph.pl); kind - cpu или wall для collapsed"""
+    _require_admin(x_admin_token)
+    profile = request_profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    if format == "collapsed":
+        return PlainTextResponse(profile.to_collapsed(kind))
+    if format != "speedscope":
+        raise HTTPException(status_code=400, detail="format: speedscope или collapsed")
+    return JSONResponse(
+        profile.to_speedscope(),
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.speedscope.json"'}
+    )
+
 @app.get("/health")
 async def health_check():
     """Health chek спам"""
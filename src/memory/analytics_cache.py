@@ -0,0 +1,89 @@
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AnalyticsCache:
+    """Кэш аналитики обучения по пользователям с инвалидацией при записи в память.
+
+    Версии и ETag ведутся в памяти процесса и верны, только пока все записи идут через
+    этот процесс: сервис запускается одним воркером (это проверяется при старте,
+    см. src/utils/instance_lock.py).
+    """
+
+    def __init__(self, max_users: int = 1024):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        # user_id -> (версия, аналитика)
+        self._entries: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        # Эпоха процесса: ETag прошлого запуска не должен совпасть с текущим
+        self._epoch = uuid.uuid4().hex[:8]
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def version(self, user_id: str) -> int:
+        """Текущая версия данных пользователя"""
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def etag(self, user_id: str) -> str:
+        """ETag аналитики пользователя (меняется при каждой записи)"""
+        return f'"{self._epoch}-{self.version(user_id)}"'
+
+    def versions(self) -> Dict[str, int]:
+        """Версии данных всех пользователей, писавших в память за время работы процесса"""
+        with self._lock:
+            return dict(self._versions)
+
+    def invalidate(self, user_id: str, expected_version: Optional[int] = None) -> Optional[int]:
+        """Инвалидация аналитики после записи данных пользователя; возвращает новую версию.
+        С expected_version инвалидирует, только если версия с тех пор не менялась (иначе None)"""
+        with self._lock:
+            version = self._versions.get(user_id, 0)
+            if expected_version is not None and version != expected_version:
+                return None
+            self._versions[user_id] = version + 1
+            self._entries.pop(user_id, None)
+            self.invalidations += 1
+            return version + 1
+
+    def get_or_compute(self, user_id: str,
+                       compute: Callable[[str], Dict[str, Any]]) -> Tuple[Dict[str, Any], str]:
+        """Получение аналитики из кэша или её расчет. Возвращаемый словарь не изменять"""
+        with self._lock:
+            version = self._versions.get(user_id, 0)
+            entry = self._entries.get(user_id)
+            if entry and entry[0] == version:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1], f'"{self._epoch}-{version}"'
+            self.misses += 1
+
+        analytics = compute(user_id)
+
+        with self._lock:
+            # Если во время расчета была запись, результат уже устарел - не кэшируем
+            if self._versions.get(user_id, 0) == version:
+                self._entries[user_id] = (version, analytics)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+
+        return analytics, f'"{self._epoch}-{version}"'
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики кэша"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "cached_users": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0
+            }
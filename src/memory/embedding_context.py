@@ -0,0 +1,45 @@
+from typing import Callable, Dict, List, Optional, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import numpy as np
+
+class EmbeddingContext:
+    """Эмбеддинги одного хода: каждый различный текст эмбеддится один раз.
+
+    Последнее сообщение пользователя нужно и поиску воспоминаний, и записи
+    взаимодействия; внутри хода второй раз вектор берется отсюда.
+    """
+
+    def __init__(self):
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.computed = 0
+        self.reused = 0
+
+    def embed(self, texts: Sequence[str], compute: Callable[[List[str]], List]) -> List[np.ndarray]:
+        with self._lock:
+            missing = list(dict.fromkeys(text for text in texts if text not in self._vectors))
+            self.reused += len(texts) - len(missing)
+        if missing:
+            # Недостающие тексты - одним батчем
+            vectors = [np.asarray(vector, dtype=np.float32) for vector in compute(missing)]
+            with self._lock:
+                self._vectors.update(zip(missing, vectors))
+                self.computed += len(missing)
+        with self._lock:
+            return [self._vectors[text] for text in texts]
+
+_embedding_context: ContextVar[Optional[EmbeddingContext]] = ContextVar("embedding_context", default=None)
+
+@contextmanager
+def embedding_context(context: EmbeddingContext):
+    """Общие эмбеддинги для всех обращений к памяти внутри блока"""
+    token = _embedding_context.set(context)
+    try:
+        yield context
+    finally:
+        _embedding_context.reset(token)
+
+def current_embedding_context() -> Optional[EmbeddingContext]:
+    return _embedding_context.get()
@@ -1,18 +1,93 @@
 from langchain_gigachat.embeddings.gigachat import GigaChatEmbeddings
 import chromadb
 from chromadb import Documents, EmbeddingFunction, Embeddings
+from typing import Optional
+import numpy as np
+import zlib
+import re
 import os
+from src.llm.resilience import ResiliencePolicy
+from src.llm.single_flight import SingleFlight
+from src.config import settings
 
 class GigaChatEmbeddingFunction(EmbeddingFunction):
-    def __init__(self, credentials=os.getenv("GIGACHAT_CREDENTIALS"), model=os.getenv("GIGACHAT_EMBEDDINGS_MODEL")):
+    # Размерность задает модель, и в метаданные коллекций она не пишется: коллекции
+    # отмечаются при старте, до первого запроса. Смену модели ловит проверка backend_name
+    dimension: Optional[int] = None
+
+    def __init__(self, credentials=os.getenv("GIGACHAT_CREDENTIALS"), model=os.getenv("GIGACHAT_EMBEDDINGS_MODEL"),
+                 resilience: ResiliencePolicy = None, single_flight: SingleFlight = None):
         super().__init__()
         self.client = GigaChatEmbeddings(credentials=credentials, scope=os.getenv("GIGACHAT_SCOPE"), verify_ssl_certs=False)
         self.model = model
+        self.backend_name = f"gigachat:{model or 'Embeddings'}"
+        # Таймауты, повторы и предохранитель на каждый запрос эмбеддингов
+        self.resilience = resilience or ResiliencePolicy.from_settings("embeddings", settings, "EMBEDDING")
+        # Одинаковые одновременные тексты эмбеддятся одним запросом
+        self.single_flight = single_flight or (SingleFlight() if settings.SINGLE_FLIGHT_ENABLED else None)
     
     def __call__(self, input: Documents) -> Embeddings:
         try:
-            response = self.client.embed_documents(input)
+            def embed():
+                return self.resilience.call(lambda cancelled: self.client.embed_documents(input))
+            
+            if self.single_flight is None:
+                response = embed()
+            else:
+                response = self.single_flight.do("embeddings", list(input), embed)
             return response
 
         except Exception as e:
             raise Exception(f"GigaChat SDK error: {e}")
+    
+    def warm(self):
+        """Получение токена доступа заранее - первый запрос не ждет авторизации"""
+        self.client._client.get_token()
+
+class HashingEmbeddingFunction(EmbeddingFunction):
+    """Локальные эмбеддинги на CPU без сети: hashing trick по словам и символьным n-граммам.
+    Качество поиска ниже, чем у GigaChat, зато вызов занимает микросекунды и не требует ключей"""
+
+    def __init__(self, dimension: int = 1024, ngram: int = 3):
+        super().__init__()
+        self.dimension = dimension
+        self.ngram = ngram
+        self.backend_name = f"hashing:{dimension}:{ngram}"
+
+    def _features(self, text: str):
+        words = re.findall(r"\w+", text.lower())
+        yield from words
+        # Символьные n-граммы сглаживают словоформы ("функция", "функции")
+        for word in words:
+            padded = f"<{word}>"
+            for i in range(len(padded) - self.ngram + 1):
+                yield "#" + padded[i:i + self.ngram]
+
+    def __call__(self, input: Documents) -> Embeddings:
+        matrix = np.zeros((len(input), self.dimension), dtype=np.float32)
+        for row, text in enumerate(input):
+            hashes = np.fromiter(
+                (zlib.crc32(feature.encode("utf-8")) for feature in self._features(text)),
+                dtype=np.uint32
+            )
+            # Знак из старшего бита снижает смещение от коллизий
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(matrix[row], hashes % self.dimension, signs)
+
+        # Сублинейный вес частоты и нормировка под косинусную метрику
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.maximum(norms, 1e-12)
+        return list(matrix)
+
+def create_embedding_function(backend: str = None) -> EmbeddingFunction:
+    """Бэкенд эмбеддингов по настройке EMBEDDING_BACKEND"""
+    backend = (backend or settings.EMBEDDING_BACKEND).lower()
+    if backend == "gigachat":
+        return GigaChatEmbeddingFunction()
+    if backend == "hashing":
+        return HashingEmbeddingFunction(
+            dimension=settings.HASHING_EMBEDDING_DIM,
+            ngram=settings.HASHING_EMBEDDING_NGRAM
+        )
+    raise ValueError(f"Неизвестный бэкенд эмбеддингов: {backend}")
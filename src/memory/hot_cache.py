@@ -0,0 +1,238 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import threading
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Загрузчик истории пользователя: (ids, embeddings, documents, metadatas)
+UserLoader = Callable[[], Tuple[List[str], Any, List[str], List[Dict[str, Any]]]]
+
+class _UserVectors:
+    """Эмбеддинги взаимодействий пользователя в непрерывной матрице с запасом под дозапись"""
+
+    def __init__(self, embeddings: np.ndarray, ids: List[str], documents: List[str],
+                 metadatas: List[Dict[str, Any]], dtype):
+        count, dim = embeddings.shape
+        self.matrix = np.empty((max(count, 16), dim), dtype=dtype)
+        self.matrix[:count] = embeddings
+        self.norms = np.empty(self.matrix.shape[0], dtype=np.float32)
+        self.norms[:count] = np.linalg.norm(embeddings.astype(np.float32), axis=1)
+        self.count = count
+        self.ids = list(ids)
+        self.id_set = set(self.ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes + self.norms.nbytes
+
+    def append(self, embedding: np.ndarray, id: str, document: str, metadata: Dict[str, Any]):
+        if self.count == self.matrix.shape[0]:
+            # Удвоение емкости - амортизированно O(1) на запись
+            matrix = np.empty((self.count * 2, self.dim), dtype=self.matrix.dtype)
+            matrix[:self.count] = self.matrix[:self.count]
+            norms = np.empty(self.count * 2, dtype=np.float32)
+            norms[:self.count] = self.norms[:self.count]
+            self.matrix, self.norms = matrix, norms
+        self.matrix[self.count] = embedding
+        self.norms[self.count] = np.linalg.norm(embedding)
+        self.ids.append(id)
+        self.id_set.add(id)
+        self.documents.append(document)
+        self.metadatas.append(metadata)
+        self.count += 1
+
+class HotUserVectorCache:
+    """Кэш векторов активных пользователей в памяти процесса: top-k перебором
+    через матричное умножение вместо запроса к индексу Chroma с фильтром по user_id.
+
+    Согласованность с записями: новые взаимодействия дописываются в загруженную матрицу,
+    прочие изменения сбрасывают пользователя. Вытеснение - LRU по лимиту памяти.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, dtype: str = "float32",
+                 max_user_vectors: int = 20000):
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self.max_user_vectors = max_user_vectors
+
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[str, _UserVectors]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._bytes = 0
+        self._oversized: set = set()
+        self._stats = {"hits": 0, "misses": 0, "loads": 0, "appends": 0,
+                       "invalidations": 0, "evictions": 0, "bypassed": 0}
+
+    def search(self, user_id: str, query_embedding, n_results: int, space: str,
+               loader: UserLoader) -> Optional[List[Tuple[str, str, Dict[str, Any], float]]]:
+        """Top-k (id, документ, метаданные, расстояние) в метрике Chroma для коллекции.
+        None - пользователь не помещается в кэш, нужно идти в Chroma"""
+        with self._lock:
+            vectors = self._users.get(user_id)
+            if vectors is not None:
+                self._users.move_to_end(user_id)
+                self._stats["hits"] += 1
+            elif user_id in self._oversized:
+                self._stats["bypassed"] += 1
+                return None
+            else:
+                self._stats["misses"] += 1
+                version = self._versions.get(user_id, 0)
+
+        if vectors is None:
+            vectors = self._load(user_id, version, loader)
+            if vectors is None:
+                return None
+
+        # Строки до count не меняются при дозаписи, поэтому считаем вне блокировки
+        with self._lock:
+            count = vectors.count
+            matrix, norms = vectors.matrix, vectors.norms
+        if count == 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape[0] != vectors.dim:
+            logger.warning(f"Размерность запроса {query.shape[0]} не совпадает с кэшем {vectors.dim}")
+            self.invalidate(user_id)
+            return None
+
+        dots = matrix[:count] @ query
+        distances = self._distances(dots, norms[:count], query, space)
+
+        k = min(n_results, count)
+        top = np.argpartition(distances, k - 1)[:k] if k < count else np.arange(count)
+        top = top[np.argsort(distances[top])]
+        return [(vectors.ids[i], vectors.documents[i], vectors.metadatas[i], float(distances[i])) for i in top]
+
+    def warm(self, user_id: str, loader: UserLoader) -> bool:
+        """Загрузка пользователя до первого поиска (при открытии сессии).
+        False - пользователь не помещается в кэш"""
+        with self._lock:
+            if user_id in self._users:
+                self._users.move_to_end(user_id)
+                return True
+            if user_id in self._oversized:
+                return False
+            version = self._versions.get(user_id, 0)
+        return self._load(user_id, version, loader) is not None
+
+    def metadatas(self, user_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Метаданные загруженных взаимодействий пользователя; None - пользователя нет в кэше"""
+        with self._lock:
+            vectors = self._users.get(user_id)
+            return list(vectors.metadatas) if vectors is not None else None
+
+    @staticmethod
+    def _distances(dots: np.ndarray, norms: np.ndarray, query: np.ndarray, space: str) -> np.ndarray:
+        """Расстояния в тех же единицах, что возвращает Chroma"""
+        if space == "cosine":
+            return 1 - dots / np.maximum(norms * np.linalg.norm(query), 1e-12)
+        if space == "ip":
+            return 1 - dots
+        # l2 в Chroma - квадрат евклидова расстояния
+        return norms ** 2 - 2 * dots + float(query @ query)
+
+    def _load(self, user_id: str, version: int, loader: UserLoader) -> Optional[_UserVectors]:
+        ids, embeddings, documents, metadatas = loader()
+        if len(ids) > self.max_user_vectors:
+            with self._lock:
+                self._oversized.add(user_id)
+            return None
+
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1) if len(ids) else None
+        if embeddings is None:
+            # Истории нет - размерность станет известна с первой записью
+            return _UserVectors(np.empty((0, 0), dtype=np.float32), [], [], [], self.dtype)
+
+        vectors = _UserVectors(embeddings, ids, documents, metadatas, self.dtype)
+        with self._lock:
+            self._stats["loads"] += 1
+            # Запись во время загрузки - снимок мог ее не увидеть, не кэшируем
+            if self._versions.get(user_id, 0) != version or vectors.nbytes > self.max_bytes:
+                return vectors
+            self._users[user_id] = vectors
+            self._bytes += vectors.nbytes
+            self._evict()
+        return vectors
+
+    def append(self, user_id: str, id: str, embedding, document: str, metadata: Dict[str, Any]):
+        """Дозапись нового взаимодействия в загруженную матрицу пользователя"""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            vectors = self._users.get(user_id)
+            if vectors is None:
+                return
+            if id in vectors.id_set:
+                # Одновременные первые записи одного текста: вектор уже в матрице
+                vectors.metadatas[vectors.ids.index(id)] = metadata
+                return
+            embedding = np.asarray(embedding, dtype=np.float32)
+            if embedding.shape[0] != vectors.dim or vectors.count >= self.max_user_vectors:
+                self._drop(user_id)
+                return
+            before = vectors.nbytes
+            vectors.append(embedding, id, document, metadata)
+            self._bytes += vectors.nbytes - before
+            self._stats["appends"] += 1
+            self._evict()
+
+    def update_metadata(self, user_id: str, id: str, metadata: Dict[str, Any]):
+        """Замена метаданных уже загруженного взаимодействия (эмбеддинг не меняется)"""
+        with self._lock:
+            vectors = self._users.get(user_id)
+            if vectors is None:
+                return
+            try:
+                vectors.metadatas[vectors.ids.index(id)] = metadata
+            except ValueError:
+                pass
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._oversized.discard(user_id)
+            if user_id in self._users:
+                self._drop(user_id)
+                self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            for user_id in list(self._users):
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._users.clear()
+            self._oversized.clear()
+            self._bytes = 0
+
+    def _drop(self, user_id: str):
+        """Удаление пользователя из кэша (вызывать под блокировкой)"""
+        vectors = self._users.pop(user_id)
+        self._bytes -= vectors.nbytes
+
+    def _evict(self):
+        """LRU-вытеснение до лимита памяти (вызывать под блокировкой)"""
+        while self._bytes > self.max_bytes and self._users:
+            user_id = next(iter(self._users))
+            self._drop(user_id)
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "users": len(self._users),
+                "vectors": sum(v.count for v in self._users.values()),
+                "megabytes": round(self._bytes / (1024 * 1024), 2),
+                "dtype": self.dtype.name
+            }
@@ -0,0 +1,189 @@
+"""Фоновый расчет аналитики обучения: матрица навыков, пробелы и рекомендуемые темы.
+
+Расчет идет по всем записям знаний и решений пользователя, поэтому вынесен из пути
+запроса: фоновый поток пересчитывает только пользователей, у которых с прошлого раза
+были записи в память, и сохраняет результат в JSON-файл. Во время хода аналитика
+читается из словаря в памяти процесса.
+"""
+from typing import Any, Dict, List, Optional
+from collections import defaultdict
+from datetime import datetime
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Уровень понимания (1-5) или доля от него, ниже которой концепция считается пробелом
+GAP_LEVEL = 2
+GAP_SKILL = 0.5
+# Рекомендуемых тем в пути обучения
+LEARNING_PATH_LENGTH = 5
+
+def compute_insights(knowledge: List[Dict[str, Any]], solutions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Аналитика по метаданным записей знаний и решений пользователя.
+
+    Навык по теме - доля от максимального уровня понимания, усредненная со средним
+    баллом решений по этой теме (если они есть).
+    """
+    levels: Dict[str, int] = {}
+    for metadata in knowledge:
+        concept = metadata.get("concept")
+        if concept:
+            levels[concept] = max(levels.get(concept, 0), metadata.get("understanding_level", 0))
+
+    scores: Dict[str, List[float]] = defaultdict(list)
+    for metadata in solutions:
+        if metadata.get("topic"):
+            scores[metadata["topic"]].append(float(metadata.get("score", 0)))
+
+    skill_matrix: Dict[str, float] = {}
+    for topic in set(levels) | set(scores):
+        parts = []
+        if topic in levels:
+            parts.append(levels[topic] / 5)
+        if scores.get(topic):
+            parts.append(sum(scores[topic]) / len(scores[topic]) / 100)
+        skill_matrix[topic] = round(sum(parts) / len(parts), 3)
+
+    gaps = sorted(
+        (topic for topic, skill in skill_matrix.items()
+         if levels.get(topic, GAP_LEVEL + 1) <= GAP_LEVEL or skill < GAP_SKILL),
+        key=lambda topic: skill_matrix[topic]
+    )
+    # Сначала пробелы (самые слабые вперед), затем темы в процессе освоения
+    in_progress = sorted(
+        (topic for topic, skill in skill_matrix.items() if topic not in gaps and skill < 0.8),
+        key=lambda topic: skill_matrix[topic]
+    )
+
+    return {
+        "skill_matrix": skill_matrix,
+        "knowledge_gaps": gaps,
+        "learning_path": (gaps + in_progress)[:LEARNING_PATH_LENGTH],
+        "computed_at": datetime.now().isoformat()
+    }
+
+class InsightsStore:
+    """Рассчитанная аналитика по пользователям: словарь в памяти и JSON-файл на диске"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._insights: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._insights = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать аналитику {self.path}: {e}")
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._insights.get(user_id)
+
+    def put(self, user_id: str, insights: Dict[str, Any]):
+        with self._lock:
+            self._insights[user_id] = insights
+
+    def save(self):
+        """Атомарная запись файла: читатель не увидит его наполовину записанным"""
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self._insights, ensure_ascii=False)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._insights)
+
+class InsightsJob:
+    """Периодический пересчет аналитики пользователей, у которых менялись данные.
+
+    Изменения отслеживаются по версиям AnalyticsCache (растут при каждой записи
+    пользователя); при первом запуске пересчитываются все пользователи из хранилища.
+    """
+
+    def __init__(self, memory, store: InsightsStore, interval: float = 60.0):
+        self.memory = memory
+        self.store = store
+        self.interval = interval
+        self._computed_versions: Dict[str, int] = {}
+        self._full_scan_done = False
+        # Проход фонового потока и ручной вызов run_once не должны идти одновременно
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._stats = {"runs": 0, "users_computed": 0, "errors": 0, "last_run_seconds": 0.0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="insights-job", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка пересчета аналитики: {e}")
+                with self._stats_lock:
+                    self._stats["errors"] += 1
+            self._stop.wait(self.interval)
+
+    def _pending_users(self) -> Dict[str, int]:
+        """Пользователи с записями после последнего пересчета -> текущая версия"""
+        versions = self.memory.analytics_cache.versions()
+        pending = {user_id: version for user_id, version in versions.items()
+                   if self._computed_versions.get(user_id) != version}
+        if not self._full_scan_done:
+            for user_id in self.memory.known_users():
+                pending.setdefault(user_id, versions.get(user_id, 0))
+        return pending
+
+    def run_once(self) -> int:
+        """Один проход пересчета; возвращает число пересчитанных пользователей"""
+        started = time.monotonic()
+        with self._run_lock:
+            pending = self._pending_users()
+            for user_id, version in pending.items():
+                knowledge, solutions = self.memory.insight_records(user_id)
+                insights = compute_insights(knowledge, solutions)
+                insights["version"] = version
+                self.store.put(user_id, insights)
+                # Сбрасываем кэш прогресса, чтобы /analytics отдал новую аналитику с новым ETag;
+                # если пока считали, была запись - пользователь останется в очереди
+                new_version = self.memory.analytics_cache.invalidate(user_id, expected_version=version)
+                if new_version is not None:
+                    self._computed_versions[user_id] = new_version
+            self._full_scan_done = True
+            if pending:
+                self.store.save()
+                logger.info(f"Аналитика пересчитана для пользователей: {len(pending)}")
+
+        with self._stats_lock:
+            self._stats["runs"] += 1
+            self._stats["users_computed"] += len(pending)
+            self._stats["last_run_seconds"] = round(time.monotonic() - started, 3)
+        return len(pending)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {**self._stats, "users": len(self.store)}
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
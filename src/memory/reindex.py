@@ -0,0 +1,49 @@
+"""Перестроение индексов HNSW коллекций под текущие настройки.
+
+Запуск: python -m src.memory.reindex [--collection NAME] [--force] [--reembed] [--dry-run]
+"""
+import argparse
+import logging
+
+from src.config import settings
+from src.memory.vector_memory import VectorMemory, COLLECTIONS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Переиндексация коллекций Chroma")
+    parser.add_argument("--collection", choices=sorted(COLLECTIONS), action="append",
+                        help="Коллекция для переиндексации (по умолчанию - все)")
+    parser.add_argument("--force", action="store_true",
+                        help="Перестроить индекс, даже если параметры не изменились")
+    parser.add_argument("--reembed", action="store_true",
+                        help="Пересчитать эмбеддинги текущим бэкендом (EMBEDDING_BACKEND)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Только показать расхождения параметров")
+    parser.add_argument("--persist-dir", default=settings.CHROMA_PERSIST_DIR)
+    args = parser.parse_args()
+
+    memory = VectorMemory(persist_directory=args.persist_dir, check_embedding_backend=not args.reembed)
+
+    for name in args.collection or list(COLLECTIONS):
+        collection = getattr(memory, COLLECTIONS[name][1])
+        stale = memory._stale_index_params(memory._index_config(collection), settings.hnsw_config(name))
+        recorded_backend = (collection.metadata or {}).get("embedding_backend")
+        if args.reembed and recorded_backend != memory.embeddings.backend_name:
+            stale.append(f"embedding_backend: {recorded_backend} -> {memory.embeddings.backend_name}")
+
+        if args.dry_run:
+            status = ", ".join(stale) if stale else "параметры совпадают"
+            print(f"{name}: {collection.count()} записей, {status}")
+            continue
+
+        report = memory.reindex_collection(name, force=args.force, reembed=args.reembed)
+        if report["reindexed"]:
+            print(f"{name}: перестроено {report['records']} записей за {report['seconds']}с "
+                  f"({', '.join(report['changes']) or 'принудительно'})")
+        else:
+            print(f"{name}: параметры совпадают, пропущено")
+
+if __name__ == "__main__":
+    main()
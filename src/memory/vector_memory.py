@@ -1,94 +1,399 @@
 import chromadb
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from collections import Counter
+import threading
 import uuid
+import hashlib
 import logging
 import os
-from src.memory.embedding_function import GigaChatEmbeddingFunction;
-# import numpy as np
+import re
+import time
+import numpy as np
+from src.memory.embedding_function import create_embedding_function
+from src.memory.analytics_cache import AnalyticsCache
+from src.memory.hot_cache import HotUserVectorCache
+from src.memory.embedding_context import current_embedding_context
+from src.memory.insights import InsightsStore
+from src.llm.cassette import Cassette, CassetteEmbeddingFunction
+from src.config import settings
 # from langchain_gigachat.embeddings import GigaChatEmbeddings
 
 logger = logging.getLogger(__name__)
 
+# Имя коллекции -> (описание, атрибут VectorMemory)
+COLLECTIONS = {
+    "interaction_memory": ("Память для взаимодействия с пользователем", "interaction_collection"),
+    "knowledge_memory": ("Память для хранения информации о состоянии пользователя", "knowledge_collection"),
+    "solutions_memory": ("Память для решения задач", "solutions_collection"),
+    "problems_memory": ("Память для проблем с обучением", "problems_collection")
+}
+
+# Признаки кода в сообщении: такие сообщения не склеиваются с похожими
+_CODE_RE = re.compile(r"`|\bdef\s+\w+|\bclass\s+\w+\s*[:(]")
+
+# Суффикс временной коллекции при переиндексации
+REINDEX_SUFFIX = "__reindex"
+
+class EmbeddingBackendMismatch(ValueError):
+    """Коллекция заполнена эмбеддингами другого бэкенда или другой размерности"""
+
 class VectorMemory:
     """Система долгосрочной памяти с ChromaDB"""
     
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(self, persist_directory: str = "./chroma_db", check_embedding_backend: bool = True,
+                 cassette: Cassette = None):
 
         self.persist_directory = persist_directory
         # Инициализация Chroma
         self.chroma_client = chromadb.PersistentClient(path=persist_directory)
         
         #Инициализация embeddings
-        self.embeddings = GigaChatEmbeddingFunction()
+        self.embeddings = create_embedding_function()
+        if cassette is not None:
+            # Запись или воспроизведение вызовов эмбеддингов
+            self.embeddings = CassetteEmbeddingFunction(self.embeddings, cassette)
+        # Отключается только для переиндексации с пересчетом эмбеддингов
+        self.check_embedding_backend = check_embedding_backend
+        
+        # Кэш аналитики, инвалидируется при каждой записи пользователя
+        self.analytics_cache = AnalyticsCache(max_users=settings.ANALYTICS_CACHE_MAX_USERS)
+        
+        # Матрица навыков, пробелы и путь обучения, рассчитанные фоновой задачей
+        self.insights = InsightsStore(settings.INSIGHTS_PATH or os.path.join(persist_directory, "insights.json"))
+        
+        # Векторы взаимодействий активных пользователей в памяти процесса
+        self.hot_cache = HotUserVectorCache(
+            max_bytes=settings.HOT_CACHE_MAX_MB * 1024 * 1024,
+            dtype=settings.HOT_CACHE_DTYPE,
+            max_user_vectors=settings.HOT_CACHE_MAX_USER_VECTORS
+        ) if settings.HOT_CACHE_ENABLED else None
+        
+        # Счетчики записи взаимодействий и блокировка обновления occurrences
+        self._dedupe_lock = threading.Lock()
+        self._write_stats = Counter()
         
         # Создание коллекций
         self._initialize_collections()
 
     
     def _initialize_collections(self):
-        """Инициализация коллекций Chroma"""
-
-        self.interaction_collection = self.chroma_client.get_or_create_collection(
-            name="interaction_memory",
-            metadata={"description": "Память для взаимодействия с пользователем"},
+        """Инициализация коллекций Chroma с параметрами HNSW из настроек"""
+        self._spaces: Dict[str, str] = {}
+        for name in COLLECTIONS:
+            self._open_collection(name)
+    
+    def _open_collection(self, name: str):
+        """Открытие (или создание) коллекции и привязка её к атрибуту VectorMemory"""
+        self._recover_interrupted_reindex(name)
+        
+        description, attribute = COLLECTIONS[name]
+        wanted = settings.hnsw_config(name)
+        collection = self.chroma_client.get_or_create_collection(
+            name=name,
+            configuration={"hnsw": wanted},
+            metadata=self._collection_metadata(description),
             embedding_function=self.embeddings
         )
+        collection = self._check_embedding_backend(collection)
+        
+        current = self._index_config(collection)
+        # ef_search сохраняется в конфигурации и применяется при загрузке индекса (до первого
+        # запроса в процессе); остальное задается только при построении индекса
+        if current.get("ef_search") != wanted["ef_search"]:
+            collection.modify(configuration={"hnsw": {"ef_search": wanted["ef_search"]}})
+        stale = self._stale_index_params(current, wanted)
+        if stale:
+            logger.warning(
+                f"Индекс коллекции {name} построен с другими параметрами ({', '.join(stale)}), "
+                f"выполните: python -m src.memory.reindex --collection {name}"
+            )
         
-        self.knowledge_collection = self.chroma_client.get_or_create_collection(
-            name="knowledge_memory", 
-            metadata={"description": "Память для хранения информации о состоянии пользователя"},
-            embedding_function=self.embeddings
-        )
+        self._spaces[name] = current.get("space", "l2")
+        setattr(self, attribute, collection)
+        return collection
+    
+    def _collection_metadata(self, description: str) -> Dict[str, Any]:
+        """Описание коллекции и бэкенд, которым посчитаны её эмбеддинги"""
+        metadata = {"description": description, "embedding_backend": self.embeddings.backend_name}
+        if self.embeddings.dimension:
+            metadata["embedding_dimension"] = self.embeddings.dimension
+        return metadata
+    
+    def _check_embedding_backend(self, collection):
+        """Запрет смешивать в коллекции эмбеддинги разных бэкендов и размерностей"""
+        metadata = collection.metadata or {}
+        recorded = metadata.get("embedding_backend")
+        # Коллекции, созданные до выбора бэкенда, заполнялись GigaChat
+        if recorded is None and collection.count() > 0:
+            recorded = "gigachat:" + (os.getenv("GIGACHAT_EMBEDDINGS_MODEL") or "Embeddings")
+        
+        dimension = metadata.get("embedding_dimension")
+        current = self.embeddings.backend_name
+        mismatch = (recorded is not None and recorded != current) or \
+            (dimension and self.embeddings.dimension and dimension != self.embeddings.dimension)
+        if mismatch and self.check_embedding_backend:
+            raise EmbeddingBackendMismatch(
+                f"Коллекция {collection.name} заполнена эмбеддингами {recorded} "
+                f"(размерность {dimension or 'неизвестна'}), текущий бэкенд - {current}. "
+                f"Укажите другой CHROMA_PERSIST_DIR или выполните: "
+                f"python -m src.memory.reindex --reembed --collection {collection.name}"
+            )
         
-        self.solutions_collection = self.chroma_client.get_or_create_collection(
-            name="solutions_memory",
-            metadata={"description": "Память для решения задач"},
-            embedding_function=self.embeddings
-        )
+        if recorded is None:
+            # Новая или пустая коллекция - фиксируем текущий бэкенд
+            collection.modify(metadata=self._collection_metadata(metadata.get("description", "")))
+            collection = self.chroma_client.get_collection(collection.name, embedding_function=self.embeddings)
+        return collection
+    
+    @staticmethod
+    def _index_config(collection) -> Dict[str, Any]:
+        return (collection.configuration or {}).get("hnsw") or {}
+    
+    @staticmethod
+    def _stale_index_params(current: Dict[str, Any], wanted: Dict[str, Any]) -> List[str]:
+        """Параметры, для смены которых нужно перестроить индекс"""
+        return [
+            f"{param}: {current.get(param)} -> {wanted[param]}"
+            for param in ("space", "max_neighbors", "ef_construction")
+            if current.get(param) != wanted[param]
+        ]
+    
+    def _recover_interrupted_reindex(self, name: str):
+        """Если переиндексация прервалась после удаления старой коллекции - достраиваем переименование"""
+        existing = {collection.name for collection in self.chroma_client.list_collections()}
+        temporary = f"{name}{REINDEX_SUFFIX}"
+        if temporary in existing and name not in existing:
+            self.chroma_client.get_collection(temporary).modify(name=name)
+            logger.warning(f"Завершено прерванное переименование {temporary} -> {name}")
+    
+    def reindex_collection(self, name: str, force: bool = False, reembed: bool = False,
+                           batch_size: int = 500) -> Dict[str, Any]:
+        """Перестроение индекса коллекции под текущие настройки HNSW.
         
-        self.problems_collection = self.chroma_client.get_or_create_collection(
-            name="problems_memory",
-            metadata={"description": "Память для проблем с обучением"},
+        Записи копируются вместе с сохраненными эмбеддингами (без обращения к GigaChat)
+        во временную коллекцию, которая затем заменяет исходную. С reembed эмбеддинги
+        пересчитываются текущим бэкендом - так коллекция переводится на другой бэкенд.
+        """
+        if name not in COLLECTIONS:
+            raise ValueError(f"Неизвестная коллекция: {name}")
+        
+        description, attribute = COLLECTIONS[name]
+        source = getattr(self, attribute)
+        wanted = settings.hnsw_config(name)
+        stale = self._stale_index_params(self._index_config(source), wanted)
+        recorded_backend = (source.metadata or {}).get("embedding_backend")
+        if reembed and recorded_backend != self.embeddings.backend_name:
+            stale.append(f"embedding_backend: {recorded_backend} -> {self.embeddings.backend_name}")
+        if not stale and not force:
+            return {"collection": name, "reindexed": False, "records": source.count()}
+        
+        temporary = f"{name}{REINDEX_SUFFIX}"
+        # Исходная коллекция еще на месте - значит, прошлая копия неполная
+        if temporary in {collection.name for collection in self.chroma_client.list_collections()}:
+            self.chroma_client.delete_collection(temporary)
+        
+        # Без пересчета эмбеддинги остаются от прежнего бэкенда - сохраняем его отметку
+        metadata = self._collection_metadata(description) if reembed else \
+            (source.metadata or {"description": description})
+        target = self.chroma_client.create_collection(
+            name=temporary,
+            configuration={"hnsw": wanted},
+            metadata=metadata,
             embedding_function=self.embeddings
         )
+        
+        started = time.perf_counter()
+        copied = 0
+        total = source.count()
+        while copied < total:
+            batch = source.get(
+                limit=batch_size,
+                offset=copied,
+                include=["embeddings", "documents", "metadatas"]
+            )
+            if not batch['ids']:
+                break
+            embeddings = self.embeddings(batch['documents']) if reembed else batch['embeddings']
+            target.add(
+                ids=batch['ids'],
+                embeddings=embeddings,
+                documents=batch['documents'],
+                metadatas=batch['metadatas']
+            )
+            copied += len(batch['ids'])
+        
+        self.chroma_client.delete_collection(name)
+        target.modify(name=name)
+        self._open_collection(name)
+        if name == "interaction_memory" and self.hot_cache is not None:
+            # Метрика могла смениться - расстояния в кэше считаются по новой
+            self.hot_cache.clear()
+        
+        elapsed = time.perf_counter() - started
+        logger.info(f"Коллекция {name} переиндексирована: {copied} записей за {elapsed:.1f}с")
+        return {
+            "collection": name,
+            "reindexed": True,
+            "records": copied,
+            "changes": stale,
+            "seconds": round(elapsed, 2)
+        }
+    
+    def embed(self, texts: List[str]) -> List[np.ndarray]:
+        """Эмбеддинги текстов; внутри хода (EmbeddingContext) повторный текст не пересчитывается"""
+        context = current_embedding_context()
+        if context is None:
+            return [np.asarray(vector, dtype=np.float32) for vector in self.embeddings(list(texts))]
+        return context.embed(texts, self.embeddings)
+    
+    def relevance_score(self, collection_name: str, distance: float) -> float:
+        """Перевод расстояния Chroma в релевантность с учетом метрики коллекции"""
+        if self._spaces.get(collection_name) in ("cosine", "ip"):
+            # cosine: 1 - cos, ip: 1 - скалярное произведение
+            return 1 - distance
+        # l2 в Chroma - квадрат евклидова расстояния, не ограничен сверху
+        return 1 / (1 + distance)
     
     def store_interaction(self, user_id: str, session_id: str, message: Any, 
                          topic: str, knowledge_level: str, learning_style: str,
-                         metadata: Dict[str, Any]) -> str:
-        """Сохранение взаимодействия в память"""
+                         metadata: Dict[str, Any]) -> Optional[str]:
+        """Сохранение взаимодействия в память.
+        
+        Слишком короткие сообщения не сохраняются (возвращается None). Повтор уже
+        сохраненного текста - точный (по хэшу) или почти точный (по близости эмбеддингов) -
+        увеличивает счетчик occurrences существующей записи вместо новой.
+        """
         content = message.content if hasattr(message, 'content') else str(message)
-        interaction_id = f"{user_id}_{datetime.now().timestamp()}_{uuid.uuid4().hex[:8]}"
         
         print("-------Контент Сохранение взаимодействия----------")
         print(content)
 
-        # print("-------interaction_id Сохранение взаимодействия----------")
-        # print(interaction_id)
+        if not self._has_min_content(content):
+            self._count_write("filtered")
+            return None
+        
+        timestamp = datetime.now().isoformat()
+        interaction_metadata = {
+            "user_id": user_id,
+            "session_id": session_id,
+            "topic": topic,
+            "knowledge_level": knowledge_level,
+            "learning_style": learning_style,
+            "timestamp": timestamp,
+            "last_seen": timestamp,
+            "occurrences": 1,
+            "message_type": type(message).__name__,
+            "memory_type": "interaction",
+            **metadata
+        }
+        
+        # Код и ответы на задачу не склеиваются: "почти такое же" решение - другое решение
+        dedupe = settings.INTERACTION_DEDUPE_ENABLED and self._can_fold(content, interaction_metadata)
+        if dedupe:
+            # id из хэша текста: точный повтор находится без вызова эмбеддингов
+            interaction_id = f"{user_id}_{self.content_hash(content)[:16]}"
+            if self._bump_occurrences(user_id, interaction_id, timestamp):
+                self._count_write("exact_duplicates")
+                return interaction_id
+        else:
+            interaction_id = f"{user_id}_{datetime.now().timestamp()}_{uuid.uuid4().hex[:8]}"
 
         # Создание embedding
-        embedding = self.embeddings.embed_query(content)
+        embedding = self.embed([content])[0]
+        
+        if dedupe:
+            duplicate_id = self._find_near_duplicate(user_id, embedding)
+            if duplicate_id and self._bump_occurrences(user_id, duplicate_id, timestamp):
+                self._count_write("near_duplicates")
+                return duplicate_id
 
         # Сохранение в Chroma
         self.interaction_collection.add(
             ids=[interaction_id],
-            embeddings=[embedding[0]],
+            embeddings=[embedding],
             documents=[content],
-            metadatas=[{
-                "user_id": user_id,
-                "session_id": session_id,
-                "topic": topic,
-                "knowledge_level": knowledge_level,
-                "learning_style": learning_style,
-                "timestamp": datetime.now().isoformat(),
-                "message_type": type(message).__name__,
-                "memory_type": "interaction",
-                **metadata
-            }]
+            metadatas=[interaction_metadata]
         )
+        self.analytics_cache.invalidate(user_id)
+        if self.hot_cache is not None:
+            self.hot_cache.append(user_id, interaction_id, embedding, content, interaction_metadata)
+        self._count_write("stored")
         
         return interaction_id
     
+    @staticmethod
+    def _has_min_content(content: str) -> bool:
+        """Фильтр коротких сообщений ("ок", "спасибо") по числу слов и букв"""
+        words = re.findall(r"\w+", content)
+        return (len(words) >= settings.INTERACTION_MIN_WORDS
+                and sum(len(word) for word in words) >= settings.INTERACTION_MIN_CHARS)
+    
+    @staticmethod
+    def _can_fold(content: str, metadata: Dict[str, Any]) -> bool:
+        """Можно ли учесть сообщение как повтор существующей записи"""
+        return metadata.get("learning_mode") != "assessment" and not _CODE_RE.search(content)
+    
+    def _find_near_duplicate(self, user_id: str, embedding: np.ndarray) -> Optional[str]:
+        """id ближайшего взаимодействия пользователя, если оно почти совпадает с новым"""
+        if self.hot_cache is not None:
+            hits = self.hot_cache.search(
+                user_id, embedding, 1,
+                space=self._spaces["interaction_memory"],
+                loader=lambda: self._load_user_interactions(user_id)
+            )
+            if hits is not None:
+                nearest = [(hit_id, distance) for hit_id, _, _, distance in hits]
+            else:
+                nearest = self._nearest_interaction(user_id, embedding)
+        else:
+            nearest = self._nearest_interaction(user_id, embedding)
+        
+        if not nearest:
+            return None
+        nearest_id, distance = nearest[0]
+        if self.relevance_score("interaction_memory", distance) >= settings.INTERACTION_NEAR_DUPLICATE_SCORE:
+            return nearest_id
+        return None
+    
+    def _nearest_interaction(self, user_id: str, embedding: np.ndarray) -> List[Tuple[str, float]]:
+        results = self.interaction_collection.query(
+            query_embeddings=[embedding],
+            n_results=1,
+            where={"user_id": user_id},
+            include=["distances"]
+        )
+        return list(zip(results['ids'][0], results['distances'][0])) if results['ids'] else []
+    
+    def _bump_occurrences(self, user_id: str, interaction_id: str, timestamp: str) -> bool:
+        """Учет повтора в существующей записи; False - записи нет"""
+        with self._dedupe_lock:
+            existing = self.interaction_collection.get(ids=[interaction_id], include=["metadatas"])
+            if not existing['ids']:
+                return False
+            metadata = dict(existing['metadatas'][0])
+            metadata["occurrences"] = metadata.get("occurrences", 1) + 1
+            metadata["last_seen"] = timestamp
+            self.interaction_collection.update(ids=[interaction_id], metadatas=[metadata])
+        
+        self.analytics_cache.invalidate(user_id)
+        if self.hot_cache is not None:
+            self.hot_cache.update_metadata(user_id, interaction_id, metadata)
+        return True
+    
+    def _count_write(self, outcome: str):
+        with self._dedupe_lock:
+            self._write_stats[outcome] += 1
+    
+    def write_stats(self) -> Dict[str, Any]:
+        """Итоги записи взаимодействий: сохранено, повторы, отфильтровано"""
+        with self._dedupe_lock:
+            stats = {key: self._write_stats.get(key, 0)
+                     for key in ("stored", "exact_duplicates", "near_duplicates", "filtered")}
+        total = sum(stats.values())
+        stats["dedupe_rate"] = (stats["exact_duplicates"] + stats["near_duplicates"]) / total if total else 0.0
+        return stats
+    
     def retrieve_relevant_memories(self, user_id: str, query: str, 
                                  n_results: int = 15) -> List[Dict]:
         """Поиск релевантных воспоминаний с RAG"""
@@ -97,9 +402,19 @@ class VectorMemory:
         # print(user_id)
         # print(query)
         
+        query_embedding = self.embed([query])[0]
+        if self.hot_cache is not None:
+            hits = self.hot_cache.search(
+                user_id, query_embedding, n_results,
+                space=self._spaces["interaction_memory"],
+                loader=lambda: self._load_user_interactions(user_id)
+            )
+            if hits is not None:
+                return [self._memory_entry(doc, metadata, distance) for _, doc, metadata, distance in hits]
+        
         # Поиск в Chroma
         results = self.interaction_collection.query(
-            query_texts=[query],
+            query_embeddings=[query_embedding],
             n_results=n_results,
             where={"user_id": user_id}
         )
@@ -114,15 +429,53 @@ class VectorMemory:
                 results['metadatas'][0], 
                 results['distances'][0]
             )):
-                memories.append({
-                    "content": doc,
-                    "metadata": metadata,
-                    "relevance_score": 1 - distance,
-                    "memory_type": metadata.get("memory_type", "interaction")
-                })
+                memories.append(self._memory_entry(doc, metadata, distance))
         
         return memories
     
+    def warm_user(self, user_id: str) -> bool:
+        """Загрузка векторов пользователя в hot_cache до первого поиска"""
+        if self.hot_cache is None:
+            return False
+        return self.hot_cache.warm(user_id, lambda: self._load_user_interactions(user_id))
+    
+    def recent_topics(self, user_id: str, limit: int = 3) -> List[str]:
+        """Темы последних взаимодействий пользователя, от новых к старым.
+        Если пользователь уже загружен в hot_cache (warm_user), Chroma не читается"""
+        metadatas = self.hot_cache.metadatas(user_id) if self.hot_cache is not None else None
+        if metadatas is None:
+            results = self.interaction_collection.get(where={"user_id": user_id}, include=["metadatas"])
+            metadatas = results.get('metadatas') or []
+        metadatas = sorted(
+            metadatas,
+            key=lambda m: m.get('last_seen') or m.get('timestamp', ''),
+            reverse=True
+        )
+        topics = []
+        for metadata in metadatas:
+            topic = metadata.get('topic')
+            if topic and topic not in topics:
+                topics.append(topic)
+                if len(topics) == limit:
+                    break
+        return topics
+    
+    def _memory_entry(self, doc: str, metadata: Dict[str, Any], distance: float) -> Dict[str, Any]:
+        return {
+            "content": doc,
+            "metadata": metadata,
+            "relevance_score": self.relevance_score("interaction_memory", distance),
+            "memory_type": metadata.get("memory_type", "interaction")
+        }
+    
+    def _load_user_interactions(self, user_id: str):
+        """Все взаимодействия пользователя с эмбеддингами - для загрузки в hot_cache"""
+        results = self.interaction_collection.get(
+            where={"user_id": user_id},
+            include=["embeddings", "documents", "metadatas"]
+        )
+        return results['ids'], results['embeddings'], results['documents'], results['metadatas']
+    
     def store_solution(self, user_id: str, solution: Dict) -> str:
         """Сохранение решения задачи"""
         solution_id = f"solution_{user_id}_{uuid.uuid4().hex[:8]}"
@@ -134,7 +487,7 @@ class VectorMemory:
         Тема: {solution.get('topic', '')}
         """
         
-        embedding = self.embeddings.embed_query(solution_text)
+        embedding = self.embed([solution_text])[0]
         
         self.solutions_collection.add(
             ids=[solution_id],
@@ -150,6 +503,7 @@ class VectorMemory:
                 "memory_type": "solution"
             }]
         )
+        self.analytics_cache.invalidate(user_id)
         
         return solution_id
     
@@ -164,7 +518,7 @@ class VectorMemory:
         Тема: {problem.get('topic', '')}
         """
         
-        embedding = self.embeddings.embed_query(problem_text)
+        embedding = self.embed([problem_text])[0]
         
         self.problems_collection.add(
             ids=[problem_id],
@@ -175,6 +529,7 @@ class VectorMemory:
                 "problem_type": problem.get('problem_type', ''),
                 "difficulty": problem.get('difficulty', 'easy'),
                 "topic": problem.get('topic', ''),
+                "statement_hash": self.problem_statement_hash(problem.get('problem_statement', '')),
                 "timestamp": datetime.now().isoformat(),
                 "memory_type": "problem"
             }]
@@ -182,11 +537,32 @@ class VectorMemory:
         
         return problem_id
     
+    @staticmethod
+    def content_hash(text: str) -> str:
+        """Хэш текста без учета пробелов по краям и между словами; регистр учитывается"""
+        normalized = " ".join(text.split())
+        return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def problem_statement_hash(problem_statement: str) -> str:
+        """Хэш нормализованной формулировки задачи для дедупликации"""
+        normalized = " ".join(problem_statement.lower().split())
+        return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+    
+    def has_problem(self, problem_statement: str, user_id: str = None) -> bool:
+        """Проверка, сохранялась ли уже задача с такой формулировкой"""
+        where = {"statement_hash": self.problem_statement_hash(problem_statement)}
+        if user_id:
+            where = {"$and": [where, {"user_id": user_id}]}
+        
+        existing = self.problems_collection.get(where=where, limit=1, include=[])
+        return bool(existing['ids'])
+    
     def retrieve_similar_problems(self, user_id: str, topic: str, 
                                 problem_type: str, n_results: int = 3) -> List[Dict]:
         """Поиск похожих задач"""
         results = self.problems_collection.query(
-            query_texts=[f"{topic} {problem_type}"],
+            query_embeddings=self.embed([f"{topic} {problem_type}"]),
             n_results=n_results,
             where={"user_id": user_id}
         )
@@ -230,55 +606,90 @@ class VectorMemory:
     def update_knowledge_state(self, user_id: str, concept: str, 
                              understanding_level: int, examples: int = 0):
         """Обновление состояния знаний пользователя"""
+        self.update_knowledge_states(user_id, [(concept, understanding_level, examples)])
+    
+    def update_knowledge_states(self, user_id: str,
+                                updates: List[Tuple[str, int, int]]) -> List[str]:
+        """Пакетное обновление состояния знаний: одно чтение и один upsert на все концепции.
+        
+        Документ концепции содержит только уровень понимания, поэтому при изменении
+        одних счетчиков примеров эмбеддинг не пересчитывается.
+        """
+        if not updates:
+            return []
         
-        knowledge_id = f"knowledge_{user_id}_{concept}"
+        # Повторы концепции внутри пакета сводим в одну запись
+        merged: Dict[str, Tuple[int, int]] = {}
+        for concept, understanding_level, examples in updates:
+            level, total_examples = merged.get(concept, (understanding_level, 0))
+            merged[concept] = (max(level, understanding_level), total_examples + examples)
+        
+        knowledge_ids = [f"knowledge_{user_id}_{concept}" for concept in merged]
         current_time = datetime.now().isoformat()
         
         existing = self.knowledge_collection.get(
-            ids=[knowledge_id],
-            where={"user_id": user_id, "concept": concept}
+            ids=knowledge_ids,
+            include=["documents", "metadatas", "embeddings"]
         )
+        existing_by_id = {
+            knowledge_id: (document, metadata, embedding)
+            for knowledge_id, document, metadata, embedding in zip(
+                existing['ids'], existing['documents'], existing['metadatas'], existing['embeddings']
+            )
+        }
         
-        knowledge_text = f"Concept: {concept}, Understanding: {understanding_level}/5, Examples: {examples}"
-        
-        if existing['ids']:
-            current_level = existing['metadatas'][0].get("understanding_level", 1)
-            current_examples = existing['metadatas'][0].get("examples_understood", 0)
-            
-            new_level = max(current_level, understanding_level)
-            new_examples = current_examples + examples
+        documents, metadatas, embeddings = [], [], []
+        to_embed = []
+        for knowledge_id, (concept, (understanding_level, examples)) in zip(knowledge_ids, merged.items()):
+            current = existing_by_id.get(knowledge_id)
+            if current:
+                current_document, current_metadata, current_embedding = current
+                understanding_level = max(current_metadata.get("understanding_level", 1), understanding_level)
+                examples += current_metadata.get("examples_understood", 0)
             
-            embedding = self.embeddings.embed_query(knowledge_text)
+            knowledge_text = f"Concept: {concept}, Understanding: {understanding_level}/5"
             
-            self.knowledge_collection.update(
-                ids=[knowledge_id],
-                embeddings=[embedding],
-                documents=[knowledge_text],
-                metadatas=[{
-                    "user_id": user_id,
-                    "concept": concept,
-                    "understanding_level": new_level,
-                    "examples_understood": new_examples,
-                    "last_reviewed": current_time,
-                    "memory_type": "knowledge"
-                }]
-            )
-        else:
-            embedding = self.embeddings.embed_query(knowledge_text)
+            if current and current_document == knowledge_text and current_embedding is not None:
+                embeddings.append(np.asarray(current_embedding, dtype=np.float32))
+            else:
+                embeddings.append(None)
+                to_embed.append(len(documents))
             
-            self.knowledge_collection.add(
-                ids=[knowledge_id],
-                embeddings=[embedding],
-                documents=[knowledge_text],
-                metadatas=[{
-                    "user_id": user_id,
-                    "concept": concept,
-                    "understanding_level": understanding_level,
-                    "examples_understood": examples,
-                    "last_reviewed": current_time,
-                    "memory_type": "knowledge"
-                }]
-            )
+            documents.append(knowledge_text)
+            metadatas.append({
+                "user_id": user_id,
+                "concept": concept,
+                "understanding_level": understanding_level,
+                "examples_understood": examples,
+                "last_reviewed": current_time,
+                "memory_type": "knowledge"
+            })
+        
+        # Эмбеддинги считаем одним батчем и только для изменившихся документов
+        if to_embed:
+            new_embeddings = self.embed([documents[i] for i in to_embed])
+            for i, embedding in zip(to_embed, new_embeddings):
+                embeddings[i] = embedding
+        
+        self.knowledge_collection.upsert(
+            ids=knowledge_ids,
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas
+        )
+        
+        self.analytics_cache.invalidate(user_id)
+        logger.info(f"Обновлено концепций: {len(knowledge_ids)}, пересчитано эмбеддингов: {len(to_embed)}")
+        
+        return knowledge_ids
+    
+    def get_cached_learning_progress(self, user_id: str) -> Tuple[Dict[str, Any], str]:
+        """Прогресс обучения из кэша и его ETag. Результат не изменять"""
+        return self.analytics_cache.get_or_compute(user_id, self.get_learning_progress)
+    
+    def get_learning_progress_etag(self, user_id: str) -> str:
+        """ETag прогресса обучения без обращения к Chroma"""
+        return self.analytics_cache.etag(user_id)
     
     def get_learning_progress(self, user_id: str) -> Dict[str, Any]:
         """Получение прогресса обучения пользователя"""
@@ -289,7 +700,8 @@ class VectorMemory:
         
         # Анализ прогресса
         topics_covered = set()
-        total_interactions = len(interaction_results['ids']) if interaction_results['ids'] else 0
+        # Повторы хранятся одной записью со счетчиком occurrences
+        total_interactions = sum(m.get('occurrences', 1) for m in interaction_results.get('metadatas') or [])
         understanding_levels = []
         
         for metadata in knowledge_results.get('metadatas', []):
@@ -310,12 +722,34 @@ class VectorMemory:
             "average_understanding": avg_understanding,
             "problems_solved": len(solutions_results.get('ids', [])),
             "average_score": avg_score,
-            "knowledge_gaps": self._identify_knowledge_gaps(knowledge_results),
             "skill_progression": self._analyze_skill_progression(solutions_results)
         }
         
+        # Пробелы и путь обучения считает фоновая задача; до первого расчета - по уровням понимания
+        insights = self.insights.get(user_id)
+        if insights:
+            progress["knowledge_gaps"] = insights["knowledge_gaps"]
+            progress["skill_matrix"] = insights["skill_matrix"]
+            progress["learning_path"] = insights["learning_path"]
+        else:
+            progress["knowledge_gaps"] = self._identify_knowledge_gaps(knowledge_results)
+        
         return progress
     
+    def known_users(self) -> List[str]:
+        """Все пользователи с записями знаний или решений"""
+        users = set()
+        for collection in (self.knowledge_collection, self.solutions_collection):
+            users.update(m.get("user_id") for m in collection.get(include=["metadatas"])["metadatas"])
+        users.discard(None)
+        return sorted(users)
+    
+    def insight_records(self, user_id: str) -> Tuple[List[Dict], List[Dict]]:
+        """Метаданные знаний и решений пользователя для фонового расчета аналитики"""
+        knowledge = self.knowledge_collection.get(where={"user_id": user_id}, include=["metadatas"])
+        solutions = self.solutions_collection.get(where={"user_id": user_id}, include=["metadatas"])
+        return knowledge["metadatas"] or [], solutions["metadatas"] or []
+    
     def _identify_knowledge_gaps(self, knowledge_results: Dict) -> List[str]:
         """Идентификация пробелов в знаниях"""
         gaps = []
@@ -0,0 +1,72 @@
+from typing import Any, Dict, Set
+from collections import defaultdict
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ConnectionManager:
+    """Открытые WebSocket-соединения по пользователям - для сообщений по инициативе сервера.
+
+    У каждого соединения своя очередь исходящих сообщений, которую вычитывает одна
+    задача-отправитель: фрагменты ответа, ответы и push-сообщения не перемешиваются.
+    """
+
+    def __init__(self, max_queue: int = 1000):
+        self.max_queue = max_queue
+        self._outboxes: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._loop: asyncio.AbstractEventLoop = None
+        self.dropped = 0
+
+    def connect(self, user_id: str) -> asyncio.Queue:
+        """Регистрация соединения (вызывать из event loop); возвращает его очередь"""
+        self._loop = asyncio.get_running_loop()
+        outbox = asyncio.Queue(maxsize=self.max_queue)
+        self._outboxes[user_id].add(outbox)
+        return outbox
+
+    def disconnect(self, user_id: str, outbox: asyncio.Queue):
+        outboxes = self._outboxes.get(user_id)
+        if outboxes is None:
+            return
+        outboxes.discard(outbox)
+        if not outboxes:
+            del self._outboxes[user_id]
+
+    def is_connected(self, user_id: str) -> bool:
+        return bool(self._outboxes.get(user_id))
+
+    def send(self, user_id: str, message: Dict[str, Any]) -> int:
+        """Постановка сообщения во все соединения пользователя (из event loop)"""
+        delivered = 0
+        for outbox in list(self._outboxes.get(user_id, ())):
+            if self.put(outbox, message):
+                delivered += 1
+        return delivered
+
+    def put(self, outbox: asyncio.Queue, message: Dict[str, Any]) -> bool:
+        try:
+            outbox.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            # Клиент не успевает читать - не копим память на медленном соединении
+            self.dropped += 1
+            logger.warning("Очередь WebSocket переполнена, сообщение отброшено")
+            return False
+
+    def put_threadsafe(self, outbox: asyncio.Queue, message: Dict[str, Any]):
+        """Постановка сообщения в очередь соединения из рабочего потока"""
+        self._loop.call_soon_threadsafe(self.put, outbox, message)
+
+    def push(self, user_id: str, message: Dict[str, Any]):
+        """Сообщение пользователю из рабочего потока (вне event loop)"""
+        if self._loop is None or not self.is_connected(user_id):
+            return
+        self._loop.call_soon_threadsafe(self.send, user_id, message)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self._outboxes),
+            "connections": sum(len(o) for o in self._outboxes.values()),
+            "dropped_messages": self.dropped
+        }
@@ -0,0 +1,51 @@
+"""Один процесс сервиса на каталог данных.
+
+Сессии, кэш аналитики с его ETag, hot_cache векторов и фоновый пересчет аналитики
+живут в памяти процесса. Второй воркер uvicorn (или второй контейнер на том же
+CHROMA_PERSIST_DIR) отдавал бы устаревшие ETag и затирал бы файл аналитики, поэтому
+при старте берется эксклюзивная блокировка файла в каталоге данных.
+"""
+from typing import IO, Optional
+import os
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows - блокировка не проверяется
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE = ".service.lock"
+
+class InstanceLocked(RuntimeError):
+    """Каталог данных уже занят другим процессом сервиса"""
+
+def acquire_instance_lock(data_dir: str) -> Optional[IO]:
+    """Блокировка каталога данных на время жизни процесса.
+    Возвращает открытый файл блокировки - его нужно держать до завершения"""
+    if fcntl is None:
+        logger.warning("fcntl недоступен: запуск одного процесса на каталог данных не проверяется")
+        return None
+
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, LOCK_FILE)
+    handle = open(path, "a+")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        raise InstanceLocked(
+            f"Каталог {data_dir} уже используется другим процессом сервиса. "
+            f"Сервис рассчитан на один воркер: запускайте uvicorn без --workers"
+        )
+    handle.seek(0)
+    handle.truncate()
+    handle.write(str(os.getpid()))
+    handle.flush()
+    return handle
+
+def release_instance_lock(handle: Optional[IO]):
+    if handle is not None and fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        handle.close()
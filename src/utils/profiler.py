@@ -0,0 +1,322 @@
+"""Статистический профилировщик отдельных запросов.
+
+Пока запрос профилируется, фоновый поток с заданным интервалом снимает стеки потоков,
+работающих на этот запрос (поток пула, выполняющий обработчик, и потоки попыток вызова
+LLM), и копит два профиля: wall - все время, включая ожидание сети и блокировок,
+cpu - только время на процессоре (по CPU-часам потока). Результат отдается в формате
+speedscope (https://www.speedscope.app) или как свернутые стеки для flamegraph.pl.
+"""
+from typing import Any, Callable, Counter as CounterType, Dict, List, Optional, Tuple, TypeVar
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+import functools
+import itertools
+import random
+import sys
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Кадр стека: (функция, файл, строка начала функции)
+Frame = Tuple[str, str, int]
+
+_MAX_DEPTH = 256
+
+def _cpu_clock(ident: int) -> Optional[int]:
+    """CPU-часы потока (Linux); None - платформа не дает их читать"""
+    try:
+        return time.pthread_getcpuclockid(ident)
+    except (AttributeError, OSError):
+        return None
+
+def _frame_name(frame) -> str:
+    """Имя функции с классом, если он виден (co_qualname есть только с Python 3.11)"""
+    code = frame.f_code
+    qualname = getattr(code, "co_qualname", None)
+    if qualname:
+        return qualname
+    owner = frame.f_locals.get("self") if code.co_argcount else None
+    if owner is not None:
+        return f"{type(owner).__name__}.{code.co_name}"
+    return code.co_name
+
+def _stack(frame) -> Tuple[Frame, ...]:
+    stack = []
+    while frame is not None and len(stack) < _MAX_DEPTH:
+        code = frame.f_code
+        stack.append((_frame_name(frame), code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+class Profile:
+    """Стеки одного запроса: миллисекунды wall и cpu на каждый уникальный стек"""
+
+    def __init__(self, profile_id: str, name: str):
+        self.id = profile_id
+        self.name = name
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self.duration_ms: Optional[float] = None
+        self.status: Optional[int] = None
+        self.samples = 0
+        self.wall: CounterType[Tuple[Frame, ...]] = Counter()
+        self.cpu: CounterType[Tuple[Frame, ...]] = Counter()
+        self.cpu_supported = True
+        self._lock = threading.Lock()
+        # ident потока -> (имя, CPU-часы, последнее значение CPU-времени)
+        self._threads: Dict[int, List[Any]] = {}
+
+    def attach(self, ident: int, name: str):
+        clock = _cpu_clock(ident)
+        with self._lock:
+            self._threads[ident] = [name, clock, time.clock_gettime(clock) if clock is not None else 0.0]
+            self.cpu_supported = self.cpu_supported and clock is not None
+
+    def detach(self, ident: int):
+        with self._lock:
+            self._threads.pop(ident, None)
+
+    def sample(self, frames: Dict[int, Any], elapsed_ms: float):
+        with self._lock:
+            threads = list(self._threads.items())
+        for ident, entry in threads:
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            name, clock, last_cpu = entry
+            stack = ((f"thread {name}", "", 0),) + _stack(frame)
+            with self._lock:
+                self.samples += 1
+                self.wall[stack] += elapsed_ms
+                if clock is not None:
+                    try:
+                        cpu = time.clock_gettime(clock)
+                    except OSError:
+                        continue  # поток завершился между снимком и чтением часов
+                    if cpu > last_cpu:
+                        self.cpu[stack] += (cpu - last_cpu) * 1000
+                    entry[2] = cpu
+
+    def finish(self, status: Optional[int]):
+        self.duration_ms = round((time.monotonic() - self._started) * 1000, 1)
+        self.status = status
+        with self._lock:
+            self._threads.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "id": self.id,
+                "name": self.name,
+                "started_at": self.started_at,
+                "duration_ms": self.duration_ms,
+                "status": self.status,
+                "samples": self.samples,
+                "wall_ms": round(sum(self.wall.values()), 1),
+                "cpu_ms": round(sum(self.cpu.values()), 1) if self.cpu_supported else None
+            }
+
+    def to_speedscope(self) -> Dict[str, Any]:
+        """Файл speedscope с двумя профилями: cpu и wall"""
+        frames: List[Dict[str, Any]] = []
+        index: Dict[Frame, int] = {}
+
+        def frame_index(frame: Frame) -> int:
+            if frame not in index:
+                index[frame] = len(frames)
+                name, file, line = frame
+                frames.append({"name": name, "file": file, "line": line} if file else {"name": name})
+            return index[frame]
+
+        profiles = []
+        with self._lock:
+            kinds = [("cpu", self.cpu)] if self.cpu_supported else []
+            kinds.append(("wall", self.wall))
+            for kind, stacks in kinds:
+                samples = [[frame_index(frame) for frame in stack] for stack in stacks]
+                weights = [round(ms, 3) for ms in stacks.values()]
+                profiles.append({
+                    "type": "sampled",
+                    "name": f"{self.name} ({kind})",
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": round(sum(weights), 3),
+                    "samples": samples,
+                    "weights": weights
+                })
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "learning-companion-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles
+        }
+
+    def to_collapsed(self, kind: str = "cpu") -> str:
+        """Свернутые стеки "a;b;c <мкс>" для flamegraph.pl и speedscope"""
+        with self._lock:
+            stacks = self.cpu if kind == "cpu" and self.cpu_supported else self.wall
+            lines = []
+            for stack, ms in stacks.most_common():
+                path = ";".join(f"{name} ({file.rsplit('/', 1)[-1]}:{line})" if file else name
+                                for name, file, line in stack)
+                lines.append(f"{path} {max(int(ms * 1000), 1)}")
+        return "\n".join(lines) + "\n"
+
+_current_profile: ContextVar[Optional[Profile]] = ContextVar("request_profile", default=None)
+
+def current_profile() -> Optional[Profile]:
+    return _current_profile.get()
+
+def profiled_call(fn: Callable[..., T], *args: Any) -> T:
+    """Вызов fn в текущем потоке с его снятием в профиль запроса (если запрос профилируется)"""
+    profile = _current_profile.get()
+    if profile is None:
+        return fn(*args)
+    ident = threading.get_ident()
+    profile.attach(ident, threading.current_thread().name)
+    try:
+        return fn(*args)
+    finally:
+        profile.detach(ident)
+
+def bind(fn: Callable[..., T]) -> Callable[..., T]:
+    """Обертка для передачи в пул потоков: run_in_threadpool переносит contextvars, но поток
+    пула не снимается профилировщиком, пока его не подключить к профилю - это и делает bind"""
+    profile = _current_profile.get()
+    if profile is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args: Any, **kwargs: Any) -> T:
+        token = _current_profile.set(profile)
+        try:
+            return profiled_call(functools.partial(fn, *args, **kwargs))
+        finally:
+            _current_profile.reset(token)
+    return run
+
+class RequestProfiler:
+    """Запуск профилей запросов, общий поток снятия стеков и хранилище последних профилей"""
+
+    def __init__(self, interval: float = 0.005, sample_rate: float = 0.0, max_profiles: int = 20):
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        self._active: Dict[str, Profile] = {}
+        self._profiles: "OrderedDict[str, Profile]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._sampler: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_settings(cls, settings) -> "RequestProfiler":
+        return cls(
+            interval=settings.PROFILER_INTERVAL_MS / 1000,
+            sample_rate=settings.PROFILE_SAMPLE_RATE,
+            max_profiles=settings.PROFILER_MAX_PROFILES
+        )
+
+    def should_sample(self) -> bool:
+        """Случайная выборка запросов для профилирования без явного флага"""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self, name: str) -> Profile:
+        profile = Profile(f"{int(time.time())}-{next(self._ids)}", name)
+        with self._lock:
+            self._active[profile.id] = profile
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._sampler.start()
+        return profile
+
+    def finish(self, profile: Profile, status: Optional[int] = None):
+        profile.finish(status)
+        with self._lock:
+            self._active.pop(profile.id, None)
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+        logger.info(f"Профиль {profile.id} ({profile.name}): {profile.duration_ms} мс, {profile.samples} снимков")
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return [profile.summary() for profile in reversed(profiles)]
+
+    def _run(self):
+        """Снятие стеков, пока есть активные профили; затем поток завершается"""
+        try:
+            last = time.monotonic()
+            while True:
+                time.sleep(self.interval)
+                with self._lock:
+                    active = list(self._active.values())
+                    if not active:
+                        self._sampler = None
+                        return
+                now = time.monotonic()
+                frames = sys._current_frames()
+                for profile in active:
+                    profile.sample(frames, (now - last) * 1000)
+                last = now
+                del frames
+        except Exception as e:
+            logger.error(f"Поток профилировщика остановлен из-за ошибки: {e}")
+        finally:
+            # Следующий профиль запустит новый поток, даже если этот упал
+            with self._lock:
+                if self._sampler is threading.current_thread():
+                    self._sampler = None
+
+class ProfilingMiddleware:
+    """ASGI-middleware: профилирует HTTP-запрос, если админ попросил (заголовок X-Profile: 1
+    или ?profile=1 вместе с X-Admin-Token) или запрос попал в случайную выборку"""
+
+    def __init__(self, app, profiler: RequestProfiler, is_admin: Callable[[Optional[str]], bool]):
+        self.app = app
+        self.profiler = profiler
+        self.is_admin = is_admin
+
+    def _requested(self, scope) -> bool:
+        headers = dict(scope.get("headers") or [])
+        flag = headers.get(b"x-profile", b"").decode() == "1" or \
+            b"profile=1" in scope.get("query_string", b"").split(b"&")
+        if not flag:
+            return False
+        token = headers.get(b"x-admin-token")
+        return self.is_admin(token.decode() if token else None)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/admin/") or \
+                not (self._requested(scope) or self.profiler.should_sample()):
+            await self.app(scope, receive, send)
+            return
+
+        profile = self.profiler.start(f"{scope['method']} {scope['path']}")
+        status = None
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        token = _current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _current_profile.reset(token)
+            self.profiler.finish(profile, status)
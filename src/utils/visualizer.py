@@ -16,6 +16,10 @@ class GraphVisualizer:
             G = nx.DiGraph()
             
             nodes = [
+                "route_message",
+                "greet",
+                "generate_problem",
+                "evaluate_solution",
                 "analyze_context",
                 "retrieve_memory", 
                 "select_mode",
@@ -27,6 +31,12 @@ class GraphVisualizer:
                 G.add_node(node, label=node.replace('_', '\n').title())
             
             edges = [
+                ("route_message", "greet"),
+                ("route_message", "generate_problem"),
+                ("route_message", "evaluate_solution"),
+                ("route_message", "analyze_context"),
+                ("generate_problem", "update_memory"),
+                ("evaluate_solution", "update_memory"),
                 ("analyze_context", "retrieve_memory"),
                 ("retrieve_memory", "select_mode"),
                 ("select_mode", "generate_response"),
@@ -67,12 +77,19 @@ class GraphVisualizer:
         print("LEARNING COMPANION AGENT - DIALOG GRAPH")
         print("=" * 50)
         print("\nNODES:")
-        print("1. analyze_context   - Анализ контекста обучения")
-        print("2. retrieve_memory   - Поиск в долгосрочной памяти")
-        print("3. select_mode       - Выбор режима обучения") 
-        print("4. generate_response - Генерация адаптированного ответа")
-        print("5. update_memory     - Обновление памяти\n")
+        print("1. route_message     - Выбор ветки по сообщению (правила, без LLM)")
+        print("2. greet             - Ответ на приветствие без LLM")
+        print("3. generate_problem  - Выдача задачи")
+        print("4. evaluate_solution - Проверка решения текущей задачи")
+        print("5. analyze_context   - Анализ контекста обучения")
+        print("6. retrieve_memory   - Поиск в долгосрочной памяти")
+        print("7. select_mode       - Выбор режима обучения") 
+        print("8. generate_response - Генерация адаптированного ответа")
+        print("9. update_memory     - Обновление памяти\n")
         
         print("EDGE FLOW:")
-        print("analyze_context → retrieve_memory → select_mode → generate_response → update_memory")
+        print("route_message → greet")
+        print("route_message → generate_problem → update_memory")
+        print("route_message → evaluate_solution → update_memory")
+        print("route_message → analyze_context → retrieve_memory → select_mode → generate_response → update_memory")
         print("\n" + "=" * 50)
\ No newline at end of file
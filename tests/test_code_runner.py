@@ -0,0 +1,53 @@
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from src.agents.code_runner import CodeRunner, SandboxUnavailable
+
+KILL_SOLUTION = """
+import os
+
+def send(pid, sig):
+    try:
+        os.kill(pid, sig)
+        return "sent"
+    except PermissionError:
+        return "EPERM"
+
+def parent():
+    return send(os.getppid(), 0)
+"""
+
+@pytest.fixture
+def runner():
+    runner = CodeRunner(workers=1, user=None)
+    try:
+        runner._check_sandbox()
+    except SandboxUnavailable:
+        pytest.skip("seccomp недоступен")
+    return runner
+
+def test_solution_cannot_signal_other_processes(runner):
+    victim = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        result = runner.run_tests(KILL_SOLUTION, [
+            {"call": f"send({victim.pid}, {int(signal.SIGKILL)})", "expected": "'EPERM'"},
+            {"call": "parent()", "expected": "'EPERM'"}
+        ])
+        assert result.score == 100.0, result.to_dict()
+        assert victim.poll() is None
+    finally:
+        victim.kill()
+        victim.wait()
+
+def test_correct_and_wrong_results(runner):
+    code = "def pair(x):\n    return [x, x * x]"
+    result = runner.run_tests(code, [
+        {"call": "pair(3)", "expected": "[3, 9]"},
+        {"call": "pair(2)", "expected": "[2, 5]"},
+        {"call": "pair(2)", "expected": "(2, 4)"}
+    ])
+    assert [test["passed"] for test in result.tests] == [True, False, False]
@@ -0,0 +1,60 @@
+import pytest
+
+from src.agents.state import LearningState
+from src.graph import router
+
+ACTIVE_PROBLEM = {"problem_statement": "Напишите функцию multiply(a, b)", "difficulty": "easy"}
+
+@pytest.mark.parametrize("message", [
+    "Привет", "привет!", "Здравствуйте", "Добрый день", "Доброе утро!", "Привет, добрый вечер", "hi"
+])
+def test_greetings(message):
+    assert router.classify_message(message, LearningState()) == router.GREETING
+
+@pytest.mark.parametrize("message", [
+    "еще раз", "снова", "всем", "день", "вечер", "Добрый", "привет, объясни рекурсию подробно"
+])
+def test_not_greetings(message):
+    assert router.classify_message(message, LearningState()) == router.GENERAL
+
+@pytest.mark.parametrize("message", [
+    "Дай задачу на списки",
+    "дай мне еще одну задачу",
+    "Придумай задачку посложнее",
+    "сгенерируй задачу по теме словари",
+    "Подкинь новую задачу"
+])
+def test_problem_requests(message):
+    assert router.classify_message(message, LearningState()) == router.PROBLEM_REQUEST
+
+@pytest.mark.parametrize("message", [
+    "Давай разберем эту задачу",
+    "хочу понять задачу",
+    "дай подсказку к задаче",
+    "Не понимаю, что надо сделать в задаче"
+])
+def test_not_problem_requests(message):
+    state = LearningState(current_problem=ACTIVE_PROBLEM)
+    assert router.classify_message(message, state) == router.GENERAL
+
+@pytest.mark.parametrize("message", [
+    "Моё решение: def multiply(a, b): return a * b",
+    "def multiply(a, b):\n    return a * b",
+    "```python\ndef multiply(a, b):\n    return a * b\n```",
+    "Вот решение, но почему-то не уверен: def multiply(a, b): return a * b"
+])
+def test_solution_submissions(message):
+    state = LearningState(current_problem=ACTIVE_PROBLEM)
+    assert router.classify_message(message, state) == router.SOLUTION_SUBMISSION
+
+@pytest.mark.parametrize("message", [
+    "почему def f(x): return x не работает?",
+    "def f(x): return x - это правильно?",
+    "Объясни, зачем нужен def f(x)"
+])
+def test_code_questions_are_not_submissions(message):
+    state = LearningState(current_problem=ACTIVE_PROBLEM)
+    assert router.classify_message(message, state) == router.GENERAL
+
+def test_code_without_active_problem_is_not_submission():
+    assert router.classify_message("def f(x): return x", LearningState()) == router.GENERAL
@@ -0,0 +1,44 @@
+import time
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from src.agents.state import LearningState
+from src.config import settings
+from src.graph.learning_graph import LearningGraph
+from src.llm.invoker import ChainInvoker
+from src.llm.resilience import ResiliencePolicy
+
+class FakeMemory:
+    def retrieve_relevant_memories(self, user_id, query, n_results):
+        return []
+
+    def get_cached_learning_progress(self, user_id):
+        return {}, None
+
+    def store_interaction(self, **kwargs):
+        pass
+
+def slow_llm(prompt):
+    time.sleep(5)
+    return "Режим: explanation"
+
+def test_slow_llm_turn_finishes_within_deadline(monkeypatch):
+    monkeypatch.setattr(settings, "TURN_DEADLINE_SECONDS", 1.0)
+    monkeypatch.setattr(settings, "TURN_RESPONSE_RESERVE_SECONDS", 0.5)
+    monkeypatch.setattr(settings, "CODE_RUNNER_ENABLED", False)
+    # Настройки по умолчанию: таймаут попытки 30с, дедлайн вызова 60с, два повтора
+    policy = ResiliencePolicy("llm", timeout=30.0, deadline=60.0, max_retries=2, max_attempts=8)
+    graph = LearningGraph(FakeMemory(), RunnableLambda(slow_llm), invoker=ChainInvoker(resilience=policy))
+
+    started = time.monotonic()
+    state = graph.process(LearningState(messages=[HumanMessage(content="Объясни, как работает рекурсия")]))
+    elapsed = time.monotonic() - started
+    graph.shutdown()
+
+    assert elapsed < 1.5
+    assert state.current_response == LearningGraph.DEADLINE_RESPONSE
+    stats = policy.stats()
+    assert stats["retries"] == 0
+    assert stats["turn_deadline_exceeded"] >= 1
+    assert stats["breaker_state"] == "closed"